@@ -0,0 +1,131 @@
+"""
+Cost of writing the persistence, by how much of the data changed.
+
+An application holds the user_data of --users users. Each run touches
+--touched of them, as that many updates would, and changes --changed of
+those, then the application's update_persistence() is timed, as it runs
+every PERSISTENCE_INTERVAL seconds. The same runs are timed with
+src.persistence.DatabasePersistence and with python-telegram-bot's
+PicklePersistence, which rewrites its whole file on every change.
+
+    python -m benchmarks.bench_persistence
+    python -m benchmarks.bench_persistence --users 100000 --changed 0 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import random
+import shutil
+import statistics
+import tempfile
+import time
+
+BOT_TOKEN = "123:persistence"
+
+
+def user_data(users):
+    """Some user_data for each of the users."""
+    return {user_id: {"games_today": user_id % 7} for user_id in range(users)}
+
+
+def seed_database(users):
+    """Store the users' user_data as DatabasePersistence would."""
+    from sqlalchemy import delete, insert
+
+    from src.db import SessionLocal
+    from src.models import PersistedData
+
+    with SessionLocal() as session:
+        session.execute(delete(PersistedData))
+        session.execute(insert(PersistedData), [
+            {"kind": "user", "name": "", "key": str(user_id),
+             "data": pickle.dumps(data, pickle.HIGHEST_PROTOCOL)}
+            for user_id, data in user_data(users).items()
+        ])
+        session.commit()
+
+
+def seed_pickle(path, users):
+    """Store the users' user_data as PicklePersistence would."""
+    with open(path, "wb") as file:
+        pickle.dump({"user_data": user_data(users), "chat_data": {},
+                     "bot_data": {}, "conversations": {},
+                     "callback_data": None}, file, pickle.HIGHEST_PROTOCOL)
+
+
+async def run(persistence, args, changed):
+    """Seconds of each update_persistence() run."""
+    from telegram.ext import ApplicationBuilder
+
+    from benchmarks.fakes import FakeRequest
+
+    app = (ApplicationBuilder().token(BOT_TOKEN).request(FakeRequest())
+           .persistence(persistence).build())
+    rng = random.Random(args.seed)
+    samples = []
+    async with app:
+        for _ in range(args.repeat):
+            touched = rng.sample(range(args.users), args.touched)
+            for user_id in touched[:changed]:
+                app.user_data[user_id]["games_today"] += 1
+            app.mark_data_for_update_persistence(user_ids=touched)
+            start = time.perf_counter()
+            await app.update_persistence()
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def main(args, work_dir):
+    from telegram.ext import PicklePersistence
+
+    from src.db import async_engine
+    from src.persistence import DatabasePersistence
+
+    try:
+        for changed in args.changed:
+            pickle_path = os.path.join(work_dir, "persistence.pickle")
+            seed_database(args.users)
+            seed_pickle(pickle_path, args.users)
+            for name, persistence in (
+                ("database", DatabasePersistence()),
+                ("pickle", PicklePersistence(pickle_path)),
+            ):
+                samples = await run(persistence, args, changed)
+                print(json.dumps({
+                    "persistence": name,
+                    "users": args.users,
+                    "touched": args.touched,
+                    "changed": changed,
+                    "p50_ms": round(statistics.median(samples) * 1000, 3),
+                    "max_ms": round(max(samples) * 1000, 3),
+                }))
+    finally:
+        await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--users", type=int, default=10000,
+                        help="Users with user_data")
+    parser.add_argument("--touched", type=int, default=100,
+                        help="Users with an update in each run")
+    parser.add_argument("--changed", type=int, nargs="+", default=[0, 1, 10],
+                        help="Touched users whose data changed")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="game_bot_persistence_")
+    try:
+        # src.config reads the environment when first imported
+        os.environ["DATABASE_URL"] = (
+            f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}")
+        os.environ.setdefault("BOT_TOKEN", BOT_TOKEN)
+        from benchmarks import synthetic
+
+        synthetic.reset_database()
+        asyncio.run(main(args, work_dir))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,155 @@
+"""
+Cost of the Elo ratings: the batch recompute and the incremental paths.
+
+A throwaway database gets one chat with --games games between
+--players players (benchmarks.synthetic), and the benchmark times:
+
+- rebuild: src.ratings.rebuild_ratings of the chat, every game rated
+  again from the games table, in games per second
+- played: record_games of one game, which rates it from the stored
+  ratings
+- delete_latest: soft_delete_game of the chat's newest game, which
+  replays the games since the last checkpoint
+- delete_first: soft_delete_game of the chat's oldest game, which
+  replays the whole chat
+
+Each result is printed as a JSON line.
+
+    python -m benchmarks.bench_ratings
+    python -m benchmarks.bench_ratings --games 100000 --repeat 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date
+
+BOT_TOKEN = "123:ratings"
+CHAT = 0
+
+
+def summarize(name, samples, **info):
+    return {
+        "benchmark": name,
+        "repeat": len(samples),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        **info,
+    }
+
+
+def time_rebuild(args, chat_id):
+    from src.db import SessionLocal
+    from src.ratings import rebuild_ratings
+
+    samples = []
+    for _ in range(args.rebuilds):
+        with SessionLocal() as session:
+            start = time.perf_counter()
+            rebuild_ratings(session, chat_id)
+            samples.append(time.perf_counter() - start)
+    result = summarize("rebuild", samples, games=args.games)
+    result["games_per_second"] = round(
+        args.games / statistics.median(samples))
+    return result
+
+
+async def time_incremental(args, chat_id):
+    from sqlalchemy import func, select
+
+    from src.db import AsyncSessionLocal, async_engine
+    from src.functions import record_games, soft_delete_game
+    from src.models import Game
+
+    async def live_game(newest):
+        order = func.max if newest else func.min
+        async with AsyncSessionLocal() as session:
+            return await session.scalar(
+                select(order(Game.id)).where(
+                    Game.chat_id == chat_id, Game.deleted_at.is_(None)))
+
+    async def timed(operation):
+        async with AsyncSessionLocal() as session:
+            start = time.perf_counter()
+            await operation(session)
+            await session.commit()
+            return time.perf_counter() - start
+
+    results = []
+    try:
+        async with AsyncSessionLocal() as session:
+            players = (await session.execute(
+                select(Game.winner_id, Game.loser_id)
+                .where(Game.chat_id == chat_id).limit(1))).one()
+
+        samples = [
+            await timed(lambda session: record_games(
+                session, chat_id, date.today(), [tuple(players)]))
+            for _ in range(args.repeat)
+        ]
+        results.append(summarize("played", samples, games=args.games))
+
+        for name, newest, repeat in (("delete_latest", True, args.repeat),
+                                     ("delete_first", False, 1)):
+            samples = []
+            for _ in range(repeat):
+                game_id = await live_game(newest)
+                samples.append(await timed(
+                    lambda session: soft_delete_game(
+                        session, game_id, chat_id)))
+            results.append(summarize(name, samples, games=args.games))
+    finally:
+        await async_engine.dispose()
+    return results
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="game_bot_ratings_")
+    try:
+        # src.config reads the environment when first imported
+        os.environ["DATABASE_URL"] = (
+            f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}")
+        os.environ.setdefault("BOT_TOKEN", BOT_TOKEN)
+
+        from benchmarks import synthetic
+        from src.db import SessionLocal, engine
+
+        synthetic.reset_database()
+        start = time.perf_counter()
+        with SessionLocal() as session:
+            synthetic.populate(session, args.games, 1, args.players,
+                               args.days, seed=args.seed, deleted_ratio=0)
+        engine.dispose()
+        print(json.dumps({
+            "populated": args.games,
+            "seconds": round(time.perf_counter() - start, 1),
+        }), file=sys.stderr)
+
+        chat_id = synthetic.chat_id(CHAT)
+        print(json.dumps(time_rebuild(args, chat_id)))
+        for result in asyncio.run(time_incremental(args, chat_id)):
+            print(json.dumps(result))
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--games", type=int, default=1_000_000,
+                        help="Games of the chat")
+    parser.add_argument("--players", type=int, default=20,
+                        help="Players of the chat")
+    parser.add_argument("--days", type=int, default=365,
+                        help="Days the games are spread over")
+    parser.add_argument("--rebuilds", type=int, default=3,
+                        help="Full recomputes to take the median of")
+    parser.add_argument("--repeat", type=int, default=20,
+                        help="Games recorded and deleted")
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,116 @@
+"""
+Throughput of the multi-process mode (src/sharding.py) by worker count.
+
+Updates spread over many chats are routed by ShardDispatcher to worker
+processes, each running an application whose only handler burns
+--handler-cpu seconds of CPU, standing in for handler work that holds
+the GIL. Telegram is faked with benchmarks.fakes.FakeRequest. For each
+worker count the benchmark reports updates per second, the speedup over
+the first worker count, and whether every chat's updates were handled in
+the order they were sent.
+
+Scaling is bounded by the CPU cores available (reported as "cpus").
+
+    python -m benchmarks.bench_sharding --workers 1 2 4
+"""
+import argparse
+import functools
+import json
+import multiprocessing
+import os
+import time
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from benchmarks.fakes import FakeRequest
+from src.sharding import ShardDispatcher
+from src.update_processor import ChatOrderedUpdateProcessor
+
+
+def make_app(results, handler_cpu):
+    """Application of a benchmark worker; reports handled updates."""
+
+    async def handle(update, context):
+        deadline = time.perf_counter() + handler_cpu
+        while time.perf_counter() < deadline:
+            pass
+        results.put(
+            (update.effective_chat.id, int(update.effective_message.text)))
+
+    app = (
+        ApplicationBuilder()
+        .token("123:bench")
+        .request(FakeRequest())
+        .get_updates_request(FakeRequest())
+        .updater(None)
+        .concurrent_updates(ChatOrderedUpdateProcessor(64))
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, handle))
+    return app
+
+
+def make_updates(chats, updates_per_chat):
+    """Updates interleaved across chats, the way they'd arrive."""
+    now = datetime.now(timezone.utc)
+    updates = []
+    for seq in range(updates_per_chat):
+        for chat_id in range(1, chats + 1):
+            chat = Chat(id=-chat_id, type=Chat.GROUP)
+            message = Message(
+                message_id=seq, date=now, chat=chat, text=str(seq))
+            updates.append(Update(update_id=len(updates), message=message))
+    return updates
+
+
+def run(workers, updates, handler_cpu):
+    results = multiprocessing.get_context("spawn").Queue()
+    dispatcher = ShardDispatcher(
+        workers, functools.partial(make_app, results, handler_cpu))
+    dispatcher.start()
+    try:
+        start = time.perf_counter()
+        for update in updates:
+            dispatcher.route(update)
+        finished = {}
+        for _ in updates:
+            chat_id, seq = results.get()
+            finished.setdefault(chat_id, []).append(seq)
+        elapsed = time.perf_counter() - start
+    finally:
+        dispatcher.stop()
+    in_order = all(seqs == sorted(seqs) for seqs in finished.values())
+    return elapsed, in_order
+
+
+def main(args):
+    updates = make_updates(args.chats, args.updates_per_chat)
+    results = []
+    for workers in args.workers:
+        elapsed, in_order = run(workers, updates, args.handler_cpu)
+        throughput = len(updates) / elapsed
+        results.append({
+            "workers": workers,
+            "cpus": os.cpu_count(),
+            "updates": len(updates),
+            "seconds": round(elapsed, 4),
+            "updates_per_second": round(throughput, 1),
+            "speedup": round(
+                throughput / results[0]["updates_per_second"], 2
+            ) if results else 1.0,
+            "per_chat_order_kept": in_order,
+        })
+        print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--updates-per-chat", type=int, default=20)
+    parser.add_argument("--handler-cpu", type=float, default=0.002,
+                        help="Seconds of CPU each simulated handler uses")
+    main(parser.parse_args())
@@ -0,0 +1,143 @@
+"""
+Cold start time of the bot, and where it goes.
+
+Each run is a fresh interpreter that imports src.bot and builds the
+application with app_factory(), as run.py does before it connects to
+Telegram. The medians over --runs are printed as a JSON line:
+
+- import_ms: importing src.bot, with everything it pulls in
+- build_ms: app_factory()
+- process_ms: the whole interpreter, from spawning it until it exits
+
+--profile N also prints the N modules and top-level packages that took
+longest to import, from python -X importtime. The run exits with 1 if
+the median import_ms + build_ms exceeds --budget SECONDS, STARTUP_BUDGET
+unless given, so CI fails on a startup time regression.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --profile 20
+    python -m benchmarks.bench_startup --runs 10 --budget 2
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BOT_TOKEN = "123:startup"
+# Seconds the median import_ms + build_ms may take
+STARTUP_BUDGET = 1.5
+
+# Run by each fresh interpreter
+MEASURE = """\
+import json, time
+start = time.perf_counter()
+from src.bot import app_factory
+imported = time.perf_counter()
+app_factory()
+built = time.perf_counter()
+print(json.dumps({"import": imported - start, "build": built - imported}))
+"""
+
+
+def child_environment(work_dir):
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["DATABASE_URL"] = (
+        f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}")
+    env.setdefault("BOT_TOKEN", BOT_TOKEN)
+    env["LOG_FILE"] = os.path.join(work_dir, "logs.log")
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [root, env.get("PYTHONPATH")]))
+    return env
+
+
+def measure(env):
+    """Seconds of one cold start: (import, build, process)."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", MEASURE], env=env, capture_output=True,
+        text=True, check=True)
+    process = time.perf_counter() - start
+    times = json.loads(result.stdout.splitlines()[-1])
+    return times["import"], times["build"], process
+
+
+def import_profile(env, top):
+    """
+    The modules and top-level packages that took longest to import.
+
+    Modules are ranked by their cumulative time, which includes the
+    modules they import first; packages by the sum of their modules'
+    own time, so nothing is counted twice.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import src.bot"],
+        env=env, capture_output=True, text=True, check=True)
+    modules = []
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        name = name.strip()
+        modules.append((int(cumulative), name))
+        package = name.split(".")[0]
+        packages[package] = packages.get(package, 0) + int(own)
+    modules.sort(reverse=True)
+    return {
+        "modules": [
+            {"module": name, "cumulative_ms": round(us / 1000, 1)}
+            for us, name in modules[:top]
+        ],
+        "packages": [
+            {"package": name, "self_ms": round(us / 1000, 1)}
+            for name, us in sorted(
+                packages.items(), key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="game_bot_startup_")
+    try:
+        env = child_environment(work_dir)
+        # Compiles the bytecode, so the runs measure a deployed bot's start
+        measure(env)
+        samples = [measure(env) for _ in range(args.runs)]
+        imports, builds, processes = zip(*samples)
+        result = {
+            "runs": args.runs,
+            "import_ms": round(statistics.median(imports) * 1000, 1),
+            "build_ms": round(statistics.median(builds) * 1000, 1),
+            "process_ms": round(statistics.median(processes) * 1000, 1),
+        }
+        startup = statistics.median(
+            imported + built for imported, built, _ in samples)
+        result["budget_ms"] = round(args.budget * 1000, 1)
+        result["within_budget"] = startup <= args.budget
+        print(json.dumps(result))
+
+        if args.profile:
+            print(json.dumps(import_profile(env, args.profile)))
+        if startup > args.budget:
+            return 1
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5,
+                        help="Cold starts to take the medians of")
+    parser.add_argument("--profile", type=int, default=0, metavar="N",
+                        help="Also print the N slowest imports")
+    parser.add_argument("--budget", type=float, default=STARTUP_BUDGET,
+                        help="Exit with 1 if importing and building the "
+                             "application takes longer, in seconds")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,305 @@
+"""
+Latency of the ranking, history and game recording paths by database size.
+
+For each --games scale, a throwaway database is filled with synthetic
+chats, players and games (benchmarks.synthetic), and the benchmark times:
+
+- calculate_ranking, all-time, for the chat's busiest day and for the
+  last 365 days, of one chat
+- generate_rankings_text of those rankings
+- generate_games_history_message: the first page of the chat's games on
+  its busiest day
+- /played end to end: a faked Telegram Update through the application
+  from src.bot.app_factory, recording two games, with the Bot API faked
+  by benchmarks.fakes.FakeRequest
+
+Each result is printed as a JSON line. --output also writes them with
+the run's environment to a file, and --baseline compares the run with
+such a file, exiting with 1 if a median got slower than --tolerance.
+
+    python -m benchmarks.bench_suite --output before.json
+    python -m benchmarks.bench_suite --baseline before.json
+    python -m benchmarks.bench_suite --games 1000 100000 10000000
+
+Filling SQLite takes about a minute per million games, so 10M is
+opt-in. --url uses another database, e.g. PostgreSQL, whose tables are
+dropped and recreated per scale, so only point it at a scratch one.
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+
+BOT_TOKEN = "123:bench"
+# The chat every benchmark reads and writes
+CHAT = 0
+
+
+def summarize(name, games, samples, **info):
+    """Result line of a benchmark from its samples, in seconds."""
+    ordered = sorted(samples)
+    return {
+        "benchmark": name,
+        "games": games,
+        "repeat": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(statistics.median(samples) * 1000, 3),
+        "p95_ms": round(
+            ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))] * 1000,
+            3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        **info,
+    }
+
+
+async def timed(call, repeat):
+    """Run call repeat times after a warm-up run; returns the samples."""
+    samples = []
+    for run in range(repeat + 1):
+        start = time.perf_counter()
+        result = call()
+        if inspect.isawaitable(result):
+            await result
+        if run:
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def played_update(bot, update_id, players_per_chat):
+    """A /played of two games in the benchmark chat, as Telegram sends it."""
+    from telegram import Update
+
+    from benchmarks import synthetic
+
+    mentions = [
+        "@" + synthetic.username(CHAT, (update_id + i) % players_per_chat)
+        for i in range(4)
+    ]
+    text = f"/played {mentions[0]} {mentions[1]}\n{mentions[2]} {mentions[3]}"
+    entities = [{"type": "bot_command", "offset": 0, "length": 7}]
+    offset = 8
+    for mention in mentions:
+        entities.append(
+            {"type": "mention", "offset": offset, "length": len(mention)})
+        offset += len(mention) + 1
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(datetime.now(timezone.utc).timestamp()),
+            "chat": {"id": synthetic.chat_id(CHAT), "type": "supergroup",
+                     "title": "Benchmark"},
+            "from": {"id": synthetic.TELEGRAM_ID_BASE, "is_bot": False,
+                     "first_name": "Player"},
+            "text": text,
+            "entities": entities,
+        },
+    }, bot)
+
+
+async def busiest_date(session, chat_id):
+    """The date the chat has the most live games on, the latest if tied."""
+    from sqlalchemy import func, select
+
+    from src.models import Game
+
+    count = func.count()
+    return await session.scalar(
+        select(Game.date).where(
+            Game.chat_id == chat_id, Game.deleted_at.is_(None)
+        ).group_by(Game.date).order_by(count.desc(), Game.date.desc())
+        .limit(1))
+
+
+async def run_scale(games, args):
+    from benchmarks import synthetic
+    from benchmarks.fakes import FakeRequest
+    from src.bot import app_factory
+    from src.db import AsyncSessionLocal, async_engine
+    from src.functions import (calculate_ranking,
+                               generate_games_history_message,
+                               generate_rankings_text)
+
+    chat_id = synthetic.chat_id(CHAT)
+    today = date.today()
+    results = []
+    try:
+        async with AsyncSessionLocal() as session:
+            # Synthetic games are spread over many days, so today may have
+            # none; time the day with the most rows instead
+            busy_date = await busiest_date(session, chat_id)
+            assert busy_date is not None, f"No games in chat {chat_id}"
+            year_ago = today - timedelta(days=364)
+            for name, game_date, end_date in (
+                ("calculate_ranking", None, None),
+                ("calculate_ranking_date", busy_date, None),
+                ("calculate_ranking_year", year_ago, today),
+            ):
+                samples = await timed(
+                    lambda: calculate_ranking(
+                        session, chat_id, game_date, end_date),
+                    args.repeat)
+                rankings = await calculate_ranking(
+                    session, chat_id, game_date, end_date)
+                assert rankings, (name, game_date, end_date)
+                results.append(summarize(
+                    name, games, samples, rows=len(rankings)))
+
+            rankings = await calculate_ranking(session, chat_id)
+            samples = await timed(
+                lambda: generate_rankings_text(rankings), args.repeat)
+            results.append(summarize(
+                "generate_rankings_text", games, samples, rows=len(rankings)))
+
+            samples = await timed(
+                lambda: generate_games_history_message(
+                    session, chat_id, game_date=busy_date),
+                args.repeat)
+            message, _ = await generate_games_history_message(
+                session, chat_id, game_date=busy_date)
+            assert message, busy_date
+            results.append(summarize(
+                "generate_games_history_message", games, samples,
+                rows=message.count("Game ID")))
+
+        request = FakeRequest()
+        app = app_factory(BOT_TOKEN, request=request)
+        async with app:
+            update_ids = iter(range(1, 2 * args.repeat + 2))
+            samples = await timed(
+                lambda: app.process_update(played_update(
+                    app.bot, next(update_ids), args.players_per_chat)),
+                args.repeat)
+        # Every /played must have been answered with the recorded games
+        replies = request.calls.get("sendMessage", 0)
+        assert replies == args.repeat + 1, request.calls
+        results.append(summarize("played", games, samples))
+    finally:
+        await async_engine.dispose()
+    return results
+
+
+def environment(args):
+    import sqlalchemy
+    import telegram
+
+    from src.db import engine
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlalchemy": sqlalchemy.__version__,
+        "python_telegram_bot": telegram.__version__,
+        "database": engine.dialect.name,
+        "chats": args.chats,
+        "players_per_chat": args.players_per_chat,
+        "days": args.days,
+        "repeat": args.repeat,
+    }
+
+
+def compare(results, baseline_path, tolerance):
+    """Results whose median is more than tolerance slower than baseline's."""
+    with open(baseline_path) as baseline_file:
+        baseline = {
+            (result["benchmark"], result["games"]): result
+            for result in json.load(baseline_file)["results"]
+        }
+    regressions = []
+    for result in results:
+        before = baseline.get((result["benchmark"], result["games"]))
+        if before and result["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append({
+                "regression": result["benchmark"],
+                "games": result["games"],
+                "p50_ms": result["p50_ms"],
+                "baseline_p50_ms": before["p50_ms"],
+            })
+    return regressions
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="game_bot_bench_")
+    try:
+        # src.config reads the environment when first imported
+        os.environ["DATABASE_URL"] = args.url or (
+            f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}")
+        # src.bot refuses to load without a token
+        os.environ.setdefault("BOT_TOKEN", BOT_TOKEN)
+        # Telegram is faked, so don't pace the replies to its limits
+        os.environ["RATE_LIMIT_GLOBAL_PER_SECOND"] = "1e9"
+        os.environ["RATE_LIMIT_GROUP_PER_MINUTE"] = "1e9"
+        os.environ["RATE_LIMIT_BURST"] = "1000000"
+
+        from benchmarks import synthetic
+        from src.cache import ranking_cache
+        from src.db import SessionLocal, engine
+
+        results = []
+        for games in args.games:
+            synthetic.reset_database()
+            ranking_cache.clear()
+            start = time.perf_counter()
+            with SessionLocal() as session:
+                synthetic.populate(
+                    session, games, args.chats, args.players_per_chat,
+                    args.days, seed=args.seed)
+            engine.dispose()
+            print(json.dumps({
+                "populated": games,
+                "seconds": round(time.perf_counter() - start, 1),
+            }), file=sys.stderr)
+
+            for result in asyncio.run(run_scale(games, args)):
+                results.append(result)
+                print(json.dumps(result))
+
+        if args.output:
+            with open(args.output, "w") as output:
+                json.dump({"environment": environment(args),
+                           "results": results}, output, indent=2)
+        if args.baseline:
+            regressions = compare(results, args.baseline, args.tolerance)
+            for regression in regressions:
+                print(json.dumps(regression))
+            return 1 if regressions else 0
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--games", type=int, nargs="+",
+                        default=[1000, 100000],
+                        help="Database sizes to benchmark, in games")
+    parser.add_argument("--chats", type=int, default=100)
+    parser.add_argument("--players-per-chat", type=int, default=20)
+    parser.add_argument("--days", type=int, default=365,
+                        help="Days the games are spread over")
+    parser.add_argument("--repeat", type=int, default=50,
+                        help="Timed runs per benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Use this (scratch) database")
+    parser.add_argument("--output", help="Write the results to this file")
+    parser.add_argument("--baseline",
+                        help="Compare with the --output of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Slowdown of a median reported as regression")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,139 @@
+"""
+Throughput of ChatOrderedUpdateProcessor across simulated chats.
+
+Each simulated update awaits a random delay around --handler-latency,
+standing in for the database and Telegram round trips of a real handler.
+The benchmark feeds the same updates through a serial processor and
+through ChatOrderedUpdateProcessor, reports updates per second for each
+chat count, and checks that every chat's updates finished in the order
+they were sent.
+
+A last run loads the chats unevenly: --hot-updates updates of one busy
+chat arrive first, then one update from each of --quiet-chats other
+chats. It reports how long the quiet chats' updates took, which should
+stay near --handler-latency however long the busy chat's queue is.
+
+    python -m benchmarks.bench_update_processor --chats 1 10 100
+    python -m benchmarks.bench_update_processor --hot-updates 500
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from telegram import Chat, Message, Update
+from telegram.ext import SimpleUpdateProcessor
+
+from src.update_processor import ChatOrderedUpdateProcessor
+
+
+def make_update(updates, chat_id, seq):
+    """Append an update of the chat with text seq to updates."""
+    chat = Chat(id=-chat_id, type=Chat.GROUP)
+    message = Message(message_id=seq, date=None, chat=chat, text=str(seq))
+    updates.append(Update(update_id=len(updates), message=message))
+
+
+def make_updates(chats, updates_per_chat):
+    """Updates interleaved across chats, the way they'd arrive."""
+    updates = []
+    for seq in range(updates_per_chat):
+        for chat_id in range(1, chats + 1):
+            make_update(updates, chat_id, seq)
+    return updates
+
+
+def make_uneven_updates(hot_updates, quiet_chats):
+    """A busy chat's updates, then one update of each quiet chat."""
+    updates = []
+    for seq in range(hot_updates):
+        make_update(updates, 1, seq)
+    for chat_id in range(2, quiet_chats + 2):
+        make_update(updates, chat_id, 0)
+    return updates
+
+
+async def run(processor, updates, handler_latency, latencies=None):
+    finished = {}
+
+    rng = random.Random(0)
+    delays = [rng.uniform(0, 2 * handler_latency) for _ in updates]
+
+    async def handle(update):
+        await asyncio.sleep(delays[update.update_id])
+        finished.setdefault(update.effective_chat.id, []).append(
+            int(update.effective_message.text))
+        if latencies is not None:
+            latencies[update.update_id] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    async with processor:
+        # Like Application, start a task per update in arrival order
+        await asyncio.gather(*(
+            asyncio.create_task(processor.process_update(update, handle(update)))
+            for update in updates
+        ))
+    elapsed = time.perf_counter() - start
+
+    in_order = all(seqs == sorted(seqs) for seqs in finished.values())
+    return elapsed, in_order
+
+
+async def main(args):
+    results = []
+    for chats in args.chats:
+        updates = make_updates(chats, args.updates_per_chat)
+        for name, processor in (
+            ("serial", SimpleUpdateProcessor(1)),
+            ("chat_ordered",
+             ChatOrderedUpdateProcessor(args.max_concurrent_updates)),
+        ):
+            elapsed, in_order = await run(
+                processor, updates, args.handler_latency)
+            results.append({
+                "processor": name,
+                "chats": chats,
+                "updates": len(updates),
+                "seconds": round(elapsed, 4),
+                "updates_per_second": round(len(updates) / elapsed, 1),
+                "per_chat_order_kept": in_order,
+            })
+            print(json.dumps(results[-1]))
+
+    # One busy chat must not hold up the others
+    updates = make_uneven_updates(args.hot_updates, args.quiet_chats)
+    latencies = {}
+    elapsed, in_order = await run(
+        ChatOrderedUpdateProcessor(args.max_concurrent_updates), updates,
+        args.handler_latency, latencies)
+    quiet = [latencies[update.update_id] for update in updates
+             if update.effective_chat.id != -1]
+    results.append({
+        "processor": "chat_ordered",
+        "load": "uneven",
+        "hot_updates": args.hot_updates,
+        "quiet_chats": args.quiet_chats,
+        "seconds": round(elapsed, 4),
+        "quiet_p50_ms": round(statistics.median(quiet) * 1000, 1),
+        "quiet_max_ms": round(max(quiet) * 1000, 1),
+        "per_chat_order_kept": in_order,
+    })
+    print(json.dumps(results[-1]))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chats", type=int, nargs="+",
+                        default=[1, 10, 50, 200])
+    parser.add_argument("--updates-per-chat", type=int, default=20)
+    parser.add_argument("--handler-latency", type=float, default=0.005,
+                        help="Seconds each simulated handler takes")
+    parser.add_argument("--max-concurrent-updates", type=int, default=64)
+    parser.add_argument("--hot-updates", type=int, default=200,
+                        help="Updates of the busy chat in the uneven run")
+    parser.add_argument("--quiet-chats", type=int, default=20,
+                        help="Chats with one update each in the uneven run")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,71 @@
+"""
+Stand-ins for Telegram, shared by the benchmarks and
+scripts/fake_telegram.py.
+"""
+import asyncio
+import itertools
+import json
+import time
+
+from telegram.request import BaseRequest
+
+BOT_USER = {
+    "id": 1, "is_bot": True, "first_name": "Game Bot", "username": "game_bot",
+}
+
+
+def api_result(method, params, message_ids):
+    """
+    Result of a Bot API call.
+
+    getMe returns BOT_USER, sendMessage and editMessageText return the
+    message they were asked to send, anything else returns True.
+
+    Args:
+        method: Bot API method, e.g. "sendMessage"
+        params: Parameters of the call; form-encoded values are strings
+        message_ids: Iterator of the IDs to give the sent messages
+    """
+    if method == "getMe":
+        return BOT_USER
+    if method in ("sendMessage", "editMessageText"):
+        return {
+            "message_id": next(message_ids),
+            "date": int(time.time()),
+            "chat": {"id": int(params.get("chat_id") or 0), "type": "group"},
+            "text": params.get("text", ""),
+        }
+    return True
+
+
+class FakeRequest(BaseRequest):
+    """
+    Answers every Bot API call locally, without any network, with
+    api_result. Calls are counted per method in ``calls``.
+
+    Args:
+        latency: Seconds every call takes, standing in for the round trip
+            to Telegram
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = {}
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None,
+                         read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        params = request_data.parameters if request_data else {}
+        result = api_result(endpoint, params, self._message_ids)
+        return 200, json.dumps({"ok": True, "result": result}).encode()
@@ -0,0 +1,328 @@
+"""
+Offline load test of the whole bot.
+
+Builds the application from src.bot.app_factory with the Bot API faked
+by benchmarks.fakes.FakeRequest, on a throwaway database of synthetic
+games (benchmarks.synthetic), and feeds it a mix of updates across many
+chats: /played, /rank, /games, menu and rankings buttons, and delete
+buttons. Updates go through the application's update processor like
+polled ones, arriving at --rate per second (all at once by default).
+Each is timed from when it was due to arrive until its handlers are
+done, so a backlog shows up in the latencies.
+
+Prints one JSON object with the throughput, latency percentiles overall
+and per kind of update, handler errors and the Bot API calls made.
+
+    python -m benchmarks.load_test --updates 5000 --chats 500
+    python -m benchmarks.load_test --rate 200 --api-latency 0.05
+    python -m benchmarks.load_test --mix played=5 rank=3 delete=1
+
+Telegram's flood limits are lifted unless --flood-limits is given, as
+they would otherwise bound the throughput rather than the hardware.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+BOT_TOKEN = "123:load"
+KINDS = ("played", "rank", "games", "menu", "delete")
+MENU_BUTTONS = ("menu_rankings", "rank_today", "rank_all_time", "menu_back")
+# Games per chat that delete buttons can be pressed for
+DELETABLE_GAMES_PER_CHAT = 50
+
+
+def parse_mix(items):
+    """{"played": 3, ...} from ["played=3", ...]."""
+    mix = {}
+    for item in items:
+        kind, _, weight = item.partition("=")
+        if kind not in KINDS or not weight:
+            raise ValueError(
+                f"Expected KIND=WEIGHT with KIND one of {', '.join(KINDS)}, "
+                f"got {item!r}")
+        mix[kind] = float(weight)
+    return mix
+
+
+class UpdateFactory:
+    """Telegram updates of the synthetic chats, as Telegram would send them."""
+
+    def __init__(self, bot, chats, players_per_chat, game_ids, seed):
+        self.bot = bot
+        self.chats = chats
+        self.players_per_chat = players_per_chat
+        # chat -> IDs of games not deleted yet
+        self.game_ids = game_ids
+        self.rng = random.Random(seed)
+        self._update_ids = itertools.count(1)
+
+    def _user(self, chat, player):
+        from benchmarks import synthetic
+
+        return {
+            "id": (synthetic.TELEGRAM_ID_BASE
+                   + chat * self.players_per_chat + player),
+            "is_bot": False,
+            "first_name": f"Player {chat}-{player}",
+            "username": synthetic.username(chat, player),
+        }
+
+    def _chat(self, chat):
+        from benchmarks import synthetic
+
+        return {"id": synthetic.chat_id(chat), "type": "supergroup",
+                "title": f"Chat {chat}"}
+
+    def _message(self, chat, player, text, entities):
+        from telegram import Update
+
+        update_id = next(self._update_ids)
+        return Update.de_json({
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(datetime.now(timezone.utc).timestamp()),
+                "chat": self._chat(chat),
+                "from": self._user(chat, player),
+                "text": text,
+                "entities": entities,
+            },
+        }, self.bot)
+
+    def _callback(self, chat, player, data, text, reply_markup=None):
+        from telegram import Update
+
+        update_id = next(self._update_ids)
+        message = {
+            "message_id": update_id,
+            "date": int(datetime.now(timezone.utc).timestamp()),
+            "chat": self._chat(chat),
+            "text": text,
+        }
+        if reply_markup:
+            message["reply_markup"] = reply_markup
+        return Update.de_json({
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(chat, player),
+                "chat_instance": str(chat),
+                "data": data,
+                "message": message,
+            },
+        }, self.bot)
+
+    def _command(self, chat, player, command):
+        return self._message(chat, player, command, [
+            {"type": "bot_command", "offset": 0, "length": len(command)}])
+
+    def played(self, chat, player):
+        from benchmarks import synthetic
+
+        players = self.rng.sample(range(self.players_per_chat), 4)
+        mentions = ["@" + synthetic.username(chat, p) for p in players]
+        text = (f"/played {mentions[0]} {mentions[1]}\n"
+                f"{mentions[2]} {mentions[3]}")
+        entities = [{"type": "bot_command", "offset": 0, "length": 7}]
+        offset = 8
+        for mention in mentions:
+            entities.append(
+                {"type": "mention", "offset": offset, "length": len(mention)})
+            offset += len(mention) + 1
+        return self._message(chat, player, text, entities)
+
+    def make(self, kind):
+        """
+        A random update of the given kind.
+
+        Returns:
+            (kind, update); the kind is "played" instead of "delete" once
+            the chat has no game left to delete
+        """
+        chat = self.rng.randrange(self.chats)
+        player = self.rng.randrange(self.players_per_chat)
+        if kind == "delete" and not self.game_ids.get(chat):
+            kind = "played"
+        if kind == "played":
+            return kind, self.played(chat, player)
+        if kind == "rank":
+            return kind, self._command(chat, player, "/rank")
+        if kind == "games":
+            return kind, self._command(chat, player, "/games")
+        if kind == "menu":
+            return kind, self._callback(
+                chat, player, self.rng.choice(MENU_BUTTONS), "Menu")
+        game_id = self.game_ids[chat].pop()
+        button = {"text": "Delete", "callback_data": f"delete_game_{game_id}"}
+        return kind, self._callback(
+            chat, player, button["callback_data"],
+            f"1. Game ID {game_id}: Player won Player",
+            {"inline_keyboard": [[button]]})
+
+
+def deletable_games(chats):
+    """chat -> the IDs of its newest games that aren't deleted."""
+    from sqlalchemy import select
+
+    from benchmarks import synthetic
+    from src.db import SessionLocal
+    from src.models import Game
+
+    chat_by_id = {synthetic.chat_id(chat): chat for chat in range(chats)}
+    game_ids = {}
+    with SessionLocal() as session:
+        rows = session.execute(
+            select(Game.chat_id, Game.id)
+            .where(Game.deleted_at.is_(None))
+            .order_by(Game.id.desc()))
+        for chat_id, game_id in rows:
+            ids = game_ids.setdefault(chat_by_id[chat_id], [])
+            if len(ids) < DELETABLE_GAMES_PER_CHAT:
+                ids.append(game_id)
+    return game_ids
+
+
+def percentiles(samples):
+    ordered = sorted(samples)
+
+    def at(q):
+        return round(
+            ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50_ms": at(0.5), "p90_ms": at(0.9), "p99_ms": at(0.99),
+            "max_ms": round(ordered[-1] * 1000, 3)}
+
+
+async def run(args, game_ids):
+    from benchmarks.fakes import FakeRequest
+    from src.bot import app_factory
+    from src.db import async_engine
+    from src.metrics import metrics
+
+    kinds, weights = zip(*args.mix.items())
+    request = FakeRequest(latency=args.api_latency)
+    app = app_factory(BOT_TOKEN, concurrent_updates=args.concurrent_updates,
+                      request=request)
+    latencies = {kind: [] for kind in KINDS}
+
+    async def handle(kind, update, arrival):
+        # What Application does with each fetched update
+        await app.update_processor.process_update(
+            update, app.process_update(update))
+        latencies[kind].append(time.perf_counter() - arrival)
+
+    try:
+        async with app:
+            factory = UpdateFactory(
+                app.bot, args.chats, args.players_per_chat, game_ids,
+                args.seed)
+            rng = random.Random(args.seed)
+            updates = [
+                factory.make(kind)
+                for kind in rng.choices(kinds, weights, k=args.updates)
+            ]
+
+            tasks = []
+            start = time.perf_counter()
+            for index, (kind, update) in enumerate(updates):
+                arrival = start
+                if args.rate:
+                    arrival = start + index / args.rate
+                    delay = arrival - time.perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(handle(kind, update, arrival)))
+            await asyncio.gather(*tasks)
+            elapsed = time.perf_counter() - start
+    finally:
+        await async_engine.dispose()
+
+    return {
+        "updates": args.updates,
+        "chats": args.chats,
+        "rate": args.rate,
+        "concurrent_updates": args.concurrent_updates,
+        "api_latency": args.api_latency,
+        "seconds": round(elapsed, 3),
+        "updates_per_second": round(args.updates / elapsed, 1),
+        "latency": percentiles(
+            [sample for samples in latencies.values() for sample in samples]),
+        "by_kind": {
+            kind: {"count": len(samples), **percentiles(samples)}
+            for kind, samples in latencies.items() if samples
+        },
+        "handler_errors": sum(
+            stats.errors for stats in metrics.handlers.values()),
+        "api_calls": dict(sorted(request.calls.items())),
+    }
+
+
+def main(args):
+    work_dir = tempfile.mkdtemp(prefix="game_bot_load_")
+    try:
+        # src.config reads the environment when first imported
+        os.environ["DATABASE_URL"] = args.url or (
+            f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}")
+        os.environ.setdefault("BOT_TOKEN", BOT_TOKEN)
+        if not args.flood_limits:
+            os.environ["RATE_LIMIT_GLOBAL_PER_SECOND"] = "1e9"
+            os.environ["RATE_LIMIT_GROUP_PER_MINUTE"] = "1e9"
+            os.environ["RATE_LIMIT_BURST"] = "1000000"
+
+        from benchmarks import synthetic
+        from src import config
+        from src.db import SessionLocal, engine
+
+        if args.concurrent_updates is None:
+            args.concurrent_updates = config.CONCURRENT_UPDATES
+        synthetic.reset_database()
+        with SessionLocal() as session:
+            synthetic.populate(
+                session, args.games, args.chats, args.players_per_chat,
+                days=30, seed=args.seed)
+        game_ids = deletable_games(args.chats)
+        engine.dispose()
+
+        print(json.dumps(asyncio.run(run(args, game_ids))))
+        return 0
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--updates", type=int, default=5000,
+                        help="Updates to send in total")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Updates per second; 0 sends them all at once")
+    parser.add_argument("--chats", type=int, default=500)
+    parser.add_argument("--players-per-chat", type=int, default=20)
+    parser.add_argument("--games", type=int, default=100000,
+                        help="Games in the database before the test")
+    parser.add_argument("--mix", nargs="+",
+                        default=["played=3", "rank=3", "games=2", "menu=1",
+                                 "delete=1"],
+                        metavar="KIND=WEIGHT",
+                        help=f"Relative share of each of: {', '.join(KINDS)}")
+    parser.add_argument("--concurrent-updates", type=int,
+                        help="Defaults to CONCURRENT_UPDATES")
+    parser.add_argument("--api-latency", type=float, default=0.0,
+                        help="Seconds each faked Bot API call takes")
+    parser.add_argument("--flood-limits", action="store_true",
+                        help="Keep the outbound rate limits of the config")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--url", help="Use this (scratch) database")
+    args = parser.parse_args()
+    try:
+        args.mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+    sys.exit(main(args))
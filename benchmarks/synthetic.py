@@ -0,0 +1,106 @@
+"""
+Synthetic chats, players and games for the benchmarks.
+
+reset_database() empties the database through the migrations, and
+populate() fills it with games spread evenly over a number of group
+chats, each with its own players, over the last few days, then rebuilds
+the standings and rating tables from them. The same arguments and seed
+always produce the same database.
+
+src.config reads DATABASE_URL when first imported, so set it before
+importing this module.
+"""
+import os
+import random
+from datetime import date, datetime, timedelta
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import insert, select
+
+from src.models import Game, Player
+from src.ratings import rebuild_ratings
+from src.stats import rebuild_stats
+
+# Supergroup and user IDs are larger than 32 bits, like real ones
+CHAT_ID_BASE = -1001000000000
+TELEGRAM_ID_BASE = 7_000_000_000
+
+# Rows per INSERT
+BATCH_SIZE = 10_000
+
+
+def reset_database():
+    """Drop and recreate every table of DATABASE_URL through the migrations."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    alembic_config = Config(os.path.join(root, "alembic.ini"))
+    alembic_config.set_main_option(
+        "script_location", os.path.join(root, "migrations"))
+    alembic_config.attributes["configure_logger"] = False
+    command.downgrade(alembic_config, "base")
+    command.upgrade(alembic_config, "head")
+
+
+def chat_id(chat: int) -> int:
+    """Telegram ID of the chat-th synthetic chat."""
+    return CHAT_ID_BASE - chat
+
+
+def username(chat: int, player: int) -> str:
+    """Telegram username of a synthetic chat's player-th player."""
+    return f"c{chat}p{player}"
+
+
+def populate(session, games: int, chats: int, players_per_chat: int,
+             days: int, seed: int = 0, deleted_ratio: float = 0.01):
+    """
+    Insert synthetic players and games, and rebuild the player stats and
+    ratings.
+
+    Args:
+        session: SQLAlchemy (sync) session on a migrated, empty database
+        games: Number of games, spread evenly over the chats
+        chats: Number of group chats
+        players_per_chat: Players of each chat; nobody plays in two chats
+        days: Games are dated from today back to days - 1 days ago
+        seed: Seed of the random winners, losers and dates
+        deleted_ratio: Share of the games that are soft-deleted
+    """
+    rng = random.Random(seed)
+    session.execute(insert(Player), [
+        {
+            "first_name": f"Player {chat}-{player}",
+            "telegram_id": TELEGRAM_ID_BASE + chat * players_per_chat + player,
+            "username": username(chat, player),
+        }
+        for chat in range(chats) for player in range(players_per_chat)
+    ])
+    ids = dict(session.execute(select(Player.username, Player.id)).all())
+    players = [
+        [ids[username(chat, player)] for player in range(players_per_chat)]
+        for chat in range(chats)
+    ]
+
+    today = date.today()
+    dates = [today - timedelta(days=offset) for offset in range(days)]
+    deleted_at = datetime.now()
+    rows = []
+    for index in range(games):
+        chat = index % chats
+        winner, loser = rng.sample(players[chat], 2)
+        rows.append({
+            "winner_id": winner,
+            "loser_id": loser,
+            "date": rng.choice(dates),
+            "chat_id": chat_id(chat),
+            "deleted_at": (
+                deleted_at if rng.random() < deleted_ratio else None),
+        })
+        if len(rows) == BATCH_SIZE:
+            session.execute(insert(Game), rows)
+            rows = []
+    if rows:
+        session.execute(insert(Game), rows)
+    session.commit()
+    rebuild_stats(session)
+    rebuild_ratings(session)
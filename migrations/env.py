@@ -1,9 +1,12 @@
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
+from sqlalchemy import Integer
 from sqlalchemy import pool
 
 from alembic import context
+from src import config as app_config
+from src.db import set_sqlite_pragmas
 from src.models import Base
 
 # this is the Alembic Config object, which provides
@@ -11,8 +14,12 @@ from src.models import Base
 config = context.config
 
 # Interpret the config file for Python logging.
-# This line sets up loggers basically.
-if config.config_file_name is not None:
+# This line sets up loggers basically. Scripts that migrate in-process
+# set configure_logger to False to keep the bot's logging.
+if (
+    config.config_file_name is not None
+    and config.attributes.get("configure_logger", True)
+):
     fileConfig(config.config_file_name)
 
 # add your model's MetaData object here
@@ -21,6 +28,29 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+# The database comes from DATABASE_URL like the bot's, not from alembic.ini.
+# "%" is escaped for the ini-style interpolation of set_main_option.
+config.set_main_option(
+    "sqlalchemy.url", app_config.DATABASE_URL.replace("%", "%%"))
+
+
+def compare_type(context, inspected_column, metadata_column,
+                 inspected_type, metadata_type):
+    """
+    Ignore INTEGER in the database against BigInteger in the models on
+    SQLite, where every integer is already 64-bit and migration
+    284d7c1cfffe leaves the columns as they were.
+    """
+    if (
+        context.dialect.name == "sqlite"
+        and isinstance(inspected_type, Integer)
+        and isinstance(metadata_type, Integer)
+    ):
+        return False
+    # Alembic's own comparison
+    return None
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -43,6 +73,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        compare_type=compare_type,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -63,10 +94,13 @@ def run_migrations_online() -> None:
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
     )
+    set_sqlite_pragmas(connectable)
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            compare_type=compare_type,
         )
 
         with context.begin_transaction():
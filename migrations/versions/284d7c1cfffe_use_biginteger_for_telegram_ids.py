@@ -0,0 +1,54 @@
+"""Use BigInteger for Telegram IDs
+
+Revision ID: 284d7c1cfffe
+Revises: fc23e6327797
+Create Date: 2026-10-17 03:51:11.925743
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '284d7c1cfffe'
+down_revision: Union[str, Sequence[str], None] = 'fc23e6327797'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (table, column, nullable) holding chat or user IDs from Telegram
+TELEGRAM_ID_COLUMNS = [
+    ('players', 'telegram_id', True),
+    ('games', 'chat_id', False),
+    ('player_chat_stats', 'chat_id', False),
+    ('player_daily_stats', 'chat_id', False),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # SQLite integers are already 64-bit, only other databases need this.
+    # compare_type in env.py keeps autogenerate from reporting the models'
+    # BigInteger against these INTEGER columns.
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for table, column, nullable in TELEGRAM_ID_COLUMNS:
+        op.alter_column(
+            table, column,
+            existing_type=sa.Integer(), type_=sa.BigInteger(),
+            existing_nullable=nullable,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'sqlite':
+        return
+    for table, column, nullable in TELEGRAM_ID_COLUMNS:
+        op.alter_column(
+            table, column,
+            existing_type=sa.BigInteger(), type_=sa.Integer(),
+            existing_nullable=nullable,
+        )
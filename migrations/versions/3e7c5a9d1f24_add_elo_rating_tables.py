@@ -0,0 +1,55 @@
+"""Add Elo rating tables
+
+Revision ID: 3e7c5a9d1f24
+Revises: 8d3f0a6b2c57
+Create Date: 2026-10-17 21:14:52.604318
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3e7c5a9d1f24'
+down_revision: Union[str, Sequence[str], None] = '8d3f0a6b2c57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('player_ratings',
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Float(), nullable=False),
+    sa.Column('games', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['players.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'player_id')
+    )
+    op.create_table('rating_checkpoints',
+    sa.Column('chat_id', sa.BigInteger(), nullable=False),
+    sa.Column('game_id', sa.Integer(), nullable=False),
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('rating', sa.Float(), nullable=False),
+    sa.Column('games', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['players.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'game_id', 'player_id')
+    )
+    op.create_index(
+        'ix_games_chat_id_id', 'games',
+        ['chat_id', 'id', 'winner_id', 'loser_id'], unique=False,
+        sqlite_where=sa.text('deleted_at IS NULL'),
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+    # The ratings are computed in Python, not here: run
+    # `python -m src.ratings rebuild` after upgrading. A chat that records
+    # a game before that has its whole history rated then.
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_games_chat_id_id', table_name='games')
+    op.drop_table('rating_checkpoints')
+    op.drop_table('player_ratings')
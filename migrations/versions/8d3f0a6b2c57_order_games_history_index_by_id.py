@@ -0,0 +1,39 @@
+"""Order games history index by ID
+
+Revision ID: 8d3f0a6b2c57
+Revises: 5b9e2d7c41a3
+Create Date: 2026-10-17 18:27:09.118640
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d3f0a6b2c57'
+down_revision: Union[str, Sequence[str], None] = '5b9e2d7c41a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _recreate_history_index(columns):
+    op.drop_index('ix_games_chat_id_date', table_name='games')
+    op.create_index(
+        'ix_games_chat_id_date', 'games', columns, unique=False,
+        sqlite_where=sa.text('deleted_at IS NULL'),
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # The history pages are read in ID order from the index
+    _recreate_history_index(
+        ['chat_id', 'date', 'id', 'winner_id', 'loser_id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _recreate_history_index(['chat_id', 'date', 'winner_id', 'loser_id'])
@@ -0,0 +1,50 @@
+"""Add games and players indexes
+
+Revision ID: 96a1e64952fc
+Revises: 11c86420e9b2
+Create Date: 2026-10-17 09:12:31.482913
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '96a1e64952fc'
+down_revision: Union[str, Sequence[str], None] = '11c86420e9b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        'ix_games_chat_id_date', 'games',
+        ['chat_id', 'date', 'winner_id', 'loser_id'], unique=False,
+        sqlite_where=sa.text('deleted_at IS NULL'),
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+    op.create_index(
+        'ix_games_chat_id_winner_id', 'games',
+        ['chat_id', 'winner_id'], unique=False,
+        sqlite_where=sa.text('deleted_at IS NULL'),
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+    op.create_index(
+        'ix_games_chat_id_loser_id', 'games',
+        ['chat_id', 'loser_id'], unique=False,
+        sqlite_where=sa.text('deleted_at IS NULL'),
+        postgresql_where=sa.text('deleted_at IS NULL'),
+    )
+    op.create_index(
+        op.f('ix_players_username'), 'players', ['username'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_players_username'), table_name='players')
+    op.drop_index('ix_games_chat_id_loser_id', table_name='games')
+    op.drop_index('ix_games_chat_id_winner_id', table_name='games')
+    op.drop_index('ix_games_chat_id_date', table_name='games')
@@ -0,0 +1,69 @@
+"""Add player stats tables
+
+Revision ID: fc23e6327797
+Revises: 96a1e64952fc
+Create Date: 2026-10-17 10:41:07.215384
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'fc23e6327797'
+down_revision: Union[str, Sequence[str], None] = '96a1e64952fc'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# Per (chat, date, player) results of every non-deleted game
+GAME_RESULTS = """
+    SELECT chat_id, date, winner_id AS player_id, 1 AS wins, 0 AS losses
+    FROM games WHERE deleted_at IS NULL
+    UNION ALL
+    SELECT chat_id, date, loser_id AS player_id, 0 AS wins, 1 AS losses
+    FROM games WHERE deleted_at IS NULL
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('player_chat_stats',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['players.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'player_id')
+    )
+    op.create_table('player_daily_stats',
+    sa.Column('chat_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('player_id', sa.Integer(), nullable=False),
+    sa.Column('wins', sa.Integer(), nullable=False),
+    sa.Column('losses', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['player_id'], ['players.id'], ),
+    sa.PrimaryKeyConstraint('chat_id', 'date', 'player_id')
+    )
+
+    # Backfill from the existing games
+    op.execute(
+        "INSERT INTO player_daily_stats "
+        "(chat_id, date, player_id, wins, losses) "
+        "SELECT chat_id, date, player_id, SUM(wins), SUM(losses) "
+        f"FROM ({GAME_RESULTS}) AS results WHERE date IS NOT NULL "
+        "GROUP BY chat_id, date, player_id"
+    )
+    op.execute(
+        "INSERT INTO player_chat_stats (chat_id, player_id, wins, losses) "
+        "SELECT chat_id, player_id, SUM(wins), SUM(losses) "
+        f"FROM ({GAME_RESULTS}) AS results GROUP BY chat_id, player_id"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('player_daily_stats')
+    op.drop_table('player_chat_stats')
@@ -1,5 +1,33 @@
+from src import config
 from src.bot import app_factory
 
+
+def run_webhook(app):
+    """Serve updates through the embedded webhook server."""
+    if not config.WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL environment variable is not set.")
+    if not config.WEBHOOK_SECRET:
+        raise ValueError("WEBHOOK_SECRET environment variable is not set.")
+    app.run_webhook(
+        listen=config.WEBHOOK_LISTEN,
+        port=config.WEBHOOK_PORT,
+        url_path=config.WEBHOOK_PATH,
+        webhook_url=f"{config.WEBHOOK_URL.rstrip('/')}/{config.WEBHOOK_PATH}",
+        secret_token=config.WEBHOOK_SECRET,
+    )
+
+
 if __name__ == "__main__":
-    app = app_factory()
-    app.run_polling()
+    if config.WORKERS > 1:
+        # Only the multi-process mode needs multiprocessing
+        from src.sharding import dispatcher_app_factory
+
+        app = dispatcher_app_factory(app_factory, config.WORKERS)
+    else:
+        app = app_factory()
+    if config.BOT_MODE == "webhook":
+        run_webhook(app)
+    elif config.BOT_MODE == "polling":
+        app.run_polling()
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {config.BOT_MODE}")
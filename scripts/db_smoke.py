@@ -0,0 +1,271 @@
+"""
+Smoke test of the database layer against a throwaway database.
+
+Migrates an empty database to head, then records, ranks and deletes games
+through the same functions the handlers use, and checks the player stats
+and ratings against the games table. Chat and user IDs are larger than
+32 bits, like real Telegram supergroups. It also counts the statements of
+a /played and of a games history page, so a change that brings back a
+query per game or per player fails here.
+
+    python -m scripts.db_smoke              # temporary SQLite file
+    python -m scripts.db_smoke --postgres   # temporary local PostgreSQL
+    python -m scripts.db_smoke --url postgresql://user:pw@host/scratch_db
+
+--postgres needs no Docker or installed server: it runs PostgreSQL from the
+``pgserver`` package (``pip install pgserver``) in a temporary directory,
+and falls back to SQLite when the package isn't installed. --url migrates
+the given database, so only point it at a scratch one.
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from types import SimpleNamespace
+
+CHAT_ID = -1001234567890
+# Chat of the statement counts, so its games leave CHAT_ID's alone
+BUSY_CHAT_ID = CHAT_ID - 1
+TELEGRAM_ID_BASE = 7_000_000_000
+BOT_TOKEN = "123:smoke"
+# Games on the day of the counted history page
+HISTORY_GAMES = 200
+# Statements of a /played of two games between players with usernames:
+# players by username, the games, player_chat_stats, player_daily_stats,
+# the chat's ratings and their upsert
+PLAYED_STATEMENTS = 6
+# SQLite can't promise the order of RETURNING rows, so SQLAlchemy inserts
+# the games one per statement there, within the same transaction
+PLAYED_GAMES = 2
+# Statements of a games history page: the page with both names joined
+HISTORY_STATEMENTS = 1
+
+
+def start_postgres(data_dir):
+    """Start a temporary PostgreSQL server, or return None if unavailable."""
+    try:
+        import pgserver
+    except ImportError:
+        print("pgserver is not installed, falling back to SQLite.")
+        return None, None
+    server = pgserver.get_server(data_dir, cleanup_mode="stop")
+    return server, server.get_uri()
+
+
+def migrate():
+    from alembic import command
+    from alembic.config import Config
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    alembic_config = Config(os.path.join(root, "alembic.ini"))
+    alembic_config.set_main_option(
+        "script_location", os.path.join(root, "migrations"))
+    alembic_config.attributes["configure_logger"] = False
+    command.upgrade(alembic_config, "head")
+
+
+@contextmanager
+def count_statements(engine):
+    """Collect the SQL statements the (sync) engine sends while inside."""
+    from sqlalchemy import event
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context,
+                              executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def played_update(bot, players):
+    """A /played message mentioning the players by username."""
+    from telegram import Update
+
+    mentions = [f"@{player.username}" for player in players]
+    text = " ".join(["/played", *mentions])
+    entities = [{"type": "bot_command", "offset": 0, "length": 7}]
+    offset = 8
+    for mention in mentions:
+        entities.append(
+            {"type": "mention", "offset": offset, "length": len(mention)})
+        offset += len(mention) + 1
+    return Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1,
+            "date": int(datetime.now(timezone.utc).timestamp()),
+            "chat": {"id": BUSY_CHAT_ID, "type": "supergroup",
+                     "title": "Busy chat"},
+            "from": {"id": TELEGRAM_ID_BASE, "is_bot": False,
+                     "first_name": players[0].first_name},
+            "text": text,
+            "entities": entities,
+        },
+    }, bot)
+
+
+async def check_statement_counts(session, players):
+    """Count the statements of /played and of a busy day's history page."""
+    from telegram import Bot
+
+    from benchmarks.fakes import FakeRequest
+    from src import config
+    from src.db import async_engine
+    from src.functions import generate_games_history_message, record_games
+    from src.handlers.commands import played
+
+    alice, bob, carl = players
+    today = date.today()
+    await record_games(session, BUSY_CHAT_ID, today, [
+        (alice.id, bob.id), (bob.id, carl.id)] * (HISTORY_GAMES // 2))
+    await session.commit()
+
+    with count_statements(async_engine.sync_engine) as statements:
+        message, _ = await generate_games_history_message(
+            session, BUSY_CHAT_ID, game_date=today)
+    assert message.count("Game ID") == min(
+        config.GAMES_PAGE_SIZE, HISTORY_GAMES), message
+    assert len(statements) == HISTORY_STATEMENTS, statements
+
+    request = FakeRequest()
+    async with Bot(BOT_TOKEN, request=request) as bot:
+        update = played_update(bot, [alice, bob, carl, alice])
+        context = SimpleNamespace(args=update.message.text.split()[1:])
+        with count_statements(async_engine.sync_engine) as statements:
+            await played(update, context)
+    assert request.calls.get("sendMessage") == 1, request.calls
+    expected = PLAYED_STATEMENTS
+    if async_engine.dialect.name == "sqlite":
+        expected += PLAYED_GAMES - 1
+    assert len(statements) == expected, statements
+
+
+async def exercise():
+    from src.db import AsyncSessionLocal, async_engine
+    from src.functions import (calculate_elo_ranking, calculate_ranking,
+                               generate_games_history_message, record_games,
+                               soft_delete_game)
+    from src.models import Player
+
+    today = date.today()
+    try:
+        async with AsyncSessionLocal() as session:
+            players = [
+                Player(telegram_id=TELEGRAM_ID_BASE + i, first_name=name,
+                       username=name.lower())
+                for i, name in enumerate(["Alice", "Bob", "Carl"])
+            ]
+            session.add_all(players)
+            await session.flush()
+            alice, bob, carl = (player.id for player in players)
+
+            games = await record_games(session, CHAT_ID, today, [
+                (alice, bob), (alice, carl), (bob, carl), (carl, alice),
+            ])
+            await session.commit()
+
+            rankings = await calculate_ranking(session, CHAT_ID)
+            assert [row.first_name for row in rankings] == [
+                "Alice", "Bob", "Carl"], rankings
+            assert abs(rankings[0].win_ratio - 2 / 3) < 1e-9, rankings
+            daily = await calculate_ranking(session, CHAT_ID, today)
+            assert [tuple(row) for row in daily] == [
+                tuple(row) for row in rankings], daily
+
+            # Deleting Carl's win over Alice leaves Alice unbeaten
+            assert await soft_delete_game(session, games[-1].id, CHAT_ID)
+            assert not await soft_delete_game(session, games[-1].id, CHAT_ID)
+            await session.commit()
+            rankings = await calculate_ranking(session, CHAT_ID)
+            assert rankings[0].first_name == "Alice", rankings
+            assert rankings[0].win_ratio == 1.0, rankings
+            elo = await calculate_elo_ranking(session, CHAT_ID)
+            assert [row.first_name for row in elo] == [
+                "Alice", "Bob", "Carl"], elo
+            assert [row.games for row in elo] == [2, 2, 2], elo
+
+            message, keyboard = await generate_games_history_message(
+                session, CHAT_ID, game_date=today)
+            assert message.count("Game ID") == 3, message
+            assert len(keyboard.inline_keyboard) == 3, keyboard
+
+            await check_statement_counts(session, players)
+    finally:
+        await async_engine.dispose()
+
+
+def check_stats():
+    from src.db import SessionLocal, engine
+    from src.stats import check_stats
+
+    with SessionLocal() as session:
+        mismatches = check_stats(session)
+    engine.dispose()
+    assert not mismatches, mismatches
+
+
+def check_ratings():
+    from sqlalchemy import select
+
+    from src.db import SessionLocal, engine
+    from src.models import PlayerRating
+    from src.ratings import rebuild_ratings
+
+    query = select(PlayerRating.chat_id, PlayerRating.player_id,
+                   PlayerRating.rating, PlayerRating.games)
+    with SessionLocal() as session:
+        # The incremental updates must match a recompute from scratch
+        ratings = set(session.execute(query).all())
+        rebuild_ratings(session)
+        rebuilt = set(session.execute(query).all())
+    engine.dispose()
+    assert ratings == rebuilt, (ratings, rebuilt)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m scripts.db_smoke",
+        description="Run the database layer against a throwaway database.")
+    backend = parser.add_mutually_exclusive_group()
+    backend.add_argument("--postgres", action="store_true",
+                         help="Use a temporary local PostgreSQL server")
+    backend.add_argument("--url",
+                         help="Use this (scratch) database instead")
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix="game_bot_db_smoke_")
+    server = None
+    try:
+        url = args.url
+        if args.postgres:
+            server, url = start_postgres(os.path.join(work_dir, "pgdata"))
+        if not url:
+            url = f"sqlite:///{os.path.join(work_dir, 'game_bot.db')}"
+        # src.config reads the environment when first imported
+        os.environ["DATABASE_URL"] = url
+
+        migrate()
+        asyncio.run(exercise())
+        check_stats()
+        check_ratings()
+
+        from src.db import engine
+        print(f"Database smoke test passed on {engine.dialect.name}.")
+        return 0
+    finally:
+        if server is not None:
+            server.cleanup()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+"""
+Local stand-in for Telegram, for trying the bot in webhook mode offline.
+
+It runs a fake Bot API server that prints everything the bot sends, and
+posts each line you type to the bot's webhook as a message from a fake
+user in a fake group chat. Lines starting with ``cb:`` are sent as
+callback query presses, e.g. ``cb:rank_all_time``.
+
+Start the bot against it:
+
+    TELEGRAM_API_URL=http://127.0.0.1:8081 BOT_MODE=webhook \\
+    WEBHOOK_URL=http://127.0.0.1:8443 WEBHOOK_SECRET=local-secret \\
+    python run.py
+
+and then, in another terminal:
+
+    python -m scripts.fake_telegram --secret local-secret
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import sys
+import time
+
+import httpx
+from tornado.web import Application, RequestHandler
+
+from benchmarks.fakes import api_result
+
+_message_ids = itertools.count(1)
+_update_ids = itertools.count(1)
+
+
+class BotAPIHandler(RequestHandler):
+    """Answers /bot<token>/<method> calls as benchmarks.fakes does."""
+
+    def _params(self):
+        if self.request.headers.get("Content-Type", "").startswith(
+                "application/json"):
+            return json.loads(self.request.body or b"{}")
+        return {
+            key: self.get_body_argument(key)
+            for key in self.request.body_arguments
+        }
+
+    def post(self, method):
+        params = self._params()
+        if method in ("sendMessage", "editMessageText"):
+            print(f"[bot -> {params.get('chat_id')}] {method}:\n"
+                  f"{params.get('text')}\n")
+            markup = params.get("reply_markup")
+            if markup:
+                print(f"  keyboard: {markup}\n")
+        result = api_result(method, params, _message_ids)
+        self.write({"ok": True, "result": result})
+
+    get = post
+
+
+def make_update(text, chat_id, user):
+    """Build an update for a typed line."""
+    chat = {"id": chat_id, "type": "group", "title": "Fake Group"}
+    if text.startswith("cb:"):
+        return {
+            "update_id": next(_update_ids),
+            "callback_query": {
+                "id": str(next(_update_ids)),
+                "from": user,
+                "chat_instance": str(chat_id),
+                "data": text[3:],
+                "message": {
+                    "message_id": next(_message_ids),
+                    "date": int(time.time()),
+                    "chat": chat,
+                    "text": "",
+                },
+            },
+        }
+
+    entities = []
+    command = re.match(r"/\w+", text)
+    if command:
+        entities.append(
+            {"type": "bot_command", "offset": 0, "length": command.end()})
+    for mention in re.finditer(r"@\w+", text):
+        entities.append({
+            "type": "mention",
+            "offset": mention.start(),
+            "length": mention.end() - mention.start(),
+        })
+    return {
+        "update_id": next(_update_ids),
+        "message": {
+            "message_id": next(_message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": user,
+            "text": text,
+            "entities": entities,
+        },
+    }
+
+
+async def send_updates(args):
+    user = {"id": args.user_id, "is_bot": False,
+            "first_name": args.first_name, "username": args.username}
+    headers = {"X-Telegram-Bot-Api-Secret-Token": args.secret}
+    loop = asyncio.get_running_loop()
+    async with httpx.AsyncClient() as client:
+        while True:
+            line = await loop.run_in_executor(None, sys.stdin.readline)
+            if not line:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                response = await client.post(
+                    args.webhook, json=make_update(line, args.chat_id, user),
+                    headers=headers)
+            except httpx.HTTPError as err:
+                print(f"[webhook] {err!r}")
+                continue
+            if response.status_code != 200:
+                print(f"[webhook] HTTP {response.status_code}")
+
+
+async def main(args):
+    Application([(r"/bot[^/]+/(\w+)", BotAPIHandler)]).listen(
+        args.api_port, address="127.0.0.1")
+    print(f"Fake Bot API on http://127.0.0.1:{args.api_port}, "
+          f"posting updates to {args.webhook}")
+    await send_updates(args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--webhook",
+                        default="http://127.0.0.1:8443/telegram")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--api-port", type=int, default=8081)
+    parser.add_argument("--chat-id", type=int, default=-1001)
+    parser.add_argument("--user-id", type=int, default=1001)
+    parser.add_argument("--first-name", default="Alice")
+    parser.add_argument("--username", default="alice")
+    asyncio.run(main(parser.parse_args()))
@@ -1,29 +1,91 @@
-import os
-
-from dotenv import load_dotenv
 from telegram.ext import (ApplicationBuilder, CallbackQueryHandler,
                           CommandHandler, ConversationHandler, MessageHandler,
                           filters)
 
+from src import config
 from src.constants import WAITING_FOR_DATE
+from src.db import async_engine
+from src.error_reporting import error_reporter
 from src.handlers.callbacks import (error_handler, handle_date_input,
-                                    handle_delete_button, handle_menu_callback,
-                                    handle_rank_callback)
-from src.handlers.commands import (add_me, handle_delete_game_command,
-                                   handle_games_command, handle_test_command,
+                                    handle_delete_button,
+                                    handle_games_page_button,
+                                    handle_menu_callback,
+                                    handle_rank_callback,
+                                    handle_session_cancel_game,
+                                    handle_session_delete_game,
+                                    handle_session_end, handle_session_loser,
+                                    handle_session_winner)
+from src.handlers.commands import (add_me, handle_cache_stats_command,
+                                   handle_delete_game_command,
+                                   handle_games_command,
+                                   handle_metrics_command, handle_test_command,
                                    help_command, played, ranking, show_menu,
                                    start)
+from src.metrics import instrument, metrics
+from src.persistence import DatabasePersistence
+from src.rate_limiter import OutboundRateLimiter
+from src.update_processor import ChatOrderedUpdateProcessor
 
-load_dotenv()
-TOKEN = os.getenv("BOT_TOKEN")
+TOKEN = config.BOT_TOKEN
 if not TOKEN:
     raise ValueError("BOT_TOKEN environment variable is not set.")
 
 
-def app_factory(token=TOKEN):
-    """Factory function to create the Telegram bot application."""
+async def post_init(app):
+    """Start the background tasks that need the running loop."""
+    error_reporter.start(app.bot)
+    if config.METRICS_PORT:
+        await metrics.start_server(
+            config.METRICS_HOST, config.METRICS_PORT + metrics.worker)
+
+
+async def post_stop(app):
+    """Send the last error digest while the bot can still send."""
+    await error_reporter.stop()
+    await metrics.stop_server()
+
+
+async def post_shutdown(app):
+    """Close pooled async DB connections so the process can exit."""
+    await async_engine.dispose()
+
+
+def app_factory(token=TOKEN, concurrent_updates=config.CONCURRENT_UPDATES,
+                request=None):
+    """
+    Factory function to create the Telegram bot application.
+
+    Args:
+        token: Bot token
+        concurrent_updates: See config.CONCURRENT_UPDATES
+        request: BaseRequest the bot sends its Bot API calls through,
+            e.g. benchmarks.fakes.FakeRequest; HTTPX by default
+    """
 
-    app = ApplicationBuilder().token(token).build()
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .base_url(f"{config.TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{config.TELEGRAM_API_URL}/file/bot")
+        .post_init(post_init)
+        .post_stop(post_stop)
+        .post_shutdown(post_shutdown)
+        .persistence(DatabasePersistence())
+        .rate_limiter(OutboundRateLimiter(
+            # The workers of the multi-process mode share the global limit
+            global_rate=config.RATE_LIMIT_GLOBAL_PER_SECOND / config.WORKERS,
+            group_rate=config.RATE_LIMIT_GROUP_PER_MINUTE / 60,
+            private_rate=config.RATE_LIMIT_PRIVATE_PER_SECOND,
+            burst=config.RATE_LIMIT_BURST,
+            max_retries=config.RATE_LIMIT_MAX_RETRIES,
+        ))
+    )
+    if request is not None:
+        builder.request(request)
+    if concurrent_updates > 1:
+        builder.concurrent_updates(
+            ChatOrderedUpdateProcessor(concurrent_updates))
+    app = builder.build()
     # Command handlers
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("help", help_command))
@@ -34,28 +96,35 @@ def app_factory(token=TOKEN):
     app.add_handler(CommandHandler("menu", show_menu))
     app.add_handler(CommandHandler("test", handle_test_command))
     app.add_handler(CommandHandler("delete_game", handle_delete_game_command))
+    app.add_handler(CommandHandler("cache_stats", handle_cache_stats_command))
+    app.add_handler(CommandHandler("metrics", handle_metrics_command))
 
     # Callback query handlers
     app.add_handler(CallbackQueryHandler(
         handle_menu_callback, pattern="^menu_"))
 
-    # Handle immediate ranking responses (rank_today, rank_all_time, menu_back)
+    # Handle immediate ranking responses (rank_today, rank_week, rank_month,
+    # rank_all_time, rank_elo, menu_back)
     app.add_handler(CallbackQueryHandler(
-        handle_rank_callback, pattern="^(rank_today|rank_all_time|menu_back)$"))
+        handle_rank_callback,
+        pattern="^(rank_today|rank_week|rank_month|rank_all_time|rank_elo"
+                "|menu_back)$"))
 
     app.add_handler(CallbackQueryHandler(
         handle_delete_button, pattern="^delete_game_"))
-    # Uncomment These lines when the session is ready
-    # app.add_handler(CallbackQueryHandler(
-    #     handle_session_winner, pattern="^session_winner_"))
-    # app.add_handler(CallbackQueryHandler(
-    #     handle_session_loser, pattern="^session_loser_"))
-    # app.add_handler(CallbackQueryHandler(
-    #     handle_session_delete_game, pattern="^session_delete_game_"))
-    # app.add_handler(CallbackQueryHandler(
-    #     handle_session_end, pattern="^session_end$"))
-    # app.add_handler(CallbackQueryHandler(
-    #     handle_session_cancel_game, pattern="^session_cancel_game$"))
+    app.add_handler(CallbackQueryHandler(
+        handle_games_page_button, pattern="^games_(next|prev)_"))
+    # Game sessions, see src/sessions.py
+    app.add_handler(CallbackQueryHandler(
+        handle_session_winner, pattern="^session_winner_"))
+    app.add_handler(CallbackQueryHandler(
+        handle_session_loser, pattern="^session_loser_"))
+    app.add_handler(CallbackQueryHandler(
+        handle_session_delete_game, pattern="^session_delete_game_"))
+    app.add_handler(CallbackQueryHandler(
+        handle_session_end, pattern="^session_end$"))
+    app.add_handler(CallbackQueryHandler(
+        handle_session_cancel_game, pattern="^session_cancel_game$"))
 
     # Conversation handler ONLY for date input conversation
     # This handles: rank_enter_date (starts conversation) and rank_cancel (ends conversation)
@@ -67,10 +136,16 @@ def app_factory(token=TOKEN):
                 filters.TEXT & ~filters.COMMAND, handle_date_input)]
         },
         fallbacks=[CallbackQueryHandler(
-            handle_rank_callback, pattern="^rank_cancel$")]
+            handle_rank_callback, pattern="^rank_cancel$")],
+        # Survives restarts, see src/persistence.py
+        name="rank_date_input",
+        persistent=True,
     )
     app.add_handler(conv_handler)
 
     app.add_error_handler(error_handler)
 
+    # Time every handler above, see src/metrics.py
+    instrument(app)
+
     return app
@@ -0,0 +1,153 @@
+"""
+In-process cache of rankings per (chat_id, date), where the date may also
+be a (first, last) range of dates.
+
+Entries are dropped when games are recorded or deleted in the chat, and
+expire after a TTL regardless. The TTL also bounds how stale a replica can
+be when another process writes games. Each chat carries a generation
+number that every invalidation bumps, so a ranking computed before a
+write can't be stored after it.
+"""
+import time
+from collections import OrderedDict, defaultdict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from src import config
+
+
+class RankingCache:
+    """LRU cache with a TTL, keyed by (chat_id, date)."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # (chat_id, date) -> (expires_at, value)
+        self._entries = OrderedDict()
+        # chat_id -> dates with an entry, for invalidating a whole chat
+        self._dates_by_chat = defaultdict(set)
+        self._generations = defaultdict(int)
+
+    def generation(self, chat_id: int) -> int:
+        """Read before computing a value, pass to set()."""
+        return self._generations[chat_id]
+
+    def get(self, chat_id: int, date=None):
+        """Return the cached value, or None on a miss."""
+        key = (chat_id, date)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, chat_id: int, date, value, generation: int):
+        """Store a value unless the chat was invalidated since generation."""
+        if self.maxsize <= 0 or self._generations[chat_id] != generation:
+            return
+        key = (chat_id, date)
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        self._dates_by_chat[chat_id].add(date)
+        while len(self._entries) > self.maxsize:
+            self._discard(next(iter(self._entries)))
+
+    def invalidate(self, chat_id: int, dates=None):
+        """
+        Drop a chat's cached rankings after its games changed.
+
+        Args:
+            chat_id: Chat whose games changed
+            dates: Dates of the changed games. The all-time entry is always
+                dropped, as are the ranges containing one of the dates and
+                the entries keyed by name rather than date (such as the
+                Elo rankings). None drops every date of the chat.
+        """
+        self._generations[chat_id] += 1
+        self.invalidations += 1
+        cached = set(self._dates_by_chat.get(chat_id, ()))
+        if dates is None:
+            dates = cached
+        else:
+            dates = set(dates)
+            changed = [date for date in dates if date is not None]
+            dates.update(key for key in cached if isinstance(key, str))
+            dates.update(
+                key for key in cached
+                if isinstance(key, tuple)
+                and any(key[0] <= date <= key[1] for date in changed))
+        for date in {None, *dates}:
+            self._discard((chat_id, date))
+
+    def clear(self):
+        self._entries.clear()
+        self._dates_by_chat.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+        }
+
+    def _discard(self, key):
+        if self._entries.pop(key, None) is None:
+            return
+        chat_id, date = key
+        dates = self._dates_by_chat.get(chat_id)
+        if dates is not None:
+            dates.discard(date)
+            if not dates:
+                del self._dates_by_chat[chat_id]
+
+
+ranking_cache = RankingCache(
+    maxsize=config.RANKING_CACHE_SIZE, ttl=config.RANKING_CACHE_TTL)
+
+# Players of each chat for the game session pickers, keyed by (chat_id,
+# None). Recording games can add players to a chat, so it is invalidated
+# along with the rankings.
+roster_cache = RankingCache(
+    maxsize=config.RANKING_CACHE_SIZE, ttl=config.RANKING_CACHE_TTL)
+
+
+def invalidate_rankings_on_commit(session, chat_id: int, dates):
+    """
+    Invalidate a chat's cached rankings and roster once the session commits.
+
+    Invalidating before the commit would let another handler cache the
+    old rankings again in between.
+
+    Args:
+        session: SQLAlchemy session or async session writing the games
+        chat_id: Chat whose games are changing
+        dates: Dates of the changing games
+    """
+    sync_session = getattr(session, "sync_session", session)
+    pending = sync_session.info.setdefault("invalidate_rankings", {})
+    pending.setdefault(chat_id, set()).update(dates)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_rankings(session):
+    for chat_id, dates in session.info.pop(
+            "invalidate_rankings", {}).items():
+        ranking_cache.invalidate(chat_id, dates)
+        roster_cache.invalidate(chat_id, ())
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_rolled_back_rankings(session):
+    session.info.pop("invalidate_rankings", None)
@@ -1,12 +1,151 @@
-from sqlalchemy import create_engine
+import asyncio
+import time
+import weakref
+from contextlib import asynccontextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from src import config
+from src.metrics import metrics
 # from src.models import Base
 
-# This creates a SQLite file in the project folder
-engine = create_engine("sqlite:///game_bot.db")
+# Async driver used for each supported database
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_database_url(url):
+    """
+    The same database URL with the async driver of its backend.
+
+    Args:
+        url: Database URL, e.g. "postgresql://user@host/db"
+
+    Returns:
+        URL object, e.g. for "postgresql+asyncpg://user@host/db"
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(
+            f"Unsupported database {backend!r}, "
+            f"use one of: {', '.join(ASYNC_DRIVERS)}")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}")
+
+
+def set_sqlite_pragmas(engine):
+    """
+    Apply the configured pragmas to every connection the engine opens.
+
+    Does nothing for databases other than SQLite. Pass the sync_engine of
+    an async engine.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={config.SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={config.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size={config.SQLITE_CACHE_SIZE:d}")
+        cursor.execute(f"PRAGMA mmap_size={config.SQLITE_MMAP_SIZE:d}")
+        cursor.execute(f"PRAGMA busy_timeout={config.SQLITE_BUSY_TIMEOUT:d}")
+        cursor.close()
+
+
+def count_queries(engine):
+    """
+    Time every query the engine runs into src.metrics.
+
+    Pass the sync_engine of an async engine.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _start_timer(conn, cursor, statement, parameters, context,
+                     executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record_query(conn, cursor, statement, parameters, context,
+                      executemany):
+        started = conn.info["query_started"].pop()
+        metrics.record_query(time.perf_counter() - started)
+
+    @event.listens_for(engine, "handle_error")
+    def _drop_timer(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+POOL_OPTIONS = {
+    "pool_size": config.DB_POOL_SIZE,
+    "max_overflow": config.DB_MAX_OVERFLOW,
+    "pool_timeout": config.DB_POOL_TIMEOUT,
+    "pool_pre_ping": config.DB_POOL_PRE_PING,
+}
+
+# Sync engine, for migrations and maintenance commands
+engine = create_engine(
+    config.DATABASE_URL, poolclass=QueuePool, **POOL_OPTIONS)
+set_sqlite_pragmas(engine)
+count_queries(engine)
 
 # Create tables if they don’t exist
 # Base.metadata.create_all(engine)
 
 # Session factory: lets us talk to the DB
 SessionLocal = sessionmaker(bind=engine)
+
+# Async engine over the same database. Handlers use this one so a slow
+# query doesn't block the event loop for every other chat.
+async_engine = create_async_engine(
+    async_database_url(config.DATABASE_URL),
+    poolclass=AsyncAdaptedQueuePool,
+    **POOL_OPTIONS
+)
+set_sqlite_pragmas(async_engine.sync_engine)
+count_queries(async_engine.sync_engine)
+
+# Async session factory, the drop-in counterpart of SessionLocal.
+# Objects stay usable after commit since handlers still read them to reply.
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, expire_on_commit=False)
+
+# SQLite has one writer at a time, and a connection waiting for the lock
+# in SQLite's busy handler holds its connection's mutex meanwhile. If the
+# garbage collector finalizes a cursor of that connection on the event
+# loop's thread, the whole loop stops until busy_timeout runs out, the
+# transaction holding the lock with it, and the writers behind it fail
+# with "database is locked". So a process's writers queue on an asyncio
+# lock, one per event loop, and only wait in SQLite for other processes.
+_sqlite_write_locks = weakref.WeakKeyDictionary()
+
+
+@asynccontextmanager
+async def write_session():
+    """
+    AsyncSession for a transaction that writes.
+
+    On SQLite only one is open at a time per event loop; the others wait
+    for it here. Other databases lock rows, so this is AsyncSessionLocal.
+    Don't open one inside another.
+    """
+    if async_engine.dialect.name != "sqlite":
+        async with AsyncSessionLocal() as session:
+            yield session
+        return
+    loop = asyncio.get_running_loop()
+    lock = _sqlite_write_locks.get(loop)
+    if lock is None:
+        lock = _sqlite_write_locks[loop] = asyncio.Lock()
+    async with lock:
+        async with AsyncSessionLocal() as session:
+            yield session
@@ -2,6 +2,8 @@ from functools import wraps
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from src import config
+
 
 def reject_if_private_chat(func):
     """Decorator to reject commands in private chats."""
@@ -19,3 +21,21 @@ def reject_if_private_chat(func):
         return await func(update, context, *args, **kwargs)
 
     return wrapper
+
+
+def developer_only(func):
+    """Decorator to silently ignore commands from anyone but DEVELOPER_ID."""
+
+    @wraps(func)
+    async def wrapper(
+        update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs
+    ):
+        if (
+            not config.DEVELOPER_ID
+            or not update.effective_user
+            or str(update.effective_user.id) != config.DEVELOPER_ID
+        ):
+            return
+        return await func(update, context, *args, **kwargs)
+
+    return wrapper
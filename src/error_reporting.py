@@ -0,0 +1,212 @@
+"""
+Developer notifications for handler errors, grouped and rate-limited.
+
+Errors are grouped by fingerprint: the exception type and the innermost
+line of this project it was raised through. The first error of a group
+in each window is sent to DEVELOPER_ID right away, up to
+ERROR_ALERT_LIMIT alerts per window. Everything else is counted and sent
+as one digest at the end of the window, so an incident like a locked
+database produces a handful of messages instead of one per update.
+"""
+import asyncio
+import contextlib
+import html
+import os
+import traceback
+
+from src import config, templates
+from src.logging_config import logger
+
+# Tracebacks are located by the innermost frame under this directory
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = os.path.dirname(SRC_DIR)
+
+# Chat IDs kept per group, and groups listed per digest
+MAX_CHATS_PER_GROUP = 5
+MAX_DIGEST_GROUPS = 10
+MAX_DETAIL_LENGTH = 200
+
+
+def fingerprint(error: BaseException) -> tuple[str, str]:
+    """
+    The (type, location) errors are grouped by.
+
+    The location is the innermost frame of the traceback in src/, since
+    library frames, e.g. of sqlite3, look the same for every caller.
+    """
+    error_type = type(error)
+    name = error_type.__qualname__
+    if error_type.__module__ != "builtins":
+        name = f"{error_type.__module__}.{name}"
+
+    frames = traceback.extract_tb(error.__traceback__)
+    own_frames = [
+        frame for frame in frames if frame.filename.startswith(SRC_DIR)]
+    if not frames:
+        return name, "unknown location"
+    frame = (own_frames or frames)[-1]
+    filename = os.path.relpath(frame.filename, PROJECT_DIR)
+    return name, f"{filename}:{frame.lineno} ({frame.name})"
+
+
+class ErrorGroup:
+    """Errors with the same fingerprint within a window."""
+
+    __slots__ = ("error_type", "location", "detail", "count", "alerted",
+                 "chat_ids")
+
+    def __init__(self, error_type, location, detail):
+        self.error_type = error_type
+        self.location = location
+        self.detail = detail
+        self.count = 0
+        # How many of the errors the developer has already been alerted of
+        self.alerted = 0
+        self.chat_ids = []
+
+
+class ErrorReporter:
+    """
+    Collects errors and notifies the developer. See the module docstring.
+
+    Args:
+        interval: Seconds per window; a digest is sent after each one
+        alert_limit: Immediate alerts per window
+        developer_id: Telegram chat to notify, or None to only log
+    """
+
+    def __init__(self, interval: float, alert_limit: int, developer_id):
+        self.interval = interval
+        self.alert_limit = alert_limit
+        self.developer_id = developer_id
+        self._groups = {}
+        self._alerts_sent = 0
+        self._bot = None
+        self._task = None
+
+    def record(self, error: BaseException, update: object = None):
+        """
+        Count an error in its group.
+
+        Returns:
+            The error's group, and whether it is the group's first error
+            in this window
+        """
+        error_type, location = fingerprint(error)
+        group = self._groups.get((error_type, location))
+        is_new = group is None
+        if is_new:
+            detail = str(error)[:MAX_DETAIL_LENGTH]
+            group = self._groups[(error_type, location)] = ErrorGroup(
+                error_type, location, detail)
+        group.count += 1
+        chat = getattr(update, "effective_chat", None)
+        if (
+            chat is not None and chat.id not in group.chat_ids
+            and len(group.chat_ids) < MAX_CHATS_PER_GROUP
+        ):
+            group.chat_ids.append(chat.id)
+        return group, is_new
+
+    async def report(self, error: BaseException, update: object = None):
+        """Record an error, and alert the developer if it's a new kind."""
+        group, is_new = self.record(error, update)
+        if is_new:
+            # Full traceback once per group and window; repeats only count
+            logger.error("Exception occurred:", exc_info=error)
+        else:
+            logger.error("Exception occurred again (%d times): %s at %s",
+                         group.count, group.error_type, group.location)
+
+        if not is_new or self._alerts_sent >= self.alert_limit:
+            return
+        self._alerts_sent += 1
+        group.alerted = group.count
+        user = getattr(update, "effective_user", None)
+        await self._send(templates.ERROR_ALERT_TEXT.format(
+            user_id=getattr(user, "id", "N/A"),
+            chat_id=group.chat_ids[0] if group.chat_ids else "N/A",
+            error_type=html.escape(group.error_type),
+            location=html.escape(group.location),
+            detail=html.escape(group.detail),
+        ))
+
+    def digest(self):
+        """
+        Start a new window and summarize its errors.
+
+        Groups whose only error was already sent as an alert are left out.
+
+        Returns:
+            Digest message text, or None if there is nothing to report
+        """
+        groups = [
+            group for group in self._groups.values()
+            if group.count > group.alerted
+        ]
+        self._groups = {}
+        self._alerts_sent = 0
+        if not groups:
+            return None
+
+        groups.sort(key=lambda group: group.count, reverse=True)
+        lines = [templates.ERROR_DIGEST_HEADER.format(
+            minutes=round(self.interval / 60, 1),
+            count=sum(group.count for group in groups),
+            kinds=len(groups),
+        )]
+        for group in groups[:MAX_DIGEST_GROUPS]:
+            lines.append(templates.ERROR_DIGEST_LINE.format(
+                count=group.count,
+                error_type=html.escape(group.error_type),
+                location=html.escape(group.location),
+                detail=html.escape(group.detail),
+                chats=", ".join(map(str, group.chat_ids)) or "N/A",
+            ))
+        if len(groups) > MAX_DIGEST_GROUPS:
+            lines.append(templates.ERROR_DIGEST_MORE.format(
+                kinds=len(groups) - MAX_DIGEST_GROUPS))
+        return "\n".join(lines)
+
+    async def flush(self):
+        """Send the digest of the current window, if there is anything."""
+        text = self.digest()
+        if text is not None:
+            await self._send(text)
+
+    async def _send(self, text):
+        if self._bot is None or not self.developer_id:
+            return
+        try:
+            await self._bot.send_message(
+                chat_id=int(self.developer_id), text=text, parse_mode="HTML")
+        except Exception as notify_err:
+            logger.error("Failed to notify developer: %s", notify_err)
+
+    async def _send_digests(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    def start(self, bot):
+        """Start sending digests through bot. Call from a running loop."""
+        self._bot = bot
+        if not self.developer_id:
+            logger.warning("DEVELOPER_ID environment variable is not set.")
+        self._task = asyncio.create_task(self._send_digests())
+
+    async def stop(self):
+        """Stop the digests and send the last one."""
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        await self.flush()
+
+
+error_reporter = ErrorReporter(
+    interval=config.ERROR_DIGEST_INTERVAL,
+    alert_limit=config.ERROR_ALERT_LIMIT,
+    developer_id=config.DEVELOPER_ID,
+)
@@ -1,97 +1,262 @@
 import os
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup
-from sqlalchemy import Float, cast, func
+from telegram import InlineKeyboardMarkup
+from sqlalchemy import Float, cast, func, insert, select, update
+from sqlalchemy.orm import aliased
 
+from src import config
+from src.cache import (invalidate_rankings_on_commit, ranking_cache,
+                       roster_cache)
 from src.logging_config import logger
-from src.models import Game, Player
-from src.utils import with_emoji
+from src.models import (Game, Player, PlayerChatStats, PlayerDailyStats,
+                        PlayerRating)
+from src.keyboards import delete_game_button, games_page_buttons
+from src.ratings import add_games_to_ratings, replay_ratings
+from src.stats import add_games_to_stats, remove_games_from_stats
+from src.templates import MEDALS
 
 
 
-def calculate_ranking(session, chat_id, date=None):
+async def calculate_ranking(session, chat_id, date=None, end_date=None):
     """
     Calculate the ranking of players in a chat.
 
+    Only players with games in the chat (on the date, if given) are read.
+    With end_date, the games from date to end_date (inclusive) are
+    counted, summing each player's daily stats, one row per player per day
+    played. Ordering is done in SQL: win ratio first, then number of wins,
+    then player ID so ties always come out in the same order.
+
     Args:
-        session: SQLAlchemy session
+        session: SQLAlchemy async session
         chat_id: Chat ID to filter games by
-        date: Date to filter games by
+        date: Date to filter games by, or the first date of the range
+        end_date: Last date of the range
 
     Returns:
-        List of tuples containing player objects and their win ratios
+        List of rows with player_id, first_name, wins, losses and
+        win_ratio, best player first
     """
-    # FUTURE: This is a very inefficient way to calculate the ranking.
+    # Read the maintained standings instead of aggregating the games
+    if end_date:
+        return await _calculate_range_ranking(
+            session, chat_id, date, end_date)
+    if date:
+        stats = PlayerDailyStats
+        conditions = [stats.chat_id == chat_id, stats.date == date]
+    else:
+        stats = PlayerChatStats
+        conditions = [stats.chat_id == chat_id]
 
-    # Subquery for wins (excluding deleted games)
-    win_query = session.query(
-        Game.winner_id.label("player_id"),
-        func.count(Game.id).label("wins")
-    ).filter(
-        Game.chat_id == chat_id,
-        Game.deleted_at.is_(None)  # Only count non-deleted games
+    win_ratio = (
+        cast(stats.wins, Float) / cast(stats.wins + stats.losses, Float)
+    ).label("win_ratio")
+
+    query = select(
+        stats.player_id,
+        Player.first_name,
+        stats.wins,
+        stats.losses,
+        win_ratio,
+    ).join(
+        Player, Player.id == stats.player_id
+    ).where(
+        *conditions,
+        # Rows left at zero after their games were deleted
+        stats.wins + stats.losses > 0,
+    ).order_by(
+        win_ratio.desc(), stats.wins.desc(), stats.player_id
     )
-    if date:
-        win_query = win_query.filter(Game.date == date)
-    win_query = win_query.group_by(Game.winner_id).subquery()
-
-    # Subquery for losses (excluding deleted games)
-    loss_query = session.query(
-        Game.loser_id.label("player_id"),
-        func.count(Game.id).label("losses")
-    ).filter(
-        Game.chat_id == chat_id,
-        Game.deleted_at.is_(None)  # Only count non-deleted games
+
+    return (await session.execute(query)).all()
+
+
+async def _calculate_range_ranking(session, chat_id, start_date, end_date):
+    # The (chat_id, date) prefix of the primary key bounds the scan to the
+    # range's daily rows
+    stats = PlayerDailyStats
+    totals = select(
+        stats.player_id,
+        func.sum(stats.wins).label("wins"),
+        func.sum(stats.losses).label("losses"),
+    ).where(
+        stats.chat_id == chat_id,
+        stats.date >= start_date,
+        stats.date <= end_date,
+    ).group_by(
+        stats.player_id
+    ).subquery("totals")
+
+    win_ratio = (
+        cast(totals.c.wins, Float)
+        / cast(totals.c.wins + totals.c.losses, Float)
+    ).label("win_ratio")
+
+    query = select(
+        totals.c.player_id,
+        Player.first_name,
+        totals.c.wins,
+        totals.c.losses,
+        win_ratio,
+    ).join(
+        Player, Player.id == totals.c.player_id
+    ).where(
+        # Players whose games in the range were all deleted
+        totals.c.wins + totals.c.losses > 0,
+    ).order_by(
+        win_ratio.desc(), totals.c.wins.desc(), totals.c.player_id
     )
-    if date:
-        loss_query = loss_query.filter(Game.date == date)
-    loss_query = loss_query.group_by(Game.loser_id).subquery()
-
-    # Join Player with wins and losses subqueries
-    query = session.query(
-        Player,
-        (cast(func.coalesce(win_query.c.wins, 0), Float) /
-         cast(
-             func.nullif(
-                 func.coalesce(win_query.c.wins, 0) +
-                 func.coalesce(loss_query.c.losses, 0), 0
-             ), Float
-         )).label("win_ratio")
-    ).outerjoin(
-        win_query, Player.id == win_query.c.player_id
-        ).outerjoin(loss_query, Player.id == loss_query.c.player_id)
-
-    result = query.all()
-    # FUTURE: The list type is inefficient.
-    # Filter out players with None win_ratio
-    filtered_result = [(player, win_ratio) for player, win_ratio in result
-                      if win_ratio is not None]
-
-    # Sort by win_ratio in descending order (highest first)
-    filtered_result.sort(key=lambda x: x[1], reverse=True)
-
-    return filtered_result
+
+    return (await session.execute(query)).all()
+
+
+# Days of the week and month rankings, up to and including today
+RANKING_PERIOD_DAYS = {"week": 7, "month": 30}
+
+
+def ranking_period(period: str, today: date) -> tuple[date, date]:
+    """First and last date of the "week" or "month" rankings."""
+    return today - timedelta(days=RANKING_PERIOD_DAYS[period] - 1), today
 
 
 def generate_rankings_text(rankings):
-    rankings_text = ""
-    for i, (player, win_ratio) in enumerate(rankings, 1):
-        if not player:
-            continue
-        MEDALS = {
-            1: ':1st_place_medal:',
-            2: ':2nd_place_medal:',
-            3: ':3rd_place_medal:',
-        }
-        if i in MEDALS:
-            rankings_text += f"{MEDALS[i]} "
-        if win_ratio is not None:
-            rankings_text += f"{i}. {player.first_name} - Win Ratio: {win_ratio * 100:.0f}%\n"
-        else:
-            rankings_text += f"{i}. {player.first_name} - No games played\n"
-    logger.debug(f"Rankings text: {with_emoji(rankings_text)}")
-    return with_emoji(rankings_text)
+    lines = [
+        f"{MEDALS.get(i, '')}{i}. {row.first_name} - "
+        f"Win Ratio: {row.win_ratio * 100:.0f}%\n"
+        for i, row in enumerate(rankings, 1)
+    ]
+    rankings_text = "".join(lines)
+    logger.debug("Rankings text: %s", rankings_text)
+    return rankings_text
+
+
+async def get_rankings(session, chat_id, date=None, end_date=None):
+    """
+    Rankings of a chat and their rendered text, cached per (chat, date)
+    or (chat, date range).
+
+    Args:
+        session: SQLAlchemy async session, only queried on a cache miss
+        chat_id: Chat ID to filter games by
+        date: Date to filter games by, or the first date of the range
+        end_date: Last date of the range
+
+    Returns:
+        Tuple of (rankings, rankings_text) as returned by calculate_ranking
+        and generate_rankings_text
+    """
+    key = (date, end_date) if end_date else date
+    cached = ranking_cache.get(chat_id, key)
+    if cached is not None:
+        return cached
+    generation = ranking_cache.generation(chat_id)
+    rankings = await calculate_ranking(session, chat_id, date, end_date)
+    result = (rankings, generate_rankings_text(rankings))
+    ranking_cache.set(chat_id, key, result, generation)
+    return result
+
+
+# ranking_cache key of the Elo rankings, dropped with every change
+ELO_RANKING_KEY = "elo"
+
+
+async def calculate_elo_ranking(session, chat_id):
+    """
+    Players of a chat by Elo rating, see src/ratings.py.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat ID
+
+    Returns:
+        List of rows with player_id, first_name, rating and games, best
+        player first
+    """
+    return (await session.execute(
+        select(
+            PlayerRating.player_id,
+            Player.first_name,
+            PlayerRating.rating,
+            PlayerRating.games,
+        ).join(
+            Player, Player.id == PlayerRating.player_id
+        ).where(
+            PlayerRating.chat_id == chat_id
+        ).order_by(
+            PlayerRating.rating.desc(), PlayerRating.games.desc(),
+            PlayerRating.player_id
+        )
+    )).all()
+
+
+def generate_elo_rankings_text(rankings):
+    return "".join(
+        f"{MEDALS.get(i, '')}{i}. {row.first_name} - "
+        f"Elo: {row.rating:.0f} ({row.games} played)\n"
+        for i, row in enumerate(rankings, 1)
+    )
+
+
+async def get_elo_rankings(session, chat_id):
+    """
+    Elo rankings of a chat and their rendered text, cached per chat.
+
+    Args:
+        session: SQLAlchemy async session, only queried on a cache miss
+        chat_id: Chat ID
+
+    Returns:
+        Tuple of (rankings, rankings_text) as returned by
+        calculate_elo_ranking and generate_elo_rankings_text
+    """
+    cached = ranking_cache.get(chat_id, ELO_RANKING_KEY)
+    if cached is not None:
+        return cached
+    generation = ranking_cache.generation(chat_id)
+    rankings = await calculate_elo_ranking(session, chat_id)
+    result = (rankings, generate_elo_rankings_text(rankings))
+    ranking_cache.set(chat_id, ELO_RANKING_KEY, result, generation)
+    return result
+
+
+# Players offered by the session pickers. A message can have at most 100
+# buttons, and the pickers keep a row for their controls.
+SESSION_ROSTER_SIZE = 60
+
+
+async def get_chat_roster(session, chat_id):
+    """
+    The players of a chat for the game session pickers, cached per chat.
+
+    These are the players with games in the chat, at most
+    SESSION_ROSTER_SIZE of them, the most active first.
+
+    Args:
+        session: SQLAlchemy async session, only queried on a cache miss
+        chat_id: Chat ID
+
+    Returns:
+        List of (player_id, name) tuples, sorted by name
+    """
+    cached = roster_cache.get(chat_id)
+    if cached is not None:
+        return cached
+    generation = roster_cache.generation(chat_id)
+    rows = (await session.execute(
+        select(Player.id, Player.first_name, Player.username)
+        .join(PlayerChatStats, PlayerChatStats.player_id == Player.id)
+        .where(PlayerChatStats.chat_id == chat_id)
+        .order_by((PlayerChatStats.wins + PlayerChatStats.losses).desc(),
+                  Player.id)
+        .limit(SESSION_ROSTER_SIZE)
+    )).all()
+    roster = sorted(
+        ((player_id, first_name or username or str(player_id))
+         for player_id, first_name, username in rows),
+        key=lambda player: (player[1].lower(), player[0]))
+    roster_cache.set(chat_id, None, roster, generation)
+    return roster
 
 
 async def report_developer(context, message):
@@ -116,54 +281,196 @@ async def report_developer(context, message):
         logger.error("Failed to notify developer: %s", notify_err)
 
 
-def generate_games_history_message(
+async def generate_games_history_message(
     session,
     chat_id: int,
     message: str = "",
     game_date: date = datetime.now().date(),
     include_delete_buttons: bool = True,
+    after_id: int | None = None,
+    before_id: int | None = None,
 ) -> tuple[str, InlineKeyboardMarkup | None]:
     """
     Create a formatted message and keyboard for displaying games by date with optional delete buttons.
 
+    Games are listed config.GAMES_PAGE_SIZE at a time in ID order, with
+    Previous/Next buttons. A page is read from the ID the previous one
+    ended at (keyset pagination), so a render only reads its own page of
+    games however busy the day was.
+
     Args:
-        session: SQLAlchemy session
+        session: SQLAlchemy async session
         chat_id: Chat ID to filter games by
         message: Message to prepend to the games list
         game_date: Date to filter games by
         include_delete_buttons: Whether to include delete buttons for each game
+        after_id: List the games after this game ID (Next)
+        before_id: List the games before this game ID (Previous)
 
     Returns:
-        Tuple of (formatted_message, keyboard_markup)
+        Tuple of (formatted_message, keyboard_markup); the message is
+        empty if there are no games on the page
     """
     formatted_message = message
     keyboard = []
+    page_size = config.GAMES_PAGE_SIZE
 
-    games = session.query(Game).filter(
+    conditions = [
         Game.date == game_date,
         Game.chat_id == chat_id,
-        Game.deleted_at.is_(None)  # Only show non-deleted games
-    ).all()
+        Game.deleted_at.is_(None),  # Only show non-deleted games
+    ]
+    if before_id is not None:
+        conditions.append(Game.id < before_id)
+        order = Game.id.desc()
+    else:
+        if after_id is not None:
+            conditions.append(Game.id > after_id)
+        order = Game.id
+
+    # Project just the columns the message needs, with both player names
+    # joined in, so a page is a single query. One game more than the page
+    # tells whether there is another page.
+    winner = aliased(Player)
+    loser = aliased(Player)
+    games = (await session.execute(
+        select(
+            Game.id,
+            winner.first_name.label("winner_name"),
+            loser.first_name.label("loser_name"),
+        ).join(
+            winner, Game.winner_id == winner.id
+        ).join(
+            loser, Game.loser_id == loser.id
+        ).where(
+            *conditions
+        ).order_by(order).limit(page_size + 1)
+    )).all()
 
     if not games:
         return "", None
 
+    more = len(games) > page_size
+    games = games[:page_size]
+    if before_id is not None:
+        games.reverse()
+        has_previous, has_next = more, True
+    else:
+        has_previous, has_next = after_id is not None, more
+
     for idx, game in enumerate(games, start=1):
         # Add game to message
         formatted_message += (
             f"{idx}. Game ID <b>{game.id}:</b> "
-            f"<b>{game.winner.first_name}</b> won "
-            f"<b>{game.loser.first_name}</b>\n"
+            f"<b>{game.winner_name}</b> won "
+            f"<b>{game.loser_name}</b>\n"
         )
 
         # Add delete button if requested
         if include_delete_buttons:
-            keyboard.append([InlineKeyboardButton(
-                text=with_emoji(f":wastebasket: Delete Game {game.id}"),
-                callback_data=f"delete_game_{game.id}"
-            )])
+            keyboard.append([delete_game_button(game.id)])
+
+    page_buttons = games_page_buttons(
+        game_date, games[0].id, games[-1].id, has_previous, has_next)
+    if page_buttons:
+        keyboard.append(page_buttons)
 
     return (
         formatted_message,
         InlineKeyboardMarkup(keyboard) if keyboard else None
-    )
\ No newline at end of file
+    )
+
+
+async def record_games(session, chat_id: int, game_date: date, results):
+    """
+    Insert games in a single statement, and count them in the player stats
+    and ratings.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat ID the games were played in
+        game_date: Date the games were played on
+        results: (winner_id, loser_id) pairs, one per game
+
+    Returns:
+        List of the new games with their IDs, in the order of results.
+        They aren't attached to the session.
+    """
+    rows = [
+        {
+            "winner_id": winner_id,
+            "loser_id": loser_id,
+            "date": game_date,
+            "chat_id": chat_id,
+        }
+        for winner_id, loser_id in results
+    ]
+    if not rows:
+        return []
+    # One multi-row INSERT with the IDs returned in the order of rows.
+    # SQLite can't promise that order, so there SQLAlchemy runs one INSERT
+    # per game instead.
+    inserted = (await session.execute(
+        insert(Game).returning(Game.id, sort_by_parameter_order=True),
+        rows
+    )).scalars().all()
+    games = [Game(id=game_id, **row) for game_id, row in zip(inserted, rows)]
+    await add_games_to_stats(session, games)
+    await add_games_to_ratings(session, chat_id, games)
+    invalidate_rankings_on_commit(session, chat_id, {game_date})
+    return games
+
+
+async def soft_delete_game(session, game_id: int, chat_id: int | None = None):
+    """
+    Mark a game as deleted and take it out of the player stats and ratings.
+
+    The update only matches games that aren't deleted yet, so pressing
+    delete twice can't count the game out of the stats twice.
+
+    Args:
+        session: SQLAlchemy async session
+        game_id: ID of the game to delete
+        chat_id: Only delete the game if it belongs to this chat
+
+    Returns:
+        The deleted game, or None if there was no such game to delete
+    """
+    conditions = [Game.id == game_id, Game.deleted_at.is_(None)]
+    if chat_id is not None:
+        conditions.append(Game.chat_id == chat_id)
+    game = await session.scalar(
+        update(Game).where(*conditions).values(
+            deleted_at=datetime.now()
+        ).returning(Game)
+    )
+    if game is None:
+        return None
+    await remove_games_from_stats(session, [game])
+    await replay_ratings(session, game.chat_id, game.id)
+    invalidate_rankings_on_commit(session, game.chat_id, {game.date})
+    return game
+
+
+async def get_deleted_game_ids(session, chat_id: int, game_ids) -> set[int]:
+    """
+    Which of the given games of a chat have been deleted.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat the games belong to
+        game_ids: IDs of the games to check
+
+    Returns:
+        Set of the IDs that are soft-deleted
+    """
+    if not game_ids:
+        return set()
+    result = await session.scalars(
+        select(Game.id).where(
+            Game.id.in_(game_ids),
+            Game.chat_id == chat_id,
+            Game.deleted_at.is_not(None),
+        )
+    )
+    return set(result)
@@ -1,60 +1,43 @@
-import os
 import re
-import traceback
 from datetime import date, datetime
 
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+import pytz
+from telegram import InlineKeyboardMarkup, Update
 from telegram.ext import (ContextTypes, ConversationHandler)
 
 from src.constants import WAITING_FOR_DATE
-from src.db import SessionLocal
+from src.db import AsyncSessionLocal, write_session
 from src.decorators import reject_if_private_chat
-from src.functions import calculate_ranking, generate_rankings_text
+from src.error_reporting import error_reporter
+from src.functions import (generate_games_history_message, get_chat_roster,
+                           get_deleted_game_ids, get_elo_rankings,
+                           get_rankings, ranking_period, soft_delete_game)
 from src.handlers.commands import add_me, help_command, show_menu
+from src.keyboards import (BACK_TO_MENU_KEYBOARD, BACK_TO_RANKINGS_KEYBOARD,
+                           CANCEL_DATE_KEYBOARD, RANKINGS_MENU_KEYBOARD,
+                           session_keyboard)
 from src.logging_config import logger
-from src.models import Game
-from src.utils import with_emoji
-from src.templates import HELP_MESSAGE
+from src.rate_limiter import COALESCE
+from src.sessions import (SESSION_KEY, new_session, save_session,
+                          session_text, summary_text)
+from src import templates
+
+# Game lines of the history messages, e.g. "1. Game ID 5: Alice won Bob"
+GAME_ID_PATTERN = re.compile(r'Game ID (\d+)')
 
 
 async def error_handler(
         update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle errors and log exception details."""
     logger.debug("error_handler() called")
-    logger.error("Exception occurred:", exc_info=context.error)
 
     if isinstance(update, Update) and getattr(update, "message", None):
         await update.message.reply_text(  # type: ignore
-            with_emoji(
-                ":warning: Something went wrong. "
-                "The developers have been notified.")
+            templates.ERROR_REPLY_TEXT
         )
 
-    traceback_str = ''.join(
-        traceback.format_exception(
-            None, context.error, context.error.__traceback__  # type: ignore
-        )
-    )
-    logger.debug("Traceback details:\n%s", traceback_str)
-    # Notify the developer
-    developer_id = os.getenv("DEVELOPER_ID")
-    error_message = (
-        f"🚨 <b>Error in Game Manager Bot</b>\n"
-        f"<b>User:</b> "
-        f"{getattr(getattr(update, 'effective_user', None), 'id', 'N/A')}\n"
-        f"<b>Chat:</b> "
-        f"{getattr(getattr(update, 'effective_chat', None), 'id', 'N/A')}\n"
-        f"<b>Error:</b> <code>{context.error}</code>"
-    )
-    try:
-        if developer_id is not None:
-            await context.bot.send_message(
-                chat_id=int(developer_id),
-                text=error_message,
-                parse_mode="HTML"
-            )
-    except Exception as notify_err:
-        logger.error("Failed to notify developer: %s", notify_err)
+    # Logs the error and notifies the developer, grouped with its repeats
+    await error_reporter.report(context.error, update)
     return
 
 
@@ -71,73 +54,119 @@ async def handle_delete_button(
     chat_id = query.message.chat_id
     game_id = int(query.data.split("_")[2])
 
-    session = SessionLocal()
-    game = session.query(Game).filter_by(id=game_id, chat_id=chat_id).first()
+    lines = (query.message.text or "").splitlines()
+    # Game IDs listed in the message, with the line they're on
+    line_game_ids = [
+        int(match.group(1)) if (match := GAME_ID_PATTERN.search(line))
+        else None
+        for line in lines
+    ]
+
+    # The session is closed, rolling back a delete that matched no game,
+    # before anything is sent: on SQLite the UPDATE holds the write lock
+    # until the transaction ends, and a reply can wait on the rate limiter
+    async with write_session() as session:
+        game = await soft_delete_game(session, game_id, chat_id)
+        if game:
+            await session.commit()
+            # Strike out every deleted game of the message, not only this
+            # one. The message in the callback may predate the edits of
+            # earlier presses, which may still be queued.
+            deleted_ids = await get_deleted_game_ids(
+                session, chat_id,
+                [i for i in line_game_ids if i is not None])
 
     if not game:
         # This is the case when user click on a previous message keyboard
         # to delete a game that is already deleted
         await query.message.reply_text(
-            with_emoji(f":x: Game ID {game_id} not found or already deleted."))
-        session.close()
+            templates.GAME_NOT_FOUND_OR_DELETED_TEXT.format(game_id=game_id))
         return
 
-    game.deleted_at = datetime.now()  # type: ignore
-    session.add(game)
-    session.commit()
-
-    if not query.message.text:
+    if not lines:
         logger.debug("No message text found")
-        session.close()
         return
 
-    # Reconstruct the message with strikethrough for deleted game
-    # Mark the deleted game with <s> and renumber only non-strikethrough lines
-    lines = query.message.text.splitlines()
+    # Reconstruct the message with strikethrough for deleted games
+    # and renumber the games left
     new_lines = []
     not_deleted_counter = 1
-    # FUTURE: Check if it is better to change the line on the lines
-    # list instead of creating a new list
-    for line in lines:
-        if f"Game ID {game_id}" in line:
-            # Remove the number prefix (e.g., "1. ", "2. ") and add strikethrough
-            clean_line = re.sub(r'^\d+\.\s*', '', line)
+    for line, line_game_id in zip(lines, line_game_ids):
+        if line_game_id is None:
+            new_lines.append(line)
+            continue
+        # Remove the number prefix (e.g., "1. ", "2. ")
+        clean_line = re.sub(r'^\d+\.\s*', '', line)
+        if line_game_id in deleted_ids:
             new_lines.append(f"<s>{clean_line}</s>")
-        # If line is previously strikethrough, keep it as is
-        elif line.startswith("Game ID"):
-            new_lines.append(f"<s>{line}</s>")
-        # If line is a game line, renumber it
-        elif re.match(r'^\d+\.\s*Game ID', line):
-            clean_line = re.sub(r'^\d+\.\s*', '', line)
+        else:
             new_lines.append(f"{not_deleted_counter}. {clean_line}")
             not_deleted_counter += 1
-        else:
-            new_lines.append(line)
     message_text = "\n".join(new_lines)
 
-    # Remove the delete button for the deleted game
+    # Remove the delete buttons of the deleted games
+    deleted_callbacks = {f"delete_game_{i}" for i in deleted_ids}
     if not query.message.reply_markup:
         keyboard = []
     else:
         keyboard = query.message.reply_markup.inline_keyboard
         keyboard = [
             [button for button in row
-             if button.callback_data != f"delete_game_{game_id}"]
+             if button.callback_data not in deleted_callbacks]
             for row in keyboard
         ]
         keyboard = [row for row in keyboard if row]
 
-    # Edit the message with HTML parse mode to show strikethrough
-    await query.edit_message_text(
+    # Edit the message with HTML parse mode to show strikethrough.
+    # Queued edits of the message are coalesced: under flood limits only
+    # the newest goes out, and it includes every deletion.
+    await context.bot.edit_message_text(
         message_text,
+        chat_id=chat_id,
+        message_id=query.message.message_id,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None
+        reply_markup=InlineKeyboardMarkup(keyboard) if keyboard else None,
+        rate_limit_args=COALESCE,
     )
-
-    session.close()
     return
 
 
+@reject_if_private_chat
+async def handle_games_page_button(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle the Previous/Next buttons of a games history message."""
+    logger.debug("handle_games_page_button() called")
+    query = update.callback_query
+    if not query or not query.message or not query.data:
+        logger.debug("No callback query or message or data found")
+        return
+    await query.answer()
+    chat_id = query.message.chat_id
+    # e.g. games_next_2024-05-01_120
+    _, direction, date_str, game_id = query.data.split("_")
+    game_date = date.fromisoformat(date_str)
+    page = {"after_id" if direction == "next" else "before_id": int(game_id)}
+    header = templates.GAMES_HISTORY_HEADER.format(date=game_date)
+
+    async with AsyncSessionLocal() as session:
+        games_message, games_keyboard = await generate_games_history_message(
+            session, chat_id, message=header, game_date=game_date, **page)
+        if not games_message:
+            # The games of that page were deleted since, start over
+            games_message, games_keyboard = (
+                await generate_games_history_message(
+                    session, chat_id, message=header, game_date=game_date))
+
+    await context.bot.edit_message_text(
+        games_message or templates.NO_GAMES_ON_DATE_TEXT,
+        chat_id=chat_id,
+        message_id=query.message.message_id,
+        parse_mode="HTML",
+        reply_markup=games_keyboard,
+        rate_limit_args=COALESCE,
+    )
+
+
 @reject_if_private_chat
 async def handle_menu_rankings(
         update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -148,31 +177,8 @@ async def handle_menu_rankings(
 
     await update.callback_query.answer()
 
-    rankings_text = with_emoji(
-        ":trophy: <b>Rankings Options</b>\n\n"
-        "Choose which rankings you want to view:"
-    )
-
-    keyboard = [
-        [InlineKeyboardButton(
-            text=with_emoji(":calendar: Today"),
-            callback_data="rank_today"
-        )],
-        [InlineKeyboardButton(
-            text=with_emoji(":date: Custom Date"),
-            callback_data="rank_enter_date"
-        )],
-        [InlineKeyboardButton(
-            text=with_emoji(":chart_with_upwards_trend: All Time"),
-            callback_data="rank_all_time"
-        )],
-        [InlineKeyboardButton(
-            text=with_emoji(":left_arrow: Back to Menu"),
-            callback_data="menu_back"
-        )]
-    ]
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    rankings_text = templates.RANKINGS_MENU_TEXT
+    reply_markup = RANKINGS_MENU_KEYBOARD
 
     await update.callback_query.edit_message_text(
         rankings_text,
@@ -188,7 +194,7 @@ async def handle_rank_callback(
     """Handle ranking-related callback queries.
 
     Handler Assignment:
-    - CallbackQueryHandler handles: rank_today, rank_all_time, menu_back (immediate responses)
+    - CallbackQueryHandler handles: rank_today, rank_week, rank_month, rank_all_time, rank_elo, menu_back (immediate responses)
     - ConversationHandler handles: rank_enter_date (starts conversation), rank_cancel (ends conversation)
 
     Conversation State Management:
@@ -203,26 +209,26 @@ async def handle_rank_callback(
     await query.answer()
 
     if query.data == "rank_today":
-        # Calculate rankings for today
-        await show_rankings_for_date(update, context, datetime.now().date())
+        # Calculate rankings for today, in the same timezone as /rank
+        today = datetime.now(pytz.timezone("Asia/Tehran")).date()
+        await show_rankings_for_date(update, context, today)
+    elif query.data in ("rank_week", "rank_month"):
+        # Calculate rankings for the last 7 or 30 days
+        today = datetime.now(pytz.timezone("Asia/Tehran")).date()
+        start_date, end_date = ranking_period(query.data[len("rank_"):], today)
+        await show_rankings_for_range(update, context, start_date, end_date)
     elif query.data == "rank_all_time":
         # Calculate rankings for all time
         await show_rankings_all_time(update, context)
+    elif query.data == "rank_elo":
+        # Read the stored Elo ratings
+        await show_elo_rankings(update, context)
     elif query.data == "rank_enter_date":
         # Ask user to enter a date manually
         await query.edit_message_text(
-            with_emoji(
-                ":date: <b>Enter Date</b>\n\n"
-                "Please enter a date in the format YYYY-MM-DD "
-                "(e.g., 2024-01-15):"
-            ),
+            templates.ENTER_DATE_TEXT,
             parse_mode="HTML",
-            reply_markup=InlineKeyboardMarkup([[
-                InlineKeyboardButton(
-                    text=with_emoji(":x: Cancel"),
-                    callback_data="rank_cancel"
-                )
-            ]])
+            reply_markup=CANCEL_DATE_KEYBOARD
         )
         # Set conversation state to wait for date input
         if context.user_data is not None:
@@ -269,18 +275,9 @@ async def handle_date_input(
     except ValueError:
         if update.message:
             await update.message.reply_text(
-                with_emoji(
-                    ":warning: <b>Invalid Date Format</b>\n\n"
-                    "Please enter a date in YYYY-MM-DD format "
-                    "(e.g., 2024-01-15):"
-                ),
+                templates.INVALID_DATE_INPUT_TEXT,
                 parse_mode="HTML",
-                reply_markup=InlineKeyboardMarkup([[
-                    InlineKeyboardButton(
-                        text=with_emoji(":x: Cancel"),
-                        callback_data="rank_cancel"
-                    )
-                ]])
+                reply_markup=CANCEL_DATE_KEYBOARD
             )
         return WAITING_FOR_DATE
 
@@ -297,30 +294,19 @@ async def show_rankings_for_date(
     else:
         return
 
-    session = SessionLocal()
-    rankings = calculate_ranking(session, chat_id, date)
-    logger.debug(f"Rankings: {rankings}")
+    async with AsyncSessionLocal() as session:
+        rankings, rankings_body = await get_rankings(session, chat_id, date)
+    logger.debug("Rankings: %s", rankings)
 
     if not rankings:
-        rankings_text = with_emoji(
-            f":calendar: <b>Rankings for {date.strftime('%Y-%m-%d')}</b>\n\n"
-            "No games played on this date in this chat."
-        )
+        rankings_text = templates.NO_GAMES_ON_DATE_RANKINGS_TEXT.format(
+            date=date.strftime('%Y-%m-%d'))
     else:
-        rankings_text = with_emoji(
-            f":calendar: <b>Rankings for {date.strftime('%Y-%m-%d')}</b>\n\n"
-        )
-        rankings_text += generate_rankings_text(rankings)
+        rankings_text = templates.DATE_RANKINGS_HEADER.format(
+            date=date.strftime('%Y-%m-%d'))
+        rankings_text += rankings_body
 
-    # Add back button
-    keyboard = [[
-        InlineKeyboardButton(
-            text=with_emoji(":left_arrow: Back to Rankings"),
-            callback_data="menu_rankings"
-        )
-    ]]
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    reply_markup = BACK_TO_RANKINGS_KEYBOARD
 
     if update.callback_query:
         await update.callback_query.edit_message_text(
@@ -334,8 +320,41 @@ async def show_rankings_for_date(
             parse_mode="HTML",
             reply_markup=reply_markup
         )
+    return
 
-    session.close()
+@reject_if_private_chat
+async def show_rankings_for_range(
+        update: Update,
+        context: ContextTypes.DEFAULT_TYPE,
+        start_date: date,
+        end_date: date):
+    """Display rankings for the dates from start_date to end_date."""
+    logger.debug("show_rankings_for_range() called")
+    if update.effective_chat:
+        chat_id = update.effective_chat.id
+    else:
+        return
+
+    async with AsyncSessionLocal() as session:
+        rankings, rankings_body = await get_rankings(
+            session, chat_id, start_date, end_date)
+    logger.debug("Rankings: %s", rankings)
+
+    dates = {"start": start_date.strftime('%Y-%m-%d'),
+             "end": end_date.strftime('%Y-%m-%d')}
+    if not rankings:
+        rankings_text = templates.NO_GAMES_IN_RANGE_RANKINGS_TEXT.format(
+            **dates)
+    else:
+        rankings_text = templates.RANGE_RANKINGS_HEADER.format(**dates)
+        rankings_text += rankings_body
+
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            rankings_text,
+            parse_mode="HTML",
+            reply_markup=BACK_TO_RANKINGS_KEYBOARD
+        )
     return
 
 @reject_if_private_chat
@@ -349,540 +368,256 @@ async def show_rankings_all_time(
     else:
         return
 
-    session = SessionLocal()
-    rankings = calculate_ranking(session, chat_id)
-    logger.debug(f"Rankings: {rankings}")
+    async with AsyncSessionLocal() as session:
+        rankings, rankings_body = await get_rankings(session, chat_id)
+    logger.debug("Rankings: %s", rankings)
 
     if not rankings:
-        rankings_text = with_emoji(
-            ":no_entry: No games have been played yet in this chat."
-        )
+        rankings_text = templates.NO_GAMES_ALL_TIME_TEXT
     else:
-        rankings_text = with_emoji(
-            ":chart_with_upwards_trend: <b>All-Time Rankings</b>\n\n"
-        )
-        rankings_text += generate_rankings_text(rankings)
+        rankings_text = templates.ALL_TIME_RANKINGS_HEADER
+        rankings_text += rankings_body
+
+    reply_markup = BACK_TO_RANKINGS_KEYBOARD
 
-    # Add back button
-    keyboard = [[
-        InlineKeyboardButton(
-            text=with_emoji(":left_arrow: Back to Rankings"),
-            callback_data="menu_rankings"
+    if update.callback_query:
+        await update.callback_query.edit_message_text(
+            rankings_text,
+            parse_mode="HTML",
+            reply_markup=reply_markup
         )
-    ]]
+    return
+
+
+@reject_if_private_chat
+async def show_elo_rankings(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Display the Elo rankings."""
+    logger.debug("show_elo_rankings() called")
+    if update.effective_chat:
+        chat_id = update.effective_chat.id
+    else:
+        return
 
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    async with AsyncSessionLocal() as session:
+        rankings, rankings_body = await get_elo_rankings(session, chat_id)
+    logger.debug("Rankings: %s", rankings)
+
+    if not rankings:
+        rankings_text = templates.NO_GAMES_ALL_TIME_TEXT
+    else:
+        rankings_text = templates.ELO_RANKINGS_HEADER + rankings_body
 
     if update.callback_query:
         await update.callback_query.edit_message_text(
             rankings_text,
             parse_mode="HTML",
-            reply_markup=reply_markup
+            reply_markup=BACK_TO_RANKINGS_KEYBOARD
         )
+    return
+
+
+async def _edit_session_message(context, query, text, reply_markup=None):
+    # Presses come in quickly during a game night. Under flood limits only
+    # the newest edit of the message goes out, so every edit of a session
+    # message is coalesced, or an older one could overwrite the summary.
+    await context.bot.edit_message_text(
+        text,
+        chat_id=query.message.chat_id,
+        message_id=query.message.message_id,
+        parse_mode="HTML",
+        reply_markup=reply_markup,
+        rate_limit_args=COALESCE,
+    )
+
 
-    session.close()
+async def _show_session(context, query, game_session):
+    """Edit the session message to the session's current state."""
+    async with AsyncSessionLocal() as session:
+        roster = await get_chat_roster(session, query.message.chat_id)
+    await _edit_session_message(
+        context, query, session_text(game_session, roster),
+        session_keyboard(roster, len(game_session["games"]),
+                         game_session["winner_id"]))
+
+
+async def _running_session(context, query):
+    """The chat's session, or None after saying there is none."""
+    game_session = context.chat_data.get(SESSION_KEY)
+    if game_session is None:
+        await _edit_session_message(
+            context, query, templates.NO_ACTIVE_SESSION_TEXT,
+            BACK_TO_MENU_KEYBOARD)
+    return game_session
+
+
+@reject_if_private_chat
+async def handle_menu_start_session(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle start session menu button press."""
+    logger.debug("handle_menu_start_session() called")
+    query = update.callback_query
+    if not query or not query.message:
+        return
+
+    if SESSION_KEY in context.chat_data:
+        await _edit_session_message(
+            context, query, templates.SESSION_ALREADY_RUNNING_TEXT,
+            BACK_TO_MENU_KEYBOARD)
+        return
+
+    async with AsyncSessionLocal() as session:
+        roster = await get_chat_roster(session, query.message.chat_id)
+    if not roster:
+        await _edit_session_message(
+            context, query, templates.NO_SESSION_PLAYERS_TEXT,
+            BACK_TO_MENU_KEYBOARD)
+        return
+
+    game_session = context.chat_data[SESSION_KEY] = new_session()
+    await _edit_session_message(
+        context, query, session_text(game_session, roster),
+        session_keyboard(roster, 0))
+    return
+
+
+@reject_if_private_chat
+async def handle_session_winner(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle winner selection in session."""
+    logger.debug("handle_session_winner() called")
+    query = update.callback_query
+    if not query or not query.message or not query.data:
+        return
+    await query.answer()
+
+    game_session = await _running_session(context, query)
+    if game_session is None:
+        return
+    game_session["winner_id"] = int(query.data.rsplit("_", 1)[1])
+    await _show_session(context, query, game_session)
     return
 
 
-# async def handle_menu_start_session(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle start session menu button press."""
-#     if not update.callback_query:
-#         return
-
-#     await update.callback_query.answer()
-
-#     # Check if a session is already running
-#     chat_id = update.effective_chat.id
-#     if context.user_data.get(f'session_{chat_id}'):
-#         await update.callback_query.edit_message_text(
-#             with_emoji(
-#                 ":warning: *Session Already Running*\n\n"
-#                 "A session is already active in this chat. "
-#                 "Please end the current session first."
-#             ),
-#             parse_mode="MarkdownV2",
-#             reply_markup=InlineKeyboardMarkup([[
-#                 InlineKeyboardButton(
-#                     text=with_emoji(":left_arrow: Back to Menu"),
-#                     callback_data="menu_back"
-#                 )
-#             ]])
-#         )
-#         return
-
-#     # Initialize session
-#     context.user_data[f'session_{chat_id}'] = {
-#         'games': [],
-#         'message_id': None
-#     }
-
-#     # Send initial session message
-#     session_text = with_emoji(
-#         ":video_game: *Game Session Started*\n\n"
-#         "No games played yet.\n\n"
-#         "Choose the winner of the first game:"
-#     )
-
-#     # Get all players for the winner selection
-#     session = SessionLocal()
-#     try:
-#         players = session.query(Player).all()
-#         keyboard = []
-#         for player in players:
-#             if player and player.first_name:
-#                 keyboard.append([InlineKeyboardButton(
-#                     text=player.first_name,
-#                     callback_data=f"session_winner_{player.id}"
-#                 )])
-
-#         # Add cancel button
-#         keyboard.append([
-#             InlineKeyboardButton(
-#                 text=with_emoji(":x: End Session"),
-#                 callback_data="session_end"
-#             )
-#         ])
-
-#         reply_markup = InlineKeyboardMarkup(keyboard)
-
-#         message = await update.callback_query.edit_message_text(
-#             session_text,
-#             parse_mode="MarkdownV2",
-#             reply_markup=reply_markup
-#         )
-
-#         # Store message ID for updates
-#         context.user_data[f'session_{chat_id}']['message_id'] = message.message_id
-
-#     finally:
-#         session.close()
-
-
-# async def handle_session_winner(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle winner selection in session."""
-#     query = update.callback_query
-#     if not query or not query.data:
-#         return
-
-#     await query.answer()
-
-#     # Extract winner ID
-#     winner_id = int(query.data.replace("session_winner_", ""))
-
-#     # Store winner in context
-#     chat_id = update.effective_chat.id
-#     context.user_data[f'session_{chat_id}']['current_winner'] = winner_id
-
-#     # Get winner name
-#     session = SessionLocal()
-#     try:
-#         winner = session.query(Player).filter_by(id=winner_id).first()
-#         if not winner:
-#             await query.edit_message_text("Player not found.")
-#             return
-
-#         # Update session message to show winner selection
-#         session_data = context.user_data[f'session_{chat_id}']
-#         games_text = ""
-#         if session_data['games']:
-#             games_text = "\n\n*Games Played:*\n"
-#             for i, game in enumerate(session_data['games'], 1):
-#                 games_text += f"{i}\\. {game['winner']} won against {game['loser']}\n"
-
-#         session_text = with_emoji(
-#             f":video_game: *Game Session*\n\n"
-#             f"Current game: {winner.first_name} won...\n"
-#             f"{games_text}\n"
-#             f"Choose the loser:"
-#         )
-
-#         # Get all players for loser selection (excluding winner)
-#         players = session.query(Player).filter(Player.id != winner_id).all()
-#         keyboard = []
-#         for player in players:
-#             if player and player.first_name:
-#                 keyboard.append([InlineKeyboardButton(
-#                     text=player.first_name,
-#                     callback_data=f"session_loser_{player.id}"
-#                 )])
-
-#         # Add cancel button
-#         keyboard.append([
-#             InlineKeyboardButton(
-#                 text=with_emoji(":x: Cancel"),
-#                 callback_data="session_cancel_game"
-#             )
-#         ])
-
-#         reply_markup = InlineKeyboardMarkup(keyboard)
-
-#         await query.edit_message_text(
-#             session_text,
-#             parse_mode="MarkdownV2",
-#             reply_markup=reply_markup
-#         )
-
-#     finally:
-#         session.close()
-
-
-# async def handle_session_loser(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle loser selection in session."""
-#     query = update.callback_query
-#     if not query or not query.data:
-#         return
-
-#     await query.answer()
-
-#     # Extract loser ID
-#     loser_id = int(query.data.replace("session_loser_", ""))
-
-#     # Get session data
-#     chat_id = update.effective_chat.id
-#     session_data = context.user_data[f'session_{chat_id}']
-#     winner_id = session_data.get('current_winner')
-
-#     if not winner_id:
-#         await query.edit_message_text("No winner selected.")
-#         return
-
-#     # Get player names
-#     session = SessionLocal()
-#     try:
-#         winner = session.query(Player).filter_by(id=winner_id).first()
-#         loser = session.query(Player).filter_by(id=loser_id).first()
-
-#         if not winner or not loser:
-#             await query.edit_message_text("Player not found.")
-#             return
-
-#         if not winner.first_name or not loser.first_name:
-#             await query.edit_message_text("Player name not found.")
-#             return
-
-#         # Add game to session
-#         game = {
-#             'winner': winner.first_name,
-#             'loser': loser.first_name,
-#             'winner_id': winner_id,
-#             'loser_id': loser_id
-#         }
-#         session_data['games'].append(game)
-
-#         # Clear current winner
-#         session_data.pop('current_winner', None)
-
-#         # Update session message
-#         games_text = ""
-#         if session_data['games']:
-#             games_text = "\n\n*Games Played:*\n"
-#             for i, game in enumerate(session_data['games'], 1):
-#                 delete_button = InlineKeyboardButton(
-#                     text=with_emoji(":wastebasket:"),
-#                     callback_data=f"session_delete_game_{i-1}"
-#                 )
-#                 games_text += (
-#                     f"{i}\\. {game['winner']} won against {game['loser']} "
-#                     f"[Delete](callback_data:session_delete_game_{i-1})\n"
-#                 )
-
-#         session_text = with_emoji(
-#             f":video_game: *Game Session*\n\n"
-#             f"Game recorded: {winner.first_name} won against {loser.first_name}\n"
-#             f"{games_text}\n"
-#             f"Choose the winner of the next game:"
-#         )
-
-#         # Get all players for next winner selection
-#         players = session.query(Player).all()
-#         keyboard = []
-#         for player in players:
-#             keyboard.append([InlineKeyboardButton(
-#                 text=player.first_name,
-#                 callback_data=f"session_winner_{player.id}"
-#             )])
-
-#         # Add end session button
-#         keyboard.append([
-#             InlineKeyboardButton(
-#                 text=with_emoji(":stop_button: End Session"),
-#                 callback_data="session_end"
-#             )
-#         ])
-
-#         reply_markup = InlineKeyboardMarkup(keyboard)
-
-#         await query.edit_message_text(
-#             session_text,
-#             parse_mode="MarkdownV2",
-#             reply_markup=reply_markup
-#         )
-
-#     finally:
-#         session.close()
-
-
-# async def handle_session_delete_game(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle game deletion in session."""
-#     query = update.callback_query
-#     if not query or not query.data:
-#         return
-
-#     await query.answer()
-
-#     # Extract game index
-#     game_index = int(query.data.replace("session_delete_game_", ""))
-
-#     # Get session data
-#     chat_id = update.effective_chat.id
-#     session_data = context.user_data[f'session_{chat_id}']
-
-#     if game_index < len(session_data['games']):
-#         # Remove the game
-#         deleted_game = session_data['games'].pop(game_index)
-
-#         # Update session message
-#         games_text = ""
-#         if session_data['games']:
-#             games_text = "\n\n*Games Played:*\n"
-#             for i, game in enumerate(session_data['games'], 1):
-#                 games_text += (
-#                     f"{i}\\. {game['winner']} won against {game['loser']}\n"
-#                 )
-
-#         session_text = with_emoji(
-#             f":video_game: *Game Session*\n\n"
-#             f"Game deleted: {deleted_game['winner']} vs {deleted_game['loser']}\n"
-#             f"{games_text}\n"
-#             f"Choose the winner of the next game:"
-#         )
-
-#         # Get all players for next winner selection
-#         session = SessionLocal()
-#         try:
-#             players = session.query(Player).all()
-#             keyboard = []
-#             for player in players:
-#                 keyboard.append([InlineKeyboardButton(
-#                     text=player.first_name,
-#                     callback_data=f"session_winner_{player.id}"
-#                 )])
-
-#             # Add end session button
-#             keyboard.append([
-#                 InlineKeyboardButton(
-#                     text=with_emoji(":stop_button: End Session"),
-#                     callback_data="session_end"
-#                 )
-#             ])
-
-#             reply_markup = InlineKeyboardMarkup(keyboard)
-
-#             await query.edit_message_text(
-#                 session_text,
-#                 parse_mode="MarkdownV2",
-#                 reply_markup=reply_markup
-#             )
-
-#         finally:
-#             session.close()
-
-
-# async def handle_session_end(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle session end."""
-#     query = update.callback_query
-#     if not query:
-#         return
-
-#     await query.answer()
-
-#     # Get session data
-#     chat_id = update.effective_chat.id
-#     session_data = context.user_data.get(f'session_{chat_id}')
-
-#     if not session_data:
-#         await query.edit_message_text(
-#             with_emoji(":warning: No active session found."),
-#             parse_mode="MarkdownV2"
-#         )
-#         return
-
-#     # Save games to database
-#     session = SessionLocal()
-#     try:
-#         games_saved = 0
-#         for game in session_data['games']:
-#             new_game = Game(
-#                 winner_id=game['winner_id'],
-#                 loser_id=game['loser_id'],
-#                 date=datetime.now().date(),
-#                 chat_id=chat_id
-#             )
-#             session.add(new_game)
-#             games_saved += 1
-
-#         session.commit()
-
-#         # Show final summary
-#         games_text = ""
-#         if session_data['games']:
-#             games_text = "\n\n*Games Played:*\n"
-#             for i, game in enumerate(session_data['games'], 1):
-#                 games_text += (
-#                     f"{i}\\. {game['winner']} won against {game['loser']}\n"
-#                 )
-
-#         summary_text = with_emoji(
-#             f":stop_button: *Session Ended*\n\n"
-#             f"Total games: {len(session_data['games'])}\n"
-#             f"Games saved: {games_saved}\n"
-#             f"{games_text}"
-#         )
-
-#         # Clear session data
-#         if context.user_data:
-#             context.user_data.pop(f'session_{chat_id}', None)
-
-#         await query.edit_message_text(
-#             summary_text,
-#             parse_mode="MarkdownV2",
-#             reply_markup=InlineKeyboardMarkup([[
-#                 InlineKeyboardButton(
-#                     text=with_emoji(":left_arrow: Back to Menu"),
-#                     callback_data="menu_back"
-#                 )
-#             ]])
-#         )
-
-#     except Exception as e:
-#         session.rollback()
-#         logger.error(f"Error saving session games: {e}")
-#         await query.edit_message_text(
-#             with_emoji(":warning: Error saving games to database."),
-#             parse_mode="MarkdownV2"
-#         )
-#     finally:
-#         session.close()
-
-
-# async def handle_session_cancel_game(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle game cancellation in session."""
-#     query = update.callback_query
-#     if not query:
-#         return
-
-#     await query.answer()
-
-#     # Clear current winner and go back to winner selection
-#     chat_id = update.effective_chat.id
-#     session_data = context.user_data[f'session_{chat_id}']
-#     if session_data:
-#         session_data.pop('current_winner', None)
-
-#     # Update session message
-#     games_text = ""
-#     if session_data['games']:
-#         games_text = "\n\n*Games Played:*\n"
-#         for i, game in enumerate(session_data['games'], 1):
-#             games_text += f"{i}\\. {game['winner']} won against {game['loser']}\n"
-
-#     session_text = with_emoji(
-#         f":video_game: *Game Session*\n\n"
-#         f"Game cancelled.\n"
-#         f"{games_text}\n"
-#         f"Choose the winner of the next game:"
-#     )
-
-#     # Get all players for winner selection
-#     session = SessionLocal()
-#     try:
-#         players = session.query(Player).all()
-#         keyboard = []
-#         for player in players:
-#             if player and player.first_name:
-#                 keyboard.append([InlineKeyboardButton(
-#                     text=player.first_name,
-#                     callback_data=f"session_winner_{player.id}"
-#                 )])
-
-#         # Add end session button
-#         keyboard.append([
-#             InlineKeyboardButton(
-#                 text=with_emoji(":stop_button: End Session"),
-#                 callback_data="session_end"
-#             )
-#         ])
-
-#         reply_markup = InlineKeyboardMarkup(keyboard)
-
-#         await query.edit_message_text(
-#             session_text,
-#             parse_mode="MarkdownV2",
-#             reply_markup=reply_markup
-#         )
-
-#     finally:
-#         session.close()
-
-
-# async def handle_menu_end_session(
-#         update: Update, context: ContextTypes.DEFAULT_TYPE):
-#     """Handle end session menu button press."""
-#     if not update.callback_query:
-#         return
-
-#     await update.callback_query.answer()
-
-#     # Check if a session is running
-#     chat_id = update.effective_chat.id
-#     session_data = context.user_data.get(f'session_{chat_id}')
-
-#     if not session_data:
-#         await update.callback_query.edit_message_text(
-#             with_emoji(
-#                 ":warning: *No Active Session*\n\n"
-#                 "There is no session running in this chat."
-#             ),
-#             parse_mode="MarkdownV2",
-#             reply_markup=InlineKeyboardMarkup([[
-#                 InlineKeyboardButton(
-#                     text=with_emoji(":left_arrow: Back to Menu"),
-#                     callback_data="menu_back"
-#                 )
-#             ]])
-#         )
-#         return
-
-#     # Show session summary without buttons
-#     games_text = ""
-#     if session_data['games']:
-#         games_text = "\n\n*Games Played:*\n"
-#         for i, game in enumerate(session_data['games'], 1):
-#             games_text += f"{i}\\. {game['winner']} won against {game['loser']}\n"
-
-#     summary_text = with_emoji(
-#         f":stop_button: *Session Summary*\n\n"
-#         f"Total games: {len(session_data['games'])}\n"
-#         f"{games_text}\n"
-#         f"Session is still active. Use the session controls to end it."
-#     )
-
-#     await update.callback_query.edit_message_text(
-#         summary_text,
-#         parse_mode="MarkdownV2",
-#         reply_markup=InlineKeyboardMarkup([[
-#             InlineKeyboardButton(
-#                 text=with_emoji(":left_arrow: Back to Menu"),
-#                 callback_data="menu_back"
-#             )
-#         ]])
-#     )
+@reject_if_private_chat
+async def handle_session_loser(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle loser selection in session: the game is added to it."""
+    logger.debug("handle_session_loser() called")
+    query = update.callback_query
+    if not query or not query.message or not query.data:
+        return
+    await query.answer()
+
+    game_session = await _running_session(context, query)
+    if game_session is None:
+        return
+    winner_id = game_session["winner_id"]
+    loser_id = int(query.data.rsplit("_", 1)[1])
+    # A second tap on a loser button, after its game was added
+    if winner_id is None or loser_id == winner_id:
+        return
+
+    async with AsyncSessionLocal() as session:
+        names = dict(await get_chat_roster(session, query.message.chat_id))
+    game_session["games"].append({
+        "winner_id": winner_id,
+        "loser_id": loser_id,
+        "winner": names.get(winner_id, "?"),
+        "loser": names.get(loser_id, "?"),
+        "date": datetime.now(pytz.timezone("Asia/Tehran")).date().isoformat(),
+    })
+    game_session["winner_id"] = None
+    await _show_session(context, query, game_session)
+    return
+
+
+@reject_if_private_chat
+async def handle_session_delete_game(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle undoing the last game of the session."""
+    logger.debug("handle_session_delete_game() called")
+    query = update.callback_query
+    if not query or not query.message or not query.data:
+        return
+    await query.answer()
+
+    game_session = await _running_session(context, query)
+    if game_session is None:
+        return
+    game_index = int(query.data.rsplit("_", 1)[1])
+    # Only the last game can be undone; a repeated tap finds it gone
+    if game_index != len(game_session["games"]) - 1:
+        return
+    game_session["games"].pop()
+    await _show_session(context, query, game_session)
+    return
+
+
+@reject_if_private_chat
+async def handle_session_cancel_game(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle game cancellation in session: pick the winner again."""
+    logger.debug("handle_session_cancel_game() called")
+    query = update.callback_query
+    if not query or not query.message:
+        return
+    await query.answer()
+
+    game_session = await _running_session(context, query)
+    if game_session is None:
+        return
+    game_session["winner_id"] = None
+    await _show_session(context, query, game_session)
+    return
+
+
+async def _end_session(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    game_session = context.chat_data.get(SESSION_KEY)
+    # A second tap on End Session, after the session was saved. The query
+    # was answered, and the summary of the games stays on the message.
+    if game_session is None:
+        return
+
+    # Every game of the session in one transaction. If it fails the
+    # session stays, so ending it again retries.
+    async with write_session() as session:
+        recorded = await save_session(
+            session, query.message.chat_id, game_session)
+        await session.commit()
+    context.chat_data.pop(SESSION_KEY, None)
+    logger.info("Session ended in chat %s with %d games",
+                query.message.chat_id, len(recorded))
+
+    await _edit_session_message(
+        context, query, summary_text(game_session, recorded),
+        BACK_TO_MENU_KEYBOARD)
+    return
+
+
+@reject_if_private_chat
+async def handle_session_end(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle session end: record its games."""
+    logger.debug("handle_session_end() called")
+    query = update.callback_query
+    if not query or not query.message:
+        return
+    await query.answer()
+    await _end_session(update, context)
+    return
+
+
+@reject_if_private_chat
+async def handle_menu_end_session(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handle end session menu button press."""
+    logger.debug("handle_menu_end_session() called")
+    if not update.callback_query or not update.callback_query.message:
+        return
+    await _end_session(update, context)
+    return
 
 
 @reject_if_private_chat
@@ -901,17 +636,9 @@ async def handle_menu_add_me(
 
     # Show success message and back button
     await update.callback_query.edit_message_text(
-        with_emoji(
-            "<b>:white_check_mark: Registration Complete</b>\n\n"
-            "Your information has been added/updated successfully!"
-        ),
+        templates.REGISTRATION_COMPLETE_TEXT,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton(
-                text=with_emoji(":left_arrow: Back to Menu"),
-                callback_data="menu_back"
-            )
-        ]])
+        reply_markup=BACK_TO_MENU_KEYBOARD
     )
     return
 
@@ -925,14 +652,9 @@ async def handle_menu_help(
         return
     await update.callback_query.answer()
     await update.callback_query.edit_message_text(
-        with_emoji(HELP_MESSAGE),
+        templates.HELP_MESSAGE,
         parse_mode="HTML",
-        reply_markup=InlineKeyboardMarkup([[
-            InlineKeyboardButton(
-                text=with_emoji(":left_arrow: Back to Menu"),
-                callback_data="menu_back"
-            )
-        ]])
+        reply_markup=BACK_TO_MENU_KEYBOARD
     )
     return
 
@@ -950,10 +672,10 @@ async def handle_menu_callback(
 
     if query.data == "menu_rankings":
         await handle_menu_rankings(update, context)
-    # elif query.data == "menu_start_session":
-    #     await handle_menu_start_session(update, context)
-    # elif query.data == "menu_end_session":
-    #     await handle_menu_end_session(update, context)
+    elif query.data == "menu_start_session":
+        await handle_menu_start_session(update, context)
+    elif query.data == "menu_end_session":
+        await handle_menu_end_session(update, context)
     elif query.data == "menu_add_me":
         logger.debug("menu_add_me callback received")
         await handle_menu_add_me(update, context)
@@ -1,20 +1,25 @@
 import re
-from src.functions import generate_rankings_text
 from datetime import datetime
 
 import pytz
+from sqlalchemy import select
 from sqlalchemy.exc import IntegrityError
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import InlineKeyboardMarkup, Update
 from telegram.constants import MessageEntityType
 from telegram.ext import ContextTypes
 
-from src.db import SessionLocal
-from src.decorators import reject_if_private_chat
-from src.functions import calculate_ranking, generate_games_history_message
+from src.db import AsyncSessionLocal, write_session
+from src.cache import ranking_cache
+from src.decorators import developer_only, reject_if_private_chat
+from src.functions import (RANKING_PERIOD_DAYS,
+                           generate_games_history_message, get_elo_rankings,
+                           get_rankings, ranking_period, record_games,
+                           soft_delete_game)
+from src.keyboards import MAIN_MENU_KEYBOARD, delete_game_button
 from src.logging_config import logger
-from src.models import Game, Player
-from src.templates import HELP_MESSAGE, START_MESSAGE
-from src.utils import with_emoji
+from src.metrics import metrics
+from src.models import Player
+from src import templates
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -22,7 +27,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not update.message:
         return
     await update.message.reply_text(
-        with_emoji(START_MESSAGE),
+        templates.START_MESSAGE,
         parse_mode="HTML"
     )
     return
@@ -30,7 +35,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug("help_command() called")
-    message = with_emoji(HELP_MESSAGE)
+    message = templates.HELP_MESSAGE
     if not update.effective_chat:
         logger.debug("No chat found")
         return
@@ -47,11 +52,9 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 @reject_if_private_chat
 async def played(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug("played() called")
-    session = SessionLocal()
 
     if not update.message:
         logger.error("No message found")
-        session.close()
         return
     text = update.message.text or ""
     entities = update.message.entities or []
@@ -59,56 +62,74 @@ async def played(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text(
             "Please provide 2 mentions or text mentions in the message."
         )
-        session.close()
         return
     if not update.effective_chat:
         await update.message.reply_text("Unable to get chat info. Try again.")
         logger.error("Unable to get chat info. Try again.")
-        session.close()
         return
     chat_id = update.effective_chat.id
 
-    player_objs = []
+    # Collect the mentions first so all players resolve in at most two
+    # queries: one by telegram_id and one by username
+    mentions = []
     for entity in entities:
         if entity.type == MessageEntityType.TEXT_MENTION:
             if not entity.user:
-                logger.debug(f"No user found for entity: {entity}")
+                logger.debug("No user found for entity: %s", entity)
                 continue
-            player = session.query(Player).filter_by(
-                telegram_id=entity.user.id).first()
-            logger.debug(f"Player object: {player}")
+            mentions.append(entity)
         elif entity.type == MessageEntityType.MENTION:
-            username = text[entity.offset + 1: entity.offset + entity.length]
-            player = session.query(Player).filter_by(
-                username=username).first()
-        else:
-            continue
+            mentions.append(entity)
+    telegram_ids = {
+        entity.user.id for entity in mentions
+        if entity.type == MessageEntityType.TEXT_MENTION
+    }
+    usernames = {
+        text[entity.offset + 1: entity.offset + entity.length]
+        for entity in mentions
+        if entity.type == MessageEntityType.MENTION
+    }
+
+    async with AsyncSessionLocal() as session:
+        players_by_telegram_id = {}
+        players_by_username = {}
+        if telegram_ids:
+            for player in await session.scalars(select(Player).where(
+                    Player.telegram_id.in_(telegram_ids))):
+                players_by_telegram_id[player.telegram_id] = player
+        if usernames:
+            # Keep the first player if a username was registered twice
+            for player in await session.scalars(select(Player).where(
+                    Player.username.in_(usernames)).order_by(Player.id)):
+                players_by_username.setdefault(player.username, player)
 
-        if not player:
-            if entity.type == MessageEntityType.TEXT_MENTION:
-                if not entity.user:
-                    logger.debug(f"No user found for entity: {entity}")
-                    continue
+    player_objs = []
+    for entity in mentions:
+        if entity.type == MessageEntityType.TEXT_MENTION:
+            player = players_by_telegram_id.get(entity.user.id)
+            if not player:
                 await update.message.reply_text(
                     f"Player {entity.user.first_name} not found. "
                     "Ask them to send /add_me first."
                 )
-            elif entity.type == MessageEntityType.MENTION:
+                return
+        else:
+            username = text[entity.offset + 1: entity.offset + entity.length]
+            player = players_by_username.get(username)
+            if not player:
                 mentioned_text = text[entity.offset:
                                       entity.offset + entity.length]
                 await update.message.reply_text(
                     f"Player @{mentioned_text} not found. "
                     "Ask them to send /add_me first."
                 )
-            session.close()
-            return
+                return
         player_objs.append(player)
-    logger.debug(f"Player objects: {player_objs}")
+    logger.debug("Player objects: %s", player_objs)
     if len(player_objs) < 2 or len(player_objs) % 2 != 0:
         await update.message.reply_text(
             "Please provide an even number of players (@winner @loser\n@winner @loser\n.\n.)."
         )
-        session.close()
         return
 
     # If date is provided in the message set it, otherwise use the message date
@@ -127,56 +148,49 @@ async def played(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(
                 "Invalid date format. Use date=YYYY-MM-DD."
             )
-            session.close()
             return
     if not game_date:
         msg_date_utc = update.message.date
         timezone = pytz.timezone("Asia/Tehran")
         game_date = msg_date_utc.astimezone(timezone).date()
 
-    success_message = f"Games Played on {game_date}:\n\n"
-    games_created = 0
-    keyboard = []
-    # Step 4: Save the game record
-    for i in range(0, len(player_objs), 2):
-        winner = player_objs[i]
-        loser = player_objs[i + 1]
+    pairs = list(zip(player_objs[::2], player_objs[1::2]))
+    for winner, loser in pairs:
         if winner.id == loser.id:
             await update.message.reply_text(
                 "Winner and loser cannot be the same person: "
                 f"{winner.username or winner.first_name}"
                 "Try again."
             )
-            session.close()
             return
 
-        game = Game(
-            winner_id=winner.id,
-            loser_id=loser.id,
-            date=game_date,
-            chat_id=chat_id
+    # Step 4: Save all the game records in one statement. The replies
+    # above are sent with no session open, as they can wait on the rate
+    # limiter.
+    async with write_session() as session:
+        games = await record_games(
+            session,
+            chat_id,
+            game_date,
+            [(winner.id, loser.id) for winner, loser in pairs]
         )
-        games_created += 1
+        await session.commit()
 
-        session.add(game)
-         # This assigns the ID without committing
-        session.flush()
+    success_message = f"Games Played on {game_date}:\n\n"
+    keyboard = []
+    for games_created, (game, (winner, loser)) in enumerate(
+            zip(games, pairs), start=1):
         success_message += (
             f"<i>{games_created}</i>. Game ID <b>{game.id}:</b> <b>{winner.first_name}</b> won "
             f"<b>{loser.first_name}</b>\n"
         )
-        keyboard.append([InlineKeyboardButton(
-            text=with_emoji(f":wastebasket: Delete Game {game.id}"),
-            callback_data=f"delete_game_{game.id}"
-        )])
+        keyboard.append([delete_game_button(game.id)])
 
-    session.commit()
     await update.message.reply_text(
         success_message,
         parse_mode="HTML",
         reply_markup=InlineKeyboardMarkup(keyboard)
     )
-    session.close()
     return
 
 
@@ -190,53 +204,51 @@ async def add_me(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Unable to get your info. Try again.")
         return
 
-    session = SessionLocal()
-
-    existing_player = session.query(Player).filter_by(
-        telegram_id=user.id).first()
-
-    if existing_player:
-        # Update existing player's info
-        setattr(existing_player, "username", user.username or None)
-        setattr(existing_player, "first_name", user.first_name or None)
-        try:
-            session.commit()
-            await update.message.reply_text(
-                "Your information has been updated!"
+    # The reply is picked here and sent once the session is closed, as it
+    # can wait on the rate limiter
+    parse_mode = None
+    async with write_session() as session:
+        existing_player = await session.scalar(select(Player).filter_by(
+            telegram_id=user.id).limit(1))
+
+        if existing_player:
+            # Update existing player's info
+            setattr(existing_player, "username", user.username or None)
+            setattr(existing_player, "first_name", user.first_name or None)
+            try:
+                await session.commit()
+                reply = "Your information has been updated!"
+                logger.info("Player updated: %s - %s", user.id, user.first_name)
+            except Exception as e:
+                logger.error("Failed to update player", exc_info=e)
+                reply = "Something went wrong. Try again"
+                await session.rollback()
+        else:
+            player = Player(
+                telegram_id=user.id,
+                username=user.username,
+                first_name=user.first_name,
             )
-            logger.info(f"Player updated: {user.id} - {user.first_name}")
-        except Exception as e:
-            logger.error("Failed to update player", exc_info=e)
-            await update.message.reply_text("Something went wrong. Try again")
-            session.rollback()
-        finally:
-            session.close()
-            return
 
-    player = Player(
-        telegram_id=user.id,
-        username=user.username,
-        first_name=user.first_name,
-    )
+            session.add(player)
+
+            try:
+                await session.commit()
+                reply = (
+                    "You have been added as a player! "
+                    "You can now use the /played command to record your games."
+                )
+                parse_mode = "HTML"
+                logger.info("Player added: %s - %s", user.id, user.first_name)
+            except IntegrityError:
+                reply = "You are already in the database."
+                await session.rollback()
+            except Exception as e:
+                logger.error("Failed to add player", exc_info=e)
+                reply = "Something went wrong. Try again"
+                await session.rollback()
 
-    session.add(player)
-
-    try:
-        session.commit()
-        await update.message.reply_text((
-            "You have been added as a player! "
-            "You can now use the /played command to record your games."
-        ), parse_mode="HTML")
-        logger.info(f"Player added: {user.id} - {user.first_name}")
-    except IntegrityError:
-        await update.message.reply_text("You are already in the database.")
-        session.rollback()
-    except Exception as e:
-        logger.error("Failed to add player", exc_info=e)
-        await update.message.reply_text("Something went wrong. Try again")
-        session.rollback()
-    finally:
-        session.close()
+    await update.message.reply_text(reply, parse_mode=parse_mode)
 
 
 @reject_if_private_chat
@@ -244,51 +256,68 @@ async def ranking(update: Update, context: ContextTypes.DEFAULT_TYPE):
     logger.debug("ranking() called")
     if not update.message:
         return
-    session = SessionLocal()
     pattern = r"^\d{4}-\d{2}-\d{2}$"
+    range_pattern = r"^(\d{4}-\d{2}-\d{2})\.\.(\d{4}-\d{2}-\d{2})$"
     date = None
+    end_date = None
+    elo = False
     if (
         context.args
         and len(context.args) > 0
     ):
-        if context.args[0].lower() == "today":
-            date = datetime.now(pytz.timezone("Asia/Tehran")).date()
-        elif re.match(pattern, context.args[0]):
-            date = datetime.strptime(context.args[0], "%Y-%m-%d").date()
-        else:
+        argument = context.args[0].lower()
+        today = datetime.now(pytz.timezone("Asia/Tehran")).date()
+        range_match = re.match(range_pattern, argument)
+        if argument == "elo":
+            elo = True
+        elif argument == "today":
+            date = today
+        elif argument in RANKING_PERIOD_DAYS:
+            date, end_date = ranking_period(argument, today)
+        elif re.match(pattern, argument):
+            date = datetime.strptime(argument, "%Y-%m-%d").date()
+        elif range_match:
+            date, end_date = (
+                datetime.strptime(value, "%Y-%m-%d").date()
+                for value in range_match.groups())
+        if not elo and (date is None or (end_date and end_date < date)):
             await update.message.reply_text(
-                "Invalid date format. Use YYYY-MM-DD or 'today'."
+                "Invalid date format. Use YYYY-MM-DD, "
+                "YYYY-MM-DD..YYYY-MM-DD, 'today', 'week', 'month' or 'elo'."
             )
-            session.close()
             return
 
     if not update.effective_chat:
-        session.close()
         return
     chat_id = update.effective_chat.id
-    rankings = calculate_ranking(session, chat_id, date)
+    async with AsyncSessionLocal() as session:
+        if elo:
+            rankings, rankings_text = await get_elo_rankings(session, chat_id)
+        else:
+            rankings, rankings_text = await get_rankings(
+                session, chat_id, date, end_date)
 
     if not rankings:
         await update.message.reply_text(
-            with_emoji(":no_entry: No games played yet in this chat.")
+            templates.NO_GAMES_YET_TEXT
         )
-        session.close()
         return
 
 
-    if date:
-        ranking_message = with_emoji(
-            f":trophy: <b>{date} Champions Are Here!</b> :sparkles:\n\n")
+    if elo:
+        ranking_message = templates.ELO_CHAMPIONS_HEADER
+    elif end_date:
+        ranking_message = templates.RANGE_CHAMPIONS_HEADER.format(
+            start=date, end=end_date)
+    elif date:
+        ranking_message = templates.DATE_CHAMPIONS_HEADER.format(date=date)
     else:
-        ranking_message = with_emoji(
-            ":trophy: <b>All-Time Champions Are Here!</b> :sparkles:\n\n")
+        ranking_message = templates.ALL_TIME_CHAMPIONS_HEADER
 
-    ranking_message += generate_rankings_text(rankings)
+    ranking_message += rankings_text
 
-    ranking_message += with_emoji(
-        "\n\n:rocket: <b>Let's keep the games rolling!</b>")
+    ranking_message += templates.CHAMPIONS_FOOTER
     await update.message.reply_text(ranking_message, parse_mode="HTML")
-    session.close()
     return
 
 
@@ -297,37 +326,8 @@ async def show_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Show the main menu with inline keyboard buttons."""
     logger.debug("show_menu() called")
 
-    menu_text = with_emoji(
-        ":game_die: <b>Game Manager Menu</b>\n\n"
-        "Choose an option from the menu below OR use\n"
-        "<code>/played [date=yyyy-mm-dd]</code> to record a game;\n"
-        "<code>/games [date=yyyy-mm-dd]</code> to see the games history."
-    )
-
-    keyboard = [
-        [InlineKeyboardButton(
-            text=with_emoji(":trophy: Rankings"),
-            callback_data="menu_rankings"
-        )],
-        # [InlineKeyboardButton(
-        #     text=with_emoji(":video_game: Start Session"),
-        #     callback_data="menu_start_session"
-        # )],
-        # [InlineKeyboardButton(
-        #     text=with_emoji(":stop_button: End Session"),
-        #     callback_data="menu_end_session"
-        # )],
-        [InlineKeyboardButton(
-            text=with_emoji(":bust_in_silhouette: Add Me"),
-            callback_data="menu_add_me"
-        )],
-        [InlineKeyboardButton(
-            text=with_emoji(":question: Help"),
-            callback_data="menu_help"
-        )],
-    ]
-
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    menu_text = templates.MENU_TEXT
+    reply_markup = MAIN_MENU_KEYBOARD
 
     # If the command is called from a callback query ie back to menu
     # from other menu, edit the message
@@ -371,7 +371,6 @@ async def handle_games_command(update: Update, context: ContextTypes.DEFAULT_TYP
     if not update.message:
         return
 
-    session = SessionLocal()
     pattern = r"date=(\d{4}-\d{2}-\d{2})$"
     date = None
 
@@ -384,38 +383,33 @@ async def handle_games_command(update: Update, context: ContextTypes.DEFAULT_TYP
             await update.message.reply_text(
                 "Invalid date format. Use date=YYYY-MM-DD."
             )
-            session.close()
             return
 
     if not date:
         date = datetime.now(pytz.timezone("Asia/Tehran")).date()
     if not update.effective_chat:
-        session.close()
         return
 
-    games_message, games_keyboard = generate_games_history_message(
-        session=session,
-        chat_id=update.effective_chat.id,
-        game_date=date
-    )
-    logger.debug(f"Games message: {games_message}")
-    logger.debug(f"Games keyboard: {games_keyboard}")
+    async with AsyncSessionLocal() as session:
+        games_message, games_keyboard = await generate_games_history_message(
+            session=session,
+            chat_id=update.effective_chat.id,
+            message=templates.GAMES_HISTORY_HEADER.format(date=date),
+            game_date=date
+        )
+    logger.debug("Games message: %s", games_message)
+    logger.debug("Games keyboard: %s", games_keyboard)
     if not games_message:
         await update.message.reply_text(
-            with_emoji(":no_entry: No games played on this date in this chat.")
+            templates.NO_GAMES_ON_DATE_TEXT
         )
-        session.close()
         return
 
-    games_list_message = with_emoji(f"Games played on {date}:\n\n" + games_message)
-
-
     await update.message.reply_text(
-        games_list_message,
+        games_message,
         parse_mode="HTML",
         reply_markup=games_keyboard if games_keyboard else None
     )
-    session.close()
     return
 
 
@@ -427,23 +421,73 @@ async def handle_delete_game_command(update: Update, context: ContextTypes.DEFAU
         return
     if not context.args:
         await update.message.reply_text(
-            with_emoji(":x: Please provide a game ID."))
+            templates.MISSING_GAME_ID_TEXT)
         return
     game_id = context.args[0]
     if not game_id.isdigit():
         await update.message.reply_text(
-            with_emoji(":x: Invalid game ID."))
+            templates.INVALID_GAME_ID_TEXT)
         return
-    session = SessionLocal()
-    game = session.query(Game).filter_by(id=game_id).first()
+    # Only games of this chat. The session, and with it SQLite's write
+    # lock, is released before replying.
+    async with write_session() as session:
+        game = await soft_delete_game(
+            session, int(game_id), update.effective_chat.id)
+        if game:
+            await session.commit()
     if not game:
         await update.message.reply_text(
-            with_emoji(f":x: Game ID {game_id} not found."))
+            templates.GAME_NOT_FOUND_TEXT.format(game_id=game_id))
         return
-    game.deleted_at = datetime.now()  # type: ignore
-    session.add(game)
-    session.commit()
-    await update.message.reply_text(with_emoji(f":wastebasket: Game {game_id} deleted."))
+    await update.message.reply_text(
+        templates.GAME_DELETED_TEXT.format(game_id=game_id))
     # FUTURE: Add an undo button to restore the game
-    session.close()
-    return
\ No newline at end of file
+    return
+
+
+@developer_only
+async def handle_cache_stats_command(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the ranking cache counters to the developer."""
+    logger.debug("handle_cache_stats_command() called")
+    if not update.message:
+        return
+    stats = ranking_cache.stats()
+    await update.message.reply_text(
+        "<b>Ranking cache</b>\n"
+        f"Hits: {stats['hits']}\n"
+        f"Misses: {stats['misses']}\n"
+        f"Hit ratio: {stats['hit_ratio'] * 100:.1f}%\n"
+        f"Invalidations: {stats['invalidations']}\n"
+        f"Entries: {stats['size']}/{stats['maxsize']}",
+        parse_mode="HTML"
+    )
+    return
+
+
+@developer_only
+async def handle_metrics_command(
+        update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Show the developer the latency of each handler since startup."""
+    logger.debug("handle_metrics_command() called")
+    if not update.message:
+        return
+    # This very call isn't counted until it returns
+    handlers = sorted(
+        (item for item in metrics.handlers.items() if item[1].seconds.count),
+        key=lambda item: item[1].seconds.count, reverse=True)
+    if not handlers:
+        await update.message.reply_text(templates.NO_METRICS_TEXT)
+        return
+    lines = [templates.METRICS_HEADER]
+    for name, stats in handlers:
+        lines.append(templates.METRICS_LINE.format(
+            name=name,
+            count=stats.seconds.count,
+            p50=stats.seconds.quantile(0.5) * 1000,
+            p99=stats.seconds.quantile(0.99) * 1000,
+            queries=stats.queries.sum / stats.seconds.count,
+            errors=stats.errors,
+        ))
+    await update.message.reply_text("\n".join(lines), parse_mode="HTML")
+    return
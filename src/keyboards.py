@@ -0,0 +1,155 @@
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+
+from src import templates
+
+# Static keyboards are built once; telegram objects are immutable, so the
+# same instance can be sent with every message.
+
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(
+        text=templates.RANKINGS_BUTTON,
+        callback_data="menu_rankings"
+    )],
+    [InlineKeyboardButton(
+        text=templates.START_SESSION_BUTTON,
+        callback_data="menu_start_session"
+    )],
+    [InlineKeyboardButton(
+        text=templates.END_SESSION_BUTTON,
+        callback_data="menu_end_session"
+    )],
+    [InlineKeyboardButton(
+        text=templates.ADD_ME_BUTTON,
+        callback_data="menu_add_me"
+    )],
+    [InlineKeyboardButton(
+        text=templates.HELP_BUTTON,
+        callback_data="menu_help"
+    )],
+])
+
+RANKINGS_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton(
+        text=templates.TODAY_BUTTON,
+        callback_data="rank_today"
+    )],
+    [InlineKeyboardButton(
+        text=templates.WEEK_BUTTON,
+        callback_data="rank_week"
+    ), InlineKeyboardButton(
+        text=templates.MONTH_BUTTON,
+        callback_data="rank_month"
+    )],
+    [InlineKeyboardButton(
+        text=templates.CUSTOM_DATE_BUTTON,
+        callback_data="rank_enter_date"
+    )],
+    [InlineKeyboardButton(
+        text=templates.ALL_TIME_BUTTON,
+        callback_data="rank_all_time"
+    )],
+    [InlineKeyboardButton(
+        text=templates.ELO_BUTTON,
+        callback_data="rank_elo"
+    )],
+    [InlineKeyboardButton(
+        text=templates.BACK_TO_MENU_BUTTON,
+        callback_data="menu_back"
+    )]
+])
+
+BACK_TO_MENU_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton(
+        text=templates.BACK_TO_MENU_BUTTON,
+        callback_data="menu_back"
+    )
+]])
+
+BACK_TO_RANKINGS_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton(
+        text=templates.BACK_TO_RANKINGS_BUTTON,
+        callback_data="menu_rankings"
+    )
+]])
+
+CANCEL_DATE_KEYBOARD = InlineKeyboardMarkup([[
+    InlineKeyboardButton(
+        text=templates.CANCEL_BUTTON,
+        callback_data="rank_cancel"
+    )
+]])
+
+
+def delete_game_button(game_id: int) -> InlineKeyboardButton:
+    """Button that soft-deletes the game with the given ID."""
+    return InlineKeyboardButton(
+        text=templates.DELETE_GAME_BUTTON.format(game_id=game_id),
+        callback_data=f"delete_game_{game_id}"
+    )
+
+
+def games_page_buttons(game_date, first_id: int, last_id: int,
+                       has_previous: bool, has_next: bool):
+    """
+    Row of Previous/Next buttons of a games history page.
+
+    The buttons carry the date and the first or last game ID of the page,
+    which the next page is read from.
+    """
+    row = []
+    if has_previous:
+        row.append(InlineKeyboardButton(
+            text=templates.PREVIOUS_PAGE_BUTTON,
+            callback_data=f"games_prev_{game_date.isoformat()}_{first_id}"
+        ))
+    if has_next:
+        row.append(InlineKeyboardButton(
+            text=templates.NEXT_PAGE_BUTTON,
+            callback_data=f"games_next_{game_date.isoformat()}_{last_id}"
+        ))
+    return row
+
+
+# Player buttons per row of the session pickers
+PICKER_COLUMNS = 3
+
+END_SESSION_BUTTON = InlineKeyboardButton(
+    text=templates.END_SESSION_BUTTON,
+    callback_data="session_end"
+)
+CANCEL_GAME_BUTTON = InlineKeyboardButton(
+    text=templates.CANCEL_BUTTON,
+    callback_data="session_cancel_game"
+)
+
+
+def session_keyboard(roster, games: int, winner_id=None):
+    """
+    Player picker of a game session.
+
+    Args:
+        roster: (player_id, name) tuples of the chat's players
+        games: Number of games played in the session so far
+        winner_id: The winner picked for the current game, if any; the
+            picker then asks for the loser
+    """
+    if winner_id is None:
+        action = "session_winner"
+        controls = [END_SESSION_BUTTON]
+        if games:
+            # The index guards against undoing twice on a double tap
+            controls.insert(0, InlineKeyboardButton(
+                text=templates.UNDO_GAME_BUTTON,
+                callback_data=f"session_delete_game_{games - 1}"
+            ))
+    else:
+        action = "session_loser"
+        controls = [CANCEL_GAME_BUTTON]
+    buttons = [
+        InlineKeyboardButton(text=name, callback_data=f"{action}_{player_id}")
+        for player_id, name in roster if player_id != winner_id
+    ]
+    rows = [buttons[i:i + PICKER_COLUMNS]
+            for i in range(0, len(buttons), PICKER_COLUMNS)]
+    rows.append(controls)
+    return InlineKeyboardMarkup(rows)
@@ -1,11 +1,88 @@
+"""
+Logging setup: loggers only put records on a queue, and a background
+thread writes them to the rotating LOG_FILE, so a slow disk never blocks
+the event loop.
+
+In multi-process mode each worker sends its records to the dispatcher
+with log_to, and the dispatcher writes them with listen_to, so there is
+a single writer rotating the file.
+"""
+import atexit
+import json
 import logging
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from src import config
+
+TEXT_FORMAT = ('%(asctime)s - %(name)s - %(levelname)s - %(filename)s - '
+               'Ln: %(lineno)d - %(message)s')
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(
+                record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "file": record.filename,
+            "line": record.lineno,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _file_handler():
+    # delay: worker processes, which never write, don't open the file
+    handler = RotatingFileHandler(
+        config.LOG_FILE, maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT, encoding="utf-8", delay=True)
+    if config.LOG_FORMAT == "json":
+        handler.setFormatter(JSONFormatter())
+    else:
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return handler
+
+
+_file = _file_handler()
+# QueueHandler.prepare formats only the message, in the thread that made
+# the logging call; _listener's thread formats the rest of the line
+_queue_handler = QueueHandler(queue.SimpleQueue())
+_listener = QueueListener(_queue_handler.queue, _file)
+
+logging.root.addHandler(_queue_handler)
+logging.root.setLevel(config.LOG_LEVEL)
+_listener.start()
+
+
+def _stop_listener():
+    # Writes the records still queued
+    if _listener._thread is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+def log_to(log_queue):
+    """Send this process's records to another process's listen_to."""
+    _stop_listener()
+    _queue_handler.queue = log_queue
+
+
+def listen_to(log_queue) -> QueueListener:
+    """Write the records other processes put on log_queue. Stop it after."""
+    listener = QueueListener(log_queue, _file)
+    listener.start()
+    return listener
 
-# Configure logger
-logging.basicConfig(
-    filename='logs.log',
-    format='%(asctime)s - %(name)s - %(levelname)s - %(filename)s - Ln: %(lineno)d - %(message)s',
-    level=logging.INFO
-)
 
 logger = logging.getLogger(__name__)
 
@@ -0,0 +1,290 @@
+"""
+Handler and database metrics, in the Prometheus text format.
+
+instrument() wraps the callback of every handler registered on the
+application, timing each call and counting errors and calls in progress
+per handler. Database queries are timed through the cursor events that
+src/db.py hooks up, and are also added to the handler call that ran them:
+the call's usage is kept in a context variable, so updates handled
+concurrently don't mix up their counts.
+
+With METRICS_PORT set, GET /metrics on that port returns everything for
+Prometheus to scrape; /metrics in Telegram shows the developer p50/p99
+per handler.
+"""
+import asyncio
+import contextvars
+import time
+from bisect import bisect_left
+from functools import wraps
+
+from src.cache import ranking_cache
+from src.logging_config import logger
+
+# Upper bounds of the histogram buckets, in seconds or queries
+HANDLER_SECONDS_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_SECONDS_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds a scraper gets to send its request
+REQUEST_TIMEOUT = 5
+
+
+class Histogram:
+    """Counts of observed values per bucket, like a Prometheus histogram."""
+
+    __slots__ = ("bounds", "counts", "count", "sum")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # The last count is of values above every bound
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimate a quantile, interpolating within its bucket the way
+        Prometheus' histogram_quantile does.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                if index == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[index - 1] if index else 0.0
+                upper = self.bounds[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.bounds[-1]
+
+    def samples(self, name, labels=""):
+        """Exposition lines of the histogram."""
+        separator = "," if labels else ""
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            yield (f'{name}_bucket{{{labels}{separator}le="{bound}"}} '
+                   f'{cumulative}')
+        yield f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}'
+        labels = f"{{{labels}}}" if labels else ""
+        yield f"{name}_sum{labels} {self.sum}"
+        yield f"{name}_count{labels} {self.count}"
+
+
+class HandlerStats:
+    """Metrics of one handler."""
+
+    __slots__ = ("seconds", "queries", "query_seconds", "errors",
+                 "in_progress")
+
+    def __init__(self):
+        self.seconds = Histogram(HANDLER_SECONDS_BUCKETS)
+        # Queries per call, and the time they took in total
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.query_seconds = 0.0
+        self.errors = 0
+        self.in_progress = 0
+
+
+class QueryUsage:
+    """Queries run by one handler call."""
+
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# The QueryUsage of the handler call running in this context, if any
+_current_usage = contextvars.ContextVar("query_usage", default=None)
+
+
+class Metrics:
+    """All metrics of this process. See the module docstring."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.queries = Histogram(QUERY_SECONDS_BUCKETS)
+        # Worker index in the multi-process mode, which offsets the port
+        self.worker = 0
+        self._server = None
+
+    def handler(self, name: str) -> HandlerStats:
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        return stats
+
+    def record_query(self, seconds: float):
+        """Count a database query, also towards the running handler."""
+        self.queries.observe(seconds)
+        usage = _current_usage.get()
+        if usage is not None:
+            usage.count += 1
+            usage.seconds += seconds
+
+    def render(self) -> str:
+        """Every metric in the Prometheus text format."""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        handlers = sorted(self.handlers.items())
+        family(
+            "bot_handler_seconds", "histogram",
+            "Time spent in each handler.",
+            [line for name, stats in handlers
+             for line in stats.seconds.samples(
+                 "bot_handler_seconds", f'handler="{name}"')])
+        family(
+            "bot_handler_errors_total", "counter",
+            "Handler calls that raised.",
+            [f'bot_handler_errors_total{{handler="{name}"}} {stats.errors}'
+             for name, stats in handlers])
+        family(
+            "bot_handler_in_progress", "gauge",
+            "Handler calls running now.",
+            [f'bot_handler_in_progress{{handler="{name}"}} '
+             f'{stats.in_progress}'
+             for name, stats in handlers])
+        family(
+            "bot_handler_db_queries", "histogram",
+            "Database queries per handler call.",
+            [line for name, stats in handlers
+             for line in stats.queries.samples(
+                 "bot_handler_db_queries", f'handler="{name}"')])
+        family(
+            "bot_handler_db_seconds_total", "counter",
+            "Time spent in database queries per handler.",
+            [f'bot_handler_db_seconds_total{{handler="{name}"}} '
+             f'{stats.query_seconds}'
+             for name, stats in handlers])
+        family(
+            "bot_db_query_seconds", "histogram",
+            "Time spent in each database query.",
+            self.queries.samples("bot_db_query_seconds"))
+
+        cache = ranking_cache.stats()
+        for key, kind in (("hits", "counter"), ("misses", "counter"),
+                          ("invalidations", "counter"), ("size", "gauge")):
+            name = f"bot_ranking_cache_{key}"
+            if kind == "counter":
+                name += "_total"
+            family(name, kind, f"Ranking cache {key}.",
+                   [f"{name} {cache[key]}"])
+        return "\n".join(lines) + "\n"
+
+    async def _serve(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(
+                reader.readline(), REQUEST_TIMEOUT)
+            while await asyncio.wait_for(
+                    reader.readline(), REQUEST_TIMEOUT) not in (
+                    b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            if (
+                len(parts) >= 2 and parts[0] == b"GET"
+                and parts[1].split(b"?")[0] == b"/metrics"
+            ):
+                status, body = "200 OK", self.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: {CONTENT_TYPE}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                "Connection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def start_server(self, host: str, port: int):
+        """Serve /metrics on host:port. Call from a running loop."""
+        self._server = await asyncio.start_server(self._serve, host, port)
+        logger.info("Serving metrics on %s:%d", host, port)
+
+    async def stop_server(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+
+metrics = Metrics()
+
+
+# telegram is imported by the functions below rather than up here, since
+# src.db imports this module and migrations shouldn't have to load it
+
+
+def handler_name(handler) -> str:
+    """How a handler is labelled: its command, or its callback's name."""
+    from telegram.ext import CommandHandler
+
+    if isinstance(handler, CommandHandler):
+        return "/" + min(handler.commands)
+    return getattr(handler.callback, "__name__", type(handler).__name__)
+
+
+def _timed(name, callback):
+    from telegram.ext import ApplicationHandlerStop
+
+    @wraps(callback)
+    async def timed_callback(update, context):
+        stats = metrics.handler(name)
+        usage = QueryUsage()
+        token = _current_usage.set(usage)
+        stats.in_progress += 1
+        started = time.perf_counter()
+        try:
+            return await callback(update, context)
+        except ApplicationHandlerStop:
+            raise
+        except Exception:
+            stats.errors += 1
+            raise
+        finally:
+            stats.seconds.observe(time.perf_counter() - started)
+            stats.in_progress -= 1
+            stats.queries.observe(usage.count)
+            stats.query_seconds += usage.seconds
+            _current_usage.reset(token)
+
+    return timed_callback
+
+
+def _instrument_handler(handler):
+    from telegram.ext import ConversationHandler
+
+    if isinstance(handler, ConversationHandler):
+        for inner in (*handler.entry_points, *handler.fallbacks,
+                      *(h for hs in handler.states.values() for h in hs)):
+            _instrument_handler(inner)
+        return
+    handler.callback = _timed(handler_name(handler), handler.callback)
+
+
+def instrument(app):
+    """Time every handler added to the application so far."""
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            _instrument_handler(handler)
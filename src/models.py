@@ -1,6 +1,7 @@
 import datetime
 
-from sqlalchemy import (Column, Date, DateTime, ForeignKey, Integer, String)
+from sqlalchemy import (BigInteger, Column, Date, DateTime, Float, ForeignKey,
+                        Index, Integer, LargeBinary, String, text)
 from sqlalchemy.orm import declarative_base, relationship
 
 Base = declarative_base()
@@ -11,8 +12,10 @@ class Player(Base):
 
     id = Column(Integer, primary_key=True)
     first_name = Column(String)
-    telegram_id = Column(Integer, unique=True)
-    username = Column(String, nullable=True)
+    # Telegram IDs don't fit in 32 bits
+    telegram_id = Column(BigInteger, unique=True)
+    # Indexed for the @username mention lookups in /played
+    username = Column(String, nullable=True, index=True)
 
     # For easy access to games
     games_won = relationship(
@@ -35,7 +38,7 @@ class Game(Base):
     loser_id = Column(Integer, ForeignKey('players.id'))
     # TODO: Remove the default arg from the date
     date = Column(Date, default=datetime.date.today)
-    chat_id = Column(Integer, nullable=False)
+    chat_id = Column(BigInteger, nullable=False)
     deleted_at = Column(DateTime, nullable=True)
 
     # Set up relationships so we can do game.winner or player.games_won
@@ -50,4 +53,103 @@ class Game(Base):
         back_populates="games_lost"
     )
 
+    # Partial indexes over live (non-deleted) games only; the ranking and
+    # history queries always filter on deleted_at IS NULL so they can use them
+    __table_args__ = (
+        # Games history, paged by ID within a day. Covers winner/loser so
+        # the rows can be served from the index alone.
+        Index(
+            'ix_games_chat_id_date',
+            'chat_id', 'date', 'id', 'winner_id', 'loser_id',
+            sqlite_where=text('deleted_at IS NULL'),
+            postgresql_where=text('deleted_at IS NULL'),
+        ),
+        # All-time wins and losses grouped per player
+        Index(
+            'ix_games_chat_id_winner_id',
+            'chat_id', 'winner_id',
+            sqlite_where=text('deleted_at IS NULL'),
+            postgresql_where=text('deleted_at IS NULL'),
+        ),
+        Index(
+            'ix_games_chat_id_loser_id',
+            'chat_id', 'loser_id',
+            sqlite_where=text('deleted_at IS NULL'),
+            postgresql_where=text('deleted_at IS NULL'),
+        ),
+        # A chat's games in the order they were recorded, for replaying
+        # the Elo ratings from the index alone
+        Index(
+            'ix_games_chat_id_id',
+            'chat_id', 'id', 'winner_id', 'loser_id',
+            sqlite_where=text('deleted_at IS NULL'),
+            postgresql_where=text('deleted_at IS NULL'),
+        ),
+    )
+
+
+class PlayerChatStats(Base):
+    """All-time wins and losses of a player in a chat.
+
+    Maintained alongside the games table (see src/stats.py) so all-time
+    rankings don't have to aggregate every game of the chat.
+    """
+    __tablename__ = 'player_chat_stats'
+
+    chat_id = Column(BigInteger, primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+
+
+class PlayerDailyStats(Base):
+    """Wins and losses of a player in a chat on a single day."""
+    __tablename__ = 'player_daily_stats'
+
+    chat_id = Column(BigInteger, primary_key=True)
+    date = Column(Date, primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    wins = Column(Integer, nullable=False, default=0)
+    losses = Column(Integer, nullable=False, default=0)
+
+
+class PlayerRating(Base):
+    """Elo rating of a player in a chat, see src/ratings.py."""
+    __tablename__ = 'player_ratings'
+
+    chat_id = Column(BigInteger, primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    rating = Column(Float, nullable=False)
+    # Games the rating counts
+    games = Column(Integer, nullable=False)
+
+
+class RatingCheckpoint(Base):
+    """A player's Elo rating in a chat as it was after one of its games.
+
+    The rows of a (chat, game) hold the ratings of every rated player of
+    the chat at that point, so the ratings can be replayed from there.
+    """
+    __tablename__ = 'rating_checkpoints'
+
+    chat_id = Column(BigInteger, primary_key=True)
+    game_id = Column(Integer, primary_key=True)
+    player_id = Column(Integer, ForeignKey('players.id'), primary_key=True)
+    rating = Column(Float, nullable=False)
+    games = Column(Integer, nullable=False)
+
+
+class PersistedData(Base):
+    """A pickled entry of the bot's user, chat or bot data, or a
+    conversation state; see src/persistence.py."""
+    __tablename__ = 'bot_persistence'
+
+    # "user", "chat", "bot", "callback" or "conversation"
+    kind = Column(String, primary_key=True)
+    # The conversation handler's name, "" for the other kinds
+    name = Column(String, primary_key=True)
+    # User or chat ID, or the JSON list of a conversation key
+    key = Column(String, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
+
 # TODO: Add the Chat model
@@ -0,0 +1,201 @@
+"""
+Persistence of user_data, chat_data, bot_data and conversation states in
+the bot's database, so a restart doesn't drop a conversation midway.
+
+The application hands the data of every user and chat that had an update
+to the persistence every PERSISTENCE_INTERVAL seconds. Each entry is
+pickled and compared with what was last written for it, and only the
+entries that changed are written, all in one transaction: an upsert of
+the changed rows and a delete of the emptied ones. Nothing is rewritten
+because another entry changed, so a run costs the pickling of the touched
+entries plus a write proportional to what changed.
+
+Data is loaded when the application starts and not reloaded per update,
+so in the multi-process mode each chat's conversations stay with the
+worker that owns the chat, as its updates do. A user's user_data is
+shared between workers only through restarts, the last write winning.
+"""
+import asyncio
+import json
+import pickle
+from collections import defaultdict
+
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+from telegram.ext import BasePersistence
+
+from src import config
+from src.db import AsyncSessionLocal, write_session
+from src.models import PersistedData
+
+# Rows per upsert; 4 parameters each keeps a batch below every driver's
+# parameter limit
+WRITE_BATCH_SIZE = 200
+
+
+def _upsert_statement(dialect_name, rows):
+    """INSERT rows, replacing the data of the existing ones."""
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(PersistedData).values(rows)
+    else:
+        stmt = sqlite.insert(PersistedData).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["kind", "name", "key"],
+        set_={"data": stmt.excluded.data},
+    )
+
+
+class DatabasePersistence(BasePersistence):
+    """
+    BasePersistence over the bot_persistence table. See the module
+    docstring.
+
+    Args:
+        update_interval: Seconds between the application's writes
+    """
+
+    def __init__(self, update_interval: float = config.PERSISTENCE_INTERVAL):
+        super().__init__(update_interval=update_interval)
+        # (kind, name, key) -> pickled data as it is in the database
+        self._written = {}
+        # (kind, name, key) -> pickled data to write, or None to delete
+        self._pending = {}
+        self._write_lock = asyncio.Lock()
+
+    async def _load(self, kind, name=""):
+        """[(key, data)] of the stored entries of a kind."""
+        async with AsyncSessionLocal() as session:
+            rows = (await session.execute(
+                select(PersistedData.key, PersistedData.data)
+                .where(PersistedData.kind == kind, PersistedData.name == name)
+            )).all()
+        entries = []
+        for key, blob in rows:
+            self._written[(kind, name, key)] = blob
+            entries.append((key, pickle.loads(blob)))
+        return entries
+
+    async def _store(self, kind, name, key, blob):
+        """Write blob for the entry, unless that's what is there already."""
+        entry = (kind, name, key)
+        stored = self._pending.get(entry, self._written.get(entry))
+        if blob == stored:
+            return
+        self._pending[entry] = blob
+        await self._write()
+
+    async def _write(self):
+        # The application stores every entry of a run at once, so let the
+        # others be staged to write them in the same transaction
+        await asyncio.sleep(0)
+        async with self._write_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            previous = {entry: self._written.get(entry) for entry in batch}
+            for entry, blob in batch.items():
+                if blob is None:
+                    self._written.pop(entry, None)
+                else:
+                    self._written[entry] = blob
+            try:
+                await self._write_batch(batch)
+            except Exception:
+                # Written on the next run, unless changed again by then
+                for entry, blob in batch.items():
+                    if previous[entry] is None:
+                        self._written.pop(entry, None)
+                    else:
+                        self._written[entry] = previous[entry]
+                    self._pending.setdefault(entry, blob)
+                raise
+
+    @staticmethod
+    async def _write_batch(batch):
+        rows = []
+        deleted = defaultdict(list)
+        for (kind, name, key), blob in batch.items():
+            if blob is None:
+                deleted[(kind, name)].append(key)
+            else:
+                rows.append(
+                    {"kind": kind, "name": name, "key": key, "data": blob})
+        async with write_session() as session:
+            dialect_name = session.get_bind().dialect.name
+            for start in range(0, len(rows), WRITE_BATCH_SIZE):
+                await session.execute(_upsert_statement(
+                    dialect_name, rows[start:start + WRITE_BATCH_SIZE]))
+            for (kind, name), keys in deleted.items():
+                await session.execute(
+                    delete(PersistedData)
+                    .where(PersistedData.kind == kind,
+                           PersistedData.name == name,
+                           PersistedData.key.in_(keys)))
+            await session.commit()
+
+    @staticmethod
+    def _pickle(data):
+        # Empty data isn't stored, the application starts from empty
+        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL) if data else None
+
+    async def get_user_data(self):
+        return {int(key): data for key, data in await self._load("user")}
+
+    async def get_chat_data(self):
+        return {int(key): data for key, data in await self._load("chat")}
+
+    async def get_bot_data(self):
+        for _, data in await self._load("bot"):
+            return data
+        return {}
+
+    async def get_callback_data(self):
+        for _, data in await self._load("callback"):
+            return data
+        return None
+
+    async def get_conversations(self, name):
+        return {
+            tuple(json.loads(key)): state
+            for key, state in await self._load("conversation", name)
+        }
+
+    async def update_user_data(self, user_id, data):
+        await self._store("user", "", str(user_id), self._pickle(data))
+
+    async def update_chat_data(self, chat_id, data):
+        await self._store("chat", "", str(chat_id), self._pickle(data))
+
+    async def update_bot_data(self, data):
+        await self._store("bot", "", "", self._pickle(data))
+
+    async def update_callback_data(self, data):
+        await self._store("callback", "", "", self._pickle(data))
+
+    async def update_conversation(self, name, key, new_state):
+        # None ends the conversation; other states, even 0, are stored
+        blob = None
+        if new_state is not None:
+            blob = pickle.dumps(new_state, pickle.HIGHEST_PROTOCOL)
+        await self._store("conversation", name, json.dumps(list(key)), blob)
+
+    async def drop_user_data(self, user_id):
+        await self._store("user", "", str(user_id), None)
+
+    async def drop_chat_data(self, chat_id):
+        await self._store("chat", "", str(chat_id), None)
+
+    # The data is only loaded at startup, see the module docstring
+
+    async def refresh_user_data(self, user_id, user_data):
+        pass
+
+    async def refresh_chat_data(self, chat_id, chat_data):
+        pass
+
+    async def refresh_bot_data(self, bot_data):
+        pass
+
+    async def flush(self):
+        """Write whatever an earlier failed write left."""
+        await self._write()
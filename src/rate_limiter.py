@@ -0,0 +1,182 @@
+"""
+Outbound rate limiting of Bot API requests.
+
+Every request that targets a chat waits for a token from that chat's
+bucket and then from the global bucket, so bursts are spread out to
+Telegram's flood limits instead of failing with RetryAfter. If Telegram
+still answers RetryAfter, the bucket is paused for the requested time and
+the request is retried.
+
+Edits sent with ``rate_limit_args=COALESCE`` are queued instead of
+awaited: the caller gets True straight away and, if newer edits of the
+same message are queued before it goes out, only the newest one is sent.
+"""
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from src.logging_config import logger
+
+# rate_limit_args for an edit that a newer edit of the message may replace
+COALESCE = {"coalesce": True}
+
+# Forget idle per-chat buckets once there are more than this many
+MAX_IDLE_BUCKETS = 4096
+
+
+class TokenBucket:
+    """
+    Allows ``rate`` requests per second on average, bursts of ``capacity``.
+
+    Waiters are served first come, first served.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self):
+        """Wait for a token and take it."""
+        async with self._lock:
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for the next ``seconds``."""
+        self._paused_until = max(
+            self._paused_until, time.monotonic() + seconds)
+
+    def idle(self) -> bool:
+        """True if forgetting the bucket wouldn't change anything."""
+        self._refill()
+        return (
+            self.tokens >= self.capacity
+            and not self._lock.locked()
+            and self._paused_until <= time.monotonic()
+        )
+
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """
+    Token buckets per chat and overall, with RetryAfter backoff and
+    coalescing of queued edits. See the module docstring.
+
+    Args:
+        global_rate: Requests per second over all chats
+        group_rate: Requests per second to a single group chat
+        private_rate: Requests per second to a single private chat
+        burst: Requests a chat may send at once before being throttled
+        max_retries: Times a request is retried after a RetryAfter
+    """
+
+    def __init__(self, global_rate: float, group_rate: float,
+                 private_rate: float, burst: int, max_retries: int):
+        self.group_rate = group_rate
+        self.private_rate = private_rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self._global_bucket = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        # (chat_id, message_id, endpoint) -> newest queued edit request
+        self._queued_edits = {}
+        self._flush_tasks = {}
+
+    async def initialize(self):
+        """Nothing to set up."""
+
+    async def shutdown(self):
+        """Send the edits still queued."""
+        await asyncio.gather(
+            *self._flush_tasks.values(), return_exceptions=True)
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= MAX_IDLE_BUCKETS:
+                self._chat_buckets = {
+                    key: other for key, other in self._chat_buckets.items()
+                    if not other.idle()
+                }
+            # Group and channel IDs are negative
+            rate = self.group_rate if chat_id < 0 else self.private_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                rate, self.burst)
+        return bucket
+
+    async def _send(self, callback, args, kwargs, endpoint, chat_id,
+                    holds_chat_token=False):
+        chat_bucket = None
+        if isinstance(chat_id, int):
+            chat_bucket = self._chat_bucket(chat_id)
+        for attempt in range(self.max_retries + 1):
+            if chat_bucket is not None and not holds_chat_token:
+                await chat_bucket.acquire()
+            holds_chat_token = False
+            await self._global_bucket.acquire()
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as exc:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(
+                    "%s to chat %s hit the flood limit, retrying in %ss",
+                    endpoint, chat_id, exc.retry_after)
+                (chat_bucket or self._global_bucket).pause(
+                    float(exc.retry_after))
+
+    async def _flush_edits(self, key):
+        chat_id = key[0]
+        chat_bucket = self._chat_bucket(chat_id)
+        try:
+            while key in self._queued_edits:
+                # Wait for the chat's turn first, so edits queued meanwhile
+                # replace this one instead of being sent after it
+                await chat_bucket.acquire()
+                callback, args, kwargs, endpoint = self._queued_edits.pop(key)
+                try:
+                    await self._send(callback, args, kwargs, endpoint,
+                                     chat_id, holds_chat_token=True)
+                except Exception:
+                    logger.exception(
+                        "Queued %s to chat %s failed", endpoint, chat_id)
+        finally:
+            del self._flush_tasks[key]
+
+    async def process_request(self, callback, args, kwargs, endpoint, data,
+                              rate_limit_args):
+        chat_id = data.get("chat_id")
+        message_id = data.get("message_id")
+        if (
+            rate_limit_args and rate_limit_args.get("coalesce")
+            and endpoint.startswith("editMessage")
+            and isinstance(chat_id, int) and message_id is not None
+        ):
+            key = (chat_id, message_id, endpoint)
+            self._queued_edits[key] = (callback, args, kwargs, endpoint)
+            if key not in self._flush_tasks:
+                self._flush_tasks[key] = asyncio.create_task(
+                    self._flush_edits(key))
+                # Let it take its place in the chat's queue, ahead of the
+                # requests the caller makes next
+                await asyncio.sleep(0)
+            return True
+
+        return await self._send(callback, args, kwargs, endpoint, chat_id)
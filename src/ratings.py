@@ -0,0 +1,288 @@
+"""
+Elo ratings of the players of each chat.
+
+Every game moves its winner's rating up and its loser's down by the same
+amount, more for an upset than for an expected result. A rating depends
+on every game before it, in order, so the ratings can only be computed
+one game after another. Games are rated in the order they were recorded
+(by ID), whatever date they were recorded for.
+
+``player_ratings`` holds every player's current rating. Recording games
+rates them from the current ratings, in the same transaction. Every
+ELO_CHECKPOINT_INTERVAL games of a chat, the chat's ratings are also
+copied to ``rating_checkpoints``. Deleting a game replays the chat's games
+from the last checkpoint before it, so a deletion costs the games
+recorded since that checkpoint rather than the chat's whole history.
+
+Recompute the ratings from the games table with:
+
+    python -m src.ratings rebuild [--chat-id ID]
+"""
+import argparse
+import sys
+
+from sqlalchemy import delete, distinct, func, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src import config
+from src.models import Game, PlayerRating, RatingCheckpoint
+
+# Games read at a time when replaying a chat
+REPLAY_BATCH_SIZE = 10_000
+
+
+class Ratings:
+    """
+    A chat's ratings while its games are rated.
+
+    Attributes:
+        ratings: player_id -> rating
+        games: player_id -> games rated
+        total: Games rated
+        checkpoints: (game_id, {player_id: (rating, games)}) taken after
+            every ELO_CHECKPOINT_INTERVAL-th game rated here
+    """
+
+    def __init__(self, rows=()):
+        """
+        Args:
+            rows: (player_id, rating, games) to start from
+        """
+        self.ratings = {}
+        self.games = {}
+        for player_id, rating, games in rows:
+            self.ratings[player_id] = rating
+            self.games[player_id] = games
+        # Each game counts for two players
+        self.total = sum(self.games.values()) // 2
+        self.checkpoints = []
+
+    def rate(self, results):
+        """
+        Rate games one after another.
+
+        Args:
+            results: (game_id, winner_id, loser_id) of each game, in order
+        """
+        # Locals keep the loop fast enough for a million games
+        ratings = self.ratings
+        games = self.games
+        initial = config.ELO_INITIAL_RATING
+        k_factor = config.ELO_K_FACTOR
+        interval = config.ELO_CHECKPOINT_INTERVAL
+        total = self.total
+        for game_id, winner_id, loser_id in results:
+            winner = ratings.get(winner_id, initial)
+            loser = ratings.get(loser_id, initial)
+            # K times the loser's expected score, which is what the winner
+            # gains over its own expected score
+            change = k_factor / (1 + 10 ** ((winner - loser) / 400))
+            ratings[winner_id] = winner + change
+            ratings[loser_id] = loser - change
+            games[winner_id] = games.get(winner_id, 0) + 1
+            games[loser_id] = games.get(loser_id, 0) + 1
+            total += 1
+            if total % interval == 0:
+                self.checkpoints.append((game_id, {
+                    player_id: (rating, games[player_id])
+                    for player_id, rating in ratings.items()
+                }))
+        self.total = total
+
+    def rating_rows(self, chat_id, player_ids=None):
+        """player_ratings rows of the players, or of everyone."""
+        if player_ids is None:
+            player_ids = self.ratings
+        return [
+            {"chat_id": chat_id, "player_id": player_id,
+             "rating": self.ratings[player_id],
+             "games": self.games[player_id]}
+            for player_id in player_ids
+        ]
+
+    def checkpoint_rows(self, chat_id):
+        """rating_checkpoints rows of the checkpoints taken."""
+        return [
+            {"chat_id": chat_id, "game_id": game_id, "player_id": player_id,
+             "rating": rating, "games": games}
+            for game_id, snapshot in self.checkpoints
+            for player_id, (rating, games) in snapshot.items()
+        ]
+
+
+def _upsert_statement(dialect_name, rows):
+    """INSERT rows, replacing the rating of the existing ones."""
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(PlayerRating).values(rows)
+    else:
+        stmt = sqlite.insert(PlayerRating).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=["chat_id", "player_id"],
+        set_={"rating": stmt.excluded.rating, "games": stmt.excluded.games},
+    )
+
+
+def _chat_games(chat_id, after_id=None):
+    """A chat's live games in the order they are rated."""
+    conditions = [Game.chat_id == chat_id, Game.deleted_at.is_(None)]
+    if after_id is not None:
+        conditions.append(Game.id > after_id)
+    return select(
+        Game.id, Game.winner_id, Game.loser_id
+    ).where(
+        *conditions
+    ).order_by(
+        Game.id
+    ).execution_options(yield_per=REPLAY_BATCH_SIZE)
+
+
+async def add_games_to_ratings(session, chat_id: int, games):
+    """
+    Rate newly inserted games of a chat.
+
+    Call it in the transaction that inserts the games.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat the games were played in
+        games: Games (or rows with id, winner_id and loser_id)
+    """
+    games = sorted(games, key=lambda game: game.id)
+    if not games:
+        return
+    # Locked on PostgreSQL, so replicas rating the same chat take turns
+    rows = (await session.execute(
+        select(PlayerRating.player_id, PlayerRating.rating,
+               PlayerRating.games)
+        .where(PlayerRating.chat_id == chat_id)
+        .with_for_update()
+    )).all()
+    if not rows and await session.scalar(
+            select(Game.id).where(
+                Game.chat_id == chat_id,
+                Game.deleted_at.is_(None),
+                Game.id < games[0].id,
+            ).limit(1)):
+        # The chat has games from before it had ratings
+        await replay_ratings(session, chat_id)
+        return
+
+    ratings = Ratings(rows)
+    ratings.rate(
+        (game.id, game.winner_id, game.loser_id) for game in games)
+    player_ids = {game.winner_id for game in games}
+    player_ids.update(game.loser_id for game in games)
+    await session.execute(_upsert_statement(
+        session.get_bind().dialect.name,
+        ratings.rating_rows(chat_id, player_ids)))
+    if ratings.checkpoints:
+        await session.execute(
+            insert(RatingCheckpoint), ratings.checkpoint_rows(chat_id))
+
+
+async def replay_ratings(session, chat_id: int, game_id: int | None = None):
+    """
+    Recompute a chat's ratings after one of its games was deleted.
+
+    The games are replayed from the last checkpoint before the game, and
+    the checkpoints after it are taken again. Call it in the transaction
+    that sets deleted_at on the game.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat the game was played in
+        game_id: The deleted game. None replays all of the chat's games.
+    """
+    stale = delete(RatingCheckpoint).where(
+        RatingCheckpoint.chat_id == chat_id)
+    if game_id is not None:
+        stale = stale.where(RatingCheckpoint.game_id >= game_id)
+    await session.execute(stale)
+
+    checkpoint_id = None
+    if game_id is not None:
+        checkpoint_id = await session.scalar(
+            select(func.max(RatingCheckpoint.game_id))
+            .where(RatingCheckpoint.chat_id == chat_id))
+    rows = ()
+    if checkpoint_id is not None:
+        rows = (await session.execute(
+            select(RatingCheckpoint.player_id, RatingCheckpoint.rating,
+                   RatingCheckpoint.games)
+            .where(RatingCheckpoint.chat_id == chat_id,
+                   RatingCheckpoint.game_id == checkpoint_id)
+        )).all()
+    ratings = Ratings(rows)
+
+    # Core rows through the connection, without the ORM's result handling
+    connection = await session.connection()
+    result = await connection.stream(_chat_games(chat_id, checkpoint_id))
+    async for partition in result.partitions():
+        ratings.rate(partition)
+
+    await session.execute(
+        delete(PlayerRating).where(PlayerRating.chat_id == chat_id))
+    if ratings.ratings:
+        await session.execute(
+            insert(PlayerRating), ratings.rating_rows(chat_id))
+    if ratings.checkpoints:
+        await session.execute(
+            insert(RatingCheckpoint), ratings.checkpoint_rows(chat_id))
+
+
+def rebuild_ratings(session, chat_id=None):
+    """
+    Recompute the ratings tables from the games table.
+
+    Each chat's games are read in batches of REPLAY_BATCH_SIZE from the
+    ix_games_chat_id_id index and rated in one pass, then its ratings and
+    checkpoints are written in bulk.
+
+    Args:
+        session: SQLAlchemy session
+        chat_id: Only rebuild this chat, if given
+    """
+    for model in (PlayerRating, RatingCheckpoint):
+        stmt = delete(model)
+        if chat_id is not None:
+            stmt = stmt.where(model.chat_id == chat_id)
+        session.execute(stmt)
+
+    if chat_id is None:
+        chat_ids = session.scalars(select(distinct(Game.chat_id)).where(
+            Game.deleted_at.is_(None))).all()
+    else:
+        chat_ids = [chat_id]
+    # Core rows through the connection, without the ORM's result handling
+    connection = session.connection()
+    for chat in chat_ids:
+        ratings = Ratings()
+        for partition in connection.execute(_chat_games(chat)).partitions():
+            ratings.rate(partition)
+        if ratings.ratings:
+            session.execute(insert(PlayerRating), ratings.rating_rows(chat))
+        if ratings.checkpoints:
+            session.execute(
+                insert(RatingCheckpoint), ratings.checkpoint_rows(chat))
+    session.commit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.ratings",
+        description="Recompute the Elo ratings from the games table.")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--chat-id", type=int, default=None,
+                        help="Only process this chat")
+    args = parser.parse_args(argv)
+
+    from src.db import SessionLocal
+
+    with SessionLocal() as session:
+        rebuild_ratings(session, args.chat_id)
+    print("Player ratings rebuilt.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
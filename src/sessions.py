@@ -0,0 +1,97 @@
+"""
+Live game sessions: a game night recorded with buttons instead of a
+/played message per game.
+
+The chat picks each game's winner, then its loser, from a roster of the
+chat's players (get_chat_roster, cached), and the games are kept in the
+chat's chat_data until the session ends, so picking runs no database
+query. Ending the session records every game in one transaction.
+chat_data is persisted (see src/persistence.py), so a restart doesn't
+lose a running session.
+"""
+from datetime import date
+
+from src import templates
+from src.functions import record_games
+
+# Where the running session is kept in chat_data
+SESSION_KEY = "game_session"
+# Games listed in the session message, and in the summary when it ends.
+# Telegram messages are limited to 4096 characters.
+SHOWN_GAMES = 10
+SUMMARY_GAMES = 50
+
+
+def new_session() -> dict:
+    """
+    A session without games.
+
+    "games" holds a dict per game with the players' IDs and names and the
+    ISO date it was played on; "winner_id" the winner picked for the
+    current game, if any.
+    """
+    return {"games": [], "winner_id": None}
+
+
+def session_text(game_session, roster) -> str:
+    """The session message: the latest games, and what to pick next."""
+    games = game_session["games"]
+    if games:
+        shown = games[-SHOWN_GAMES:]
+        first_index = len(games) - len(shown) + 1
+        lines = "".join(
+            templates.SESSION_GAME_LINE.format(
+                index=index, winner=game["winner"], loser=game["loser"])
+            for index, game in enumerate(shown, first_index))
+        if first_index > 1:
+            lines = templates.SESSION_EARLIER_GAMES.format(
+                count=first_index - 1) + lines
+    else:
+        lines = templates.SESSION_NO_GAMES
+    winner_id = game_session["winner_id"]
+    if winner_id is None:
+        prompt = templates.SESSION_CHOOSE_WINNER
+    else:
+        prompt = templates.SESSION_CHOOSE_LOSER.format(
+            winner=dict(roster).get(winner_id, "?"))
+    return templates.SESSION_TEXT.format(games=lines, prompt=prompt)
+
+
+def summary_text(game_session, recorded) -> str:
+    """The message of an ended session, with the IDs of its games."""
+    if not recorded:
+        return templates.SESSION_ENDED_NO_GAMES_TEXT
+    text = templates.SESSION_ENDED_HEADER.format(count=len(recorded))
+    for index, (game, saved) in enumerate(
+            zip(game_session["games"][:SUMMARY_GAMES], recorded), 1):
+        text += templates.SESSION_ENDED_GAME_LINE.format(
+            index=index, game_id=saved.id, winner=game["winner"],
+            loser=game["loser"])
+    if len(recorded) > SUMMARY_GAMES:
+        text += templates.SESSION_ENDED_MORE.format(
+            count=len(recorded) - SUMMARY_GAMES)
+    return text
+
+
+async def save_session(session, chat_id: int, game_session):
+    """
+    Record the session's games, without committing.
+
+    Args:
+        session: SQLAlchemy async session
+        chat_id: Chat the session was played in
+        game_session: The session from chat_data
+
+    Returns:
+        The recorded games, in the order they were played
+    """
+    # Dates only grow during a session, so grouping by date keeps the order
+    results_by_date = {}
+    for game in game_session["games"]:
+        results_by_date.setdefault(game["date"], []).append(
+            (game["winner_id"], game["loser_id"]))
+    recorded = []
+    for game_date, results in results_by_date.items():
+        recorded += await record_games(
+            session, chat_id, date.fromisoformat(game_date), results)
+    return recorded
@@ -0,0 +1,195 @@
+"""
+Multi-process mode: a dispatcher in front of N bot worker processes.
+
+The dispatcher is the only process talking to Telegram for updates
+(polling or webhook). It hands each update to the worker that owns its
+chat, picked by chat_id modulo the number of workers. Every worker runs
+the full bot application from app_factory, with its own handlers,
+ranking cache and connection pool, and replies to Telegram directly.
+
+A chat always lands on the same worker, in the order its updates
+arrived, so the per-chat ordering of ChatOrderedUpdateProcessor and the
+cache invalidation in src/cache.py keep working unchanged. user_data is
+per worker, so a user's data is only shared between chats of the same
+worker.
+
+The workers share the database, so use PostgreSQL, or SQLite in WAL
+mode (the default), with more than one worker.
+"""
+import asyncio
+import multiprocessing
+import signal
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+
+from src import config
+from src.logging_config import listen_to, log_to, logger
+from src.metrics import metrics
+from src.update_processor import chat_key
+
+# Seconds to wait for the workers to start and to finish their updates
+WORKER_START_TIMEOUT = 60
+WORKER_STOP_TIMEOUT = 30
+
+
+def shard_for(key: int, workers: int) -> int:
+    """The worker that owns a chat (or user) ID."""
+    # Python's % is never negative, group chat IDs are
+    return key % workers
+
+
+def run_worker(index, queue, ready, app_factory, log_queue):
+    """
+    Entry point of a worker process.
+
+    Builds the bot application with app_factory and processes the updates
+    the dispatcher puts on queue until it receives None. Log records go
+    to the dispatcher through log_queue.
+    """
+    log_to(log_queue)
+    # Each worker serves its metrics on its own port
+    metrics.worker = index
+    # Ctrl+C reaches the whole process group; the dispatcher stops the
+    # workers itself once its own updates are handed over
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    asyncio.run(_serve_shard(index, queue, ready, app_factory()))
+
+
+async def _serve_shard(index, queue, ready, app):
+    # Runs the application like run_polling does, hooks included
+    loop = asyncio.get_running_loop()
+    async with app:
+        if app.post_init:
+            await app.post_init(app)
+        await app.start()
+        ready.set()
+        logger.info("Worker %d started", index)
+        try:
+            while True:
+                data = await loop.run_in_executor(None, queue.get)
+                if data is None:
+                    break
+                try:
+                    update = Update.de_json(data, app.bot)
+                except Exception:
+                    logger.exception("Worker %d dropped an unreadable update",
+                                     index)
+                    continue
+                await app.update_queue.put(update)
+            # Let the updates already handed to the application finish
+            await app.update_queue.join()
+        finally:
+            await app.stop()
+            if app.post_stop:
+                await app.post_stop(app)
+    if app.post_shutdown:
+        await app.post_shutdown(app)
+    logger.info("Worker %d stopped", index)
+
+
+class ShardDispatcher:
+    """
+    Starts the worker processes and routes updates to them.
+
+    Args:
+        workers: Number of worker processes
+        app_factory: Picklable callable returning the application a worker
+            runs, e.g. src.bot.app_factory
+    """
+
+    def __init__(self, workers: int, app_factory):
+        self.workers = workers
+        self.app_factory = app_factory
+        # Workers are spawned rather than forked, so they don't inherit
+        # the dispatcher's event loop and open connections
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._context.Queue() for _ in range(workers)]
+        self._processes = [None] * workers
+        self._log_queue = self._context.Queue()
+        self._log_listener = None
+
+    def _start_worker(self, index):
+        ready = self._context.Event()
+        process = self._context.Process(
+            target=run_worker,
+            args=(index, self._queues[index], ready, self.app_factory,
+                  self._log_queue),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+        self._processes[index] = process
+        return ready
+
+    def start(self):
+        """Start every worker and wait until they accept updates."""
+        self._log_listener = listen_to(self._log_queue)
+        for ready in [self._start_worker(i) for i in range(self.workers)]:
+            if not ready.wait(WORKER_START_TIMEOUT):
+                self.stop()
+                raise RuntimeError("A bot worker failed to start.")
+        logger.info("Started %d bot workers", self.workers)
+
+    def route(self, update: Update):
+        """Queue an update on the worker that owns its chat."""
+        key = chat_key(update)
+        # Updates without a chat have no order to keep, spread them out
+        if key is None:
+            key = update.update_id
+        index = shard_for(key, self.workers)
+        if not self._processes[index].is_alive():
+            logger.error(
+                "Bot worker %d exited with code %s, restarting it",
+                index, self._processes[index].exitcode)
+            self._start_worker(index)
+        self._queues[index].put(update.to_dict())
+
+    def stop(self):
+        """Let the workers finish their queued updates, then stop them."""
+        for index, process in enumerate(self._processes):
+            if process is not None and process.is_alive():
+                self._queues[index].put(None)
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(WORKER_STOP_TIMEOUT)
+            if process.is_alive():
+                logger.warning("Terminating unresponsive %s", process.name)
+                process.terminate()
+                process.join()
+        logger.info("Stopped %d bot workers", self.workers)
+        if self._log_listener is not None:
+            self._log_listener.stop()
+            self._log_listener = None
+
+
+def dispatcher_app_factory(app_factory, workers=config.WORKERS, token=None):
+    """
+    Create the front application of the multi-process mode.
+
+    It receives updates like the single-process bot (run_polling or
+    run_webhook) but only routes them to the workers, which it starts
+    and stops with itself.
+    """
+    dispatcher = ShardDispatcher(workers, app_factory)
+
+    async def post_init(app):
+        await asyncio.to_thread(dispatcher.start)
+
+    async def post_shutdown(app):
+        await asyncio.to_thread(dispatcher.stop)
+
+    async def route(update, context):
+        dispatcher.route(update)
+
+    app = (
+        ApplicationBuilder()
+        .token(token or config.BOT_TOKEN)
+        .base_url(f"{config.TELEGRAM_API_URL}/bot")
+        .base_file_url(f"{config.TELEGRAM_API_URL}/file/bot")
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
+    app.add_handler(TypeHandler(Update, route))
+    return app
@@ -0,0 +1,242 @@
+"""
+Materialized per-chat standings.
+
+``player_chat_stats`` and ``player_daily_stats`` hold the wins and losses
+of every player in a chat, all-time and per day. They are updated in the
+same transaction that inserts or soft-deletes games, so rankings read a
+few rows per player instead of aggregating the whole games table.
+
+Backfill or verify them from the games table with:
+
+    python -m src.stats rebuild [--chat-id ID]
+    python -m src.stats check [--chat-id ID]
+"""
+import argparse
+import sys
+from collections import defaultdict
+
+from sqlalchemy import delete, func, insert, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from src.models import Game, PlayerChatStats, PlayerDailyStats
+
+
+def _upsert_statement(dialect_name, model, rows):
+    """INSERT rows, adding wins/losses onto the existing row on conflict."""
+    if dialect_name == "postgresql":
+        stmt = postgresql.insert(model).values(rows)
+    else:
+        stmt = sqlite.insert(model).values(rows)
+    return stmt.on_conflict_do_update(
+        index_elements=[c.name for c in model.__table__.primary_key],
+        set_={
+            "wins": model.wins + stmt.excluded.wins,
+            "losses": model.losses + stmt.excluded.losses,
+        }
+    )
+
+
+def _stats_rows(games, sign):
+    """Fold games into per-chat and per-day win/loss deltas."""
+    chat_deltas = defaultdict(lambda: [0, 0])
+    daily_deltas = defaultdict(lambda: [0, 0])
+    for game in games:
+        chat_deltas[(game.chat_id, game.winner_id)][0] += sign
+        chat_deltas[(game.chat_id, game.loser_id)][1] += sign
+        if game.date is not None:
+            daily_deltas[(game.chat_id, game.date, game.winner_id)][0] += sign
+            daily_deltas[(game.chat_id, game.date, game.loser_id)][1] += sign
+
+    chat_rows = [
+        {"chat_id": chat_id, "player_id": player_id,
+         "wins": wins, "losses": losses}
+        for (chat_id, player_id), (wins, losses) in chat_deltas.items()
+    ]
+    daily_rows = [
+        {"chat_id": chat_id, "date": date, "player_id": player_id,
+         "wins": wins, "losses": losses}
+        for (chat_id, date, player_id), (wins, losses)
+        in daily_deltas.items()
+    ]
+    return chat_rows, daily_rows
+
+
+async def _apply_games(session, games, sign):
+    chat_rows, daily_rows = _stats_rows(games, sign)
+    dialect_name = session.get_bind().dialect.name
+    if chat_rows:
+        await session.execute(
+            _upsert_statement(dialect_name, PlayerChatStats, chat_rows))
+    if daily_rows:
+        await session.execute(
+            _upsert_statement(dialect_name, PlayerDailyStats, daily_rows))
+
+
+async def add_games_to_stats(session, games):
+    """
+    Count newly inserted games in the standings tables.
+
+    Call it in the transaction that inserts the games.
+
+    Args:
+        session: SQLAlchemy async session
+        games: Games (or rows with chat_id, date, winner_id and loser_id)
+    """
+    await _apply_games(session, games, 1)
+
+
+async def remove_games_from_stats(session, games):
+    """
+    Take soft-deleted games out of the standings tables.
+
+    Call it in the transaction that sets deleted_at on the games.
+
+    Args:
+        session: SQLAlchemy async session
+        games: Games (or rows with chat_id, date, winner_id and loser_id)
+    """
+    await _apply_games(session, games, -1)
+
+
+def game_results(chat_id=None):
+    """
+    One row per player per non-deleted game, with 1/0 wins and losses.
+
+    Args:
+        chat_id: Restrict to a single chat, if given
+
+    Returns:
+        Subquery with chat_id, date, player_id, wins and losses columns
+    """
+    conditions = [Game.deleted_at.is_(None)]
+    if chat_id is not None:
+        conditions.append(Game.chat_id == chat_id)
+    wins = select(
+        Game.chat_id, Game.date, Game.winner_id.label("player_id"),
+        literal(1).label("wins"), literal(0).label("losses")
+    ).where(*conditions)
+    losses = select(
+        Game.chat_id, Game.date, Game.loser_id.label("player_id"),
+        literal(0).label("wins"), literal(1).label("losses")
+    ).where(*conditions)
+    return union_all(wins, losses).subquery("results")
+
+
+def _expected_chat_stats(chat_id=None):
+    results = game_results(chat_id)
+    return select(
+        results.c.chat_id, results.c.player_id,
+        func.sum(results.c.wins), func.sum(results.c.losses)
+    ).group_by(results.c.chat_id, results.c.player_id)
+
+
+def _expected_daily_stats(chat_id=None):
+    results = game_results(chat_id)
+    return select(
+        results.c.chat_id, results.c.date, results.c.player_id,
+        func.sum(results.c.wins), func.sum(results.c.losses)
+    ).where(
+        results.c.date.is_not(None)
+    ).group_by(results.c.chat_id, results.c.date, results.c.player_id)
+
+
+def rebuild_stats(session, chat_id=None):
+    """
+    Recompute the standings tables from the games table.
+
+    Args:
+        session: SQLAlchemy session
+        chat_id: Only rebuild this chat, if given
+    """
+    for model in (PlayerChatStats, PlayerDailyStats):
+        stmt = delete(model)
+        if chat_id is not None:
+            stmt = stmt.where(model.chat_id == chat_id)
+        session.execute(stmt)
+
+    session.execute(insert(PlayerChatStats).from_select(
+        ["chat_id", "player_id", "wins", "losses"],
+        _expected_chat_stats(chat_id)
+    ))
+    session.execute(insert(PlayerDailyStats).from_select(
+        ["chat_id", "date", "player_id", "wins", "losses"],
+        _expected_daily_stats(chat_id)
+    ))
+    session.commit()
+
+
+def _diff(expected_rows, actual_rows):
+    expected = {tuple(row[:-2]): tuple(row[-2:]) for row in expected_rows}
+    actual = {
+        tuple(row[:-2]): tuple(row[-2:]) for row in actual_rows
+        # Rows whose games were all deleted are left at zero
+        if tuple(row[-2:]) != (0, 0)
+    }
+    return [
+        (key, expected.get(key, (0, 0)), actual.get(key, (0, 0)))
+        for key in sorted(expected.keys() | actual.keys(), key=str)
+        if expected.get(key) != actual.get(key)
+    ]
+
+
+def check_stats(session, chat_id=None):
+    """
+    Compare the standings tables against the games table.
+
+    Args:
+        session: SQLAlchemy session
+        chat_id: Only check this chat, if given
+
+    Returns:
+        List of (table, key, expected (wins, losses), actual (wins, losses))
+        for every row that doesn't match
+    """
+    mismatches = []
+    for model, expected_query, key_columns in (
+        (PlayerChatStats, _expected_chat_stats(chat_id),
+         (PlayerChatStats.chat_id, PlayerChatStats.player_id)),
+        (PlayerDailyStats, _expected_daily_stats(chat_id),
+         (PlayerDailyStats.chat_id, PlayerDailyStats.date,
+          PlayerDailyStats.player_id)),
+    ):
+        actual_query = select(*key_columns, model.wins, model.losses)
+        if chat_id is not None:
+            actual_query = actual_query.where(model.chat_id == chat_id)
+        for key, expected, actual in _diff(
+            session.execute(expected_query).all(),
+            session.execute(actual_query).all()
+        ):
+            mismatches.append((model.__tablename__, key, expected, actual))
+    return mismatches
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m src.stats",
+        description="Rebuild or check the materialized player stats.")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    parser.add_argument("--chat-id", type=int, default=None,
+                        help="Only process this chat")
+    args = parser.parse_args(argv)
+
+    from src.db import SessionLocal
+
+    with SessionLocal() as session:
+        if args.command == "rebuild":
+            rebuild_stats(session, args.chat_id)
+            print("Player stats rebuilt.")
+            return 0
+
+        mismatches = check_stats(session, args.chat_id)
+        for table, key, expected, actual in mismatches:
+            print(f"{table} {key}: expected {expected}, found {actual}")
+        if mismatches:
+            print(f"{len(mismatches)} mismatched rows. "
+                  "Run `python -m src.stats rebuild` to fix them.")
+            return 1
+        print("Player stats are consistent with the games table.")
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,10 @@
+# Emoji are written out as characters. Handlers send these as is, and fill
+# the {placeholders} with str.format.
+
 HELP_MESSAGE = (
-    "<b>:book: How to Use the Game Manager Bot:</b>\n\n"
+    "<b>📖 How to Use the Game Manager Bot:</b>\n\n"
     "Each player <b>must</b> register using Add Me button before recording a game.\n\n"
-    "<b>:video_game: To record a game:</b>\n"
+    "<b>🎮 To record a game:</b>\n"
     "<code>/played\n"
     "@winner1 @loser1\n"
     "@winner2 @loser2\n"
@@ -15,23 +18,181 @@ HELP_MESSAGE = (
     "date=2025-07-13</code>\n\n"
     "To see the games history, use\n<code>/games [date=yyyy-mm-dd]</code>.\n"
     "<i>Date is optional - defaults to today.</i>\n\n"
-    "<b>:gear: See the Main Menu:</b> <code>/menu</code>\n\n"
-    "<b>:trophy: To see the rankings:</b>\n"
-    "Send <code>/rank</code> or use the Rankings button in the main menu.\n\n"
-    "<b>:wastebasket: To delete a game:</b>\n"
+    "<b>⚙️ See the Main Menu:</b> <code>/menu</code>\n\n"
+    "<b>🏆 To see the rankings:</b>\n"
+    "Send <code>/rank</code> or use the Rankings button in the main menu.\n"
+    "<code>/rank week</code>, <code>/rank month</code> or "
+    "<code>/rank yyyy-mm-dd..yyyy-mm-dd</code> rank a period, "
+    "<code>/rank elo</code> ranks by Elo rating.\n\n"
+    "<b>🎮 To record a game night:</b>\n"
+    "Use Start Session in the main menu and pick each game's winner and "
+    "loser with the buttons. The games are saved when you end the "
+    "session.\n\n"
+    "<b>🗑️ To delete a game:</b>\n"
     "Use the delete button in the success message after recording a game, "
     "or send <code>/delete_game &lt;id&gt;</code>.\n\n"
-    "<b>:bust_in_silhouette: To register:</b>\n"
+    "<b>👤 To register:</b>\n"
     "Use the Add Me button in the main menu or send <code>/add_me</code>."
     "\n\n"
-    "<b>:man_technologist: Developer:</b> "
+    "<b>👨‍💻 Developer:</b> "
     "<a href='http://www.pouria.site/'>Pouria Forghani</a>"
 )
 
 START_MESSAGE = (
-    ":wave: <b>Welcome to the Game Manager Bot!</b>\n\n"
+    "👋 <b>Welcome to the Game Manager Bot!</b>\n\n"
     "Track your group's daily games, wins, and rankings — all "
     "automatically.\n\n"
     "Type /menu to see the menu.\n"
     "Type /help to learn how to use the bot."
 )
+
+MENU_TEXT = (
+    "🎲 <b>Game Manager Menu</b>\n\n"
+    "Choose an option from the menu below OR use\n"
+    "<code>/played [date=yyyy-mm-dd]</code> to record a game;\n"
+    "<code>/games [date=yyyy-mm-dd]</code> to see the games history."
+)
+
+RANKINGS_MENU_TEXT = (
+    "🏆 <b>Rankings Options</b>\n\n"
+    "Choose which rankings you want to view:"
+)
+
+ENTER_DATE_TEXT = (
+    "📅 <b>Enter Date</b>\n\n"
+    "Please enter a date in the format YYYY-MM-DD "
+    "(e.g., 2024-01-15):"
+)
+
+INVALID_DATE_INPUT_TEXT = (
+    "⚠️ <b>Invalid Date Format</b>\n\n"
+    "Please enter a date in YYYY-MM-DD format "
+    "(e.g., 2024-01-15):"
+)
+
+REGISTRATION_COMPLETE_TEXT = (
+    "<b>✅ Registration Complete</b>\n\n"
+    "Your information has been added/updated successfully!"
+)
+
+ERROR_REPLY_TEXT = (
+    "⚠️ Something went wrong. "
+    "The developers have been notified."
+)
+
+# Developer error reports
+ERROR_ALERT_TEXT = (
+    "🚨 <b>Error in Game Manager Bot</b>\n"
+    "<b>User:</b> {user_id}\n"
+    "<b>Chat:</b> {chat_id}\n"
+    "<b>Error:</b> <code>{error_type}</code> at <code>{location}</code>\n"
+    "<code>{detail}</code>\n"
+    "<i>Repeats are counted in the next digest.</i>"
+)
+ERROR_DIGEST_HEADER = (
+    "🚨 <b>Error digest, last {minutes} min</b>\n"
+    "<b>Errors:</b> {count}, <b>distinct:</b> {kinds}\n"
+)
+ERROR_DIGEST_LINE = (
+    "<b>{count}×</b> <code>{error_type}</code> at <code>{location}</code>\n"
+    "<code>{detail}</code>\n"
+    "<b>Chats:</b> {chats}\n"
+)
+ERROR_DIGEST_MORE = "…and {kinds} more kinds, see the logs."
+
+# Developer metrics
+METRICS_HEADER = "📊 <b>Handler latency</b>\n"
+METRICS_LINE = (
+    "<b>{name}</b>: {count} calls, p50 {p50:.0f} ms, p99 {p99:.0f} ms, "
+    "{queries:.1f} queries/call, {errors} errors"
+)
+NO_METRICS_TEXT = "No handler has run yet."
+
+# Rankings
+ALL_TIME_CHAMPIONS_HEADER = (
+    "🏆 <b>All-Time Champions Are Here!</b> ✨\n\n")
+DATE_CHAMPIONS_HEADER = (
+    "🏆 <b>{date} Champions Are Here!</b> ✨\n\n")
+RANGE_CHAMPIONS_HEADER = (
+    "🏆 <b>{start} to {end} Champions Are Here!</b> ✨\n\n")
+ELO_CHAMPIONS_HEADER = (
+    "🏆 <b>Elo Champions Are Here!</b> ✨\n\n")
+CHAMPIONS_FOOTER = (
+    "\n\n🚀 <b>Let's keep the games rolling!</b>")
+ALL_TIME_RANKINGS_HEADER = (
+    "📈 <b>All-Time Rankings</b>\n\n")
+DATE_RANKINGS_HEADER = (
+    "📆 <b>Rankings for {date}</b>\n\n")
+NO_GAMES_ON_DATE_RANKINGS_TEXT = DATE_RANKINGS_HEADER + (
+    "No games played on this date in this chat.")
+RANGE_RANKINGS_HEADER = (
+    "📆 <b>Rankings for {start} to {end}</b>\n\n")
+NO_GAMES_IN_RANGE_RANKINGS_TEXT = RANGE_RANKINGS_HEADER + (
+    "No games played on these dates in this chat.")
+ELO_RANKINGS_HEADER = (
+    "🎯 <b>Elo Ratings</b>\n\n")
+NO_GAMES_YET_TEXT = (
+    "⛔ No games played yet in this chat.")
+NO_GAMES_ALL_TIME_TEXT = (
+    "⛔ No games have been played yet in this chat.")
+MEDALS = {
+    1: "🥇 ",
+    2: "🥈 ",
+    3: "🥉 ",
+}
+
+# Games
+GAMES_HISTORY_HEADER = "Games played on {date}:\n\n"
+NO_GAMES_ON_DATE_TEXT = (
+    "⛔ No games played on this date in this chat.")
+DELETE_GAME_BUTTON = "🗑️ Delete Game {game_id}"
+GAME_DELETED_TEXT = "🗑️ Game {game_id} deleted."
+GAME_NOT_FOUND_TEXT = "❌ Game ID {game_id} not found."
+GAME_NOT_FOUND_OR_DELETED_TEXT = (
+    "❌ Game ID {game_id} not found or already deleted.")
+MISSING_GAME_ID_TEXT = "❌ Please provide a game ID."
+INVALID_GAME_ID_TEXT = "❌ Invalid game ID."
+
+# Game sessions
+SESSION_TEXT = "🎮 <b>Game Session</b>\n\n{games}\n{prompt}"
+SESSION_GAME_LINE = "{index}. <b>{winner}</b> won <b>{loser}</b>\n"
+SESSION_EARLIER_GAMES = "<i>…{count} earlier games</i>\n"
+SESSION_NO_GAMES = "No games played yet.\n"
+SESSION_CHOOSE_WINNER = "Choose the winner of the next game:"
+SESSION_CHOOSE_LOSER = "<b>{winner}</b> won against…\nChoose the loser:"
+SESSION_ENDED_HEADER = "⏹️ <b>Session Ended</b>\n\n{count} games recorded:\n"
+SESSION_ENDED_GAME_LINE = (
+    "<i>{index}</i>. Game ID <b>{game_id}:</b> <b>{winner}</b> won "
+    "<b>{loser}</b>\n")
+SESSION_ENDED_MORE = "<i>…and {count} more, see /games.</i>"
+SESSION_ENDED_NO_GAMES_TEXT = (
+    "⏹️ <b>Session Ended</b>\n\nNo games were played.")
+SESSION_ALREADY_RUNNING_TEXT = (
+    "⚠️ <b>Session Already Running</b>\n\n"
+    "A session is already active in this chat. "
+    "Please end the current session first.")
+NO_ACTIVE_SESSION_TEXT = (
+    "⚠️ <b>No Active Session</b>\n\n"
+    "There is no session running in this chat.")
+NO_SESSION_PLAYERS_TEXT = (
+    "⛔ No players in this chat yet. Record a first game with "
+    "<code>/played</code>, then start a session.")
+
+# Buttons
+RANKINGS_BUTTON = "🏆 Rankings"
+START_SESSION_BUTTON = "🎮 Start Session"
+END_SESSION_BUTTON = "⏹️ End Session"
+ADD_ME_BUTTON = "👤 Add Me"
+HELP_BUTTON = "❓ Help"
+TODAY_BUTTON = "📆 Today"
+WEEK_BUTTON = "🗓️ Last 7 Days"
+MONTH_BUTTON = "🗓️ Last 30 Days"
+CUSTOM_DATE_BUTTON = "📅 Custom Date"
+ALL_TIME_BUTTON = "📈 All Time"
+ELO_BUTTON = "🎯 Elo Ratings"
+BACK_TO_MENU_BUTTON = "⬅️ Back to Menu"
+BACK_TO_RANKINGS_BUTTON = "⬅️ Back to Rankings"
+CANCEL_BUTTON = "❌ Cancel"
+UNDO_GAME_BUTTON = "↩️ Undo Last Game"
+PREVIOUS_PAGE_BUTTON = "⬅️ Previous"
+NEXT_PAGE_BUTTON = "Next ➡️"
@@ -0,0 +1,74 @@
+import asyncio
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+
+def chat_key(update: object):
+    """The chat an update belongs to, or None if it has none."""
+    if not isinstance(update, Update):
+        return None
+    if update.effective_chat:
+        return update.effective_chat.id
+    # e.g. inline queries; keep them ordered per user
+    if update.effective_user:
+        return update.effective_user.id
+    return None
+
+
+class ChatOrderedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates concurrently, but one at a time within each chat.
+
+    Updates from different chats run in parallel, up to
+    max_concurrent_updates at once. Updates from the same chat wait for
+    each other and run in the order they arrived, so a /played followed by
+    /rank in a group always sees the recorded games.
+
+    An update first waits for its chat and only then for one of the
+    max_concurrent_updates slots, so the queue of a busy chat holds one
+    slot rather than starving every other chat.
+    """
+
+    __slots__ = ("_chat_locks",)
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        # chat key -> [lock, number of updates holding or waiting for it]
+        self._chat_locks: dict[int, list] = {}
+
+    async def process_update(self, update, coroutine):
+        """
+        Run the update once its chat is free and a slot is available.
+
+        BaseUpdateProcessor.process_update (marked final) takes the slot
+        before do_process_update runs, which would make the updates
+        queued behind a busy chat hold slots while they wait.
+        """
+        key = chat_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        entry = self._chat_locks.get(key)
+        if entry is None:
+            entry = self._chat_locks[key] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters first come, first served, which
+            # keeps the arrival order within the chat
+            async with entry[0]:
+                await super().process_update(update, coroutine)
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._chat_locks[key]
+
+    async def do_process_update(self, update, coroutine):
+        await coroutine
+
+    async def initialize(self):
+        """Nothing to set up."""
+
+    async def shutdown(self):
+        """Nothing to clean up."""